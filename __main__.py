@@ -2,49 +2,47 @@ import os
 import sys
 import pathlib
 import re
-from typing import NamedTuple, Dict
-import enum
-
-from PySimpleGUI.PySimpleGUI import VerticalSeparator
 
 sys.path.append(os.path.join(os.path.dirname(__file__), './userlib'))
 
+if __name__ == "__main__" and len(sys.argv) > 1:
+	# 引数指定時はGUIを起動せずにCLIとして動作する
+	# (GUI/プラットフォーム依存のモジュールはGUI起動時だけ読み込む)
+	from pyHexTextFile import cli
+	sys.exit(cli.main())
+
+from PySimpleGUI.PySimpleGUI import VerticalSeparator
+
 import PySimpleGUI as sg
-from PySimpleGUIHelper import PySimpleGUIHelper as sg_helper
-from pyHexTextFile.intel_hex import intel_hex
-from pyHexTextFile.mot_s_record import mot_s_record
+from pyHexTextFile.hex_loader import load_job
+from pyHexTextFile.hex_job import hex_job, job_cancelled
+from pyHexTextFile.checksum_algorithm import checksum_algorithm_tbl
+from pyHexTextFile.checksum_preset import twos_compl_select, checksum_preset, preset_configs
+from pyHexTextFile.hex_text_file import checksum_config
+from pyHexTextFile.parse_cache import parse_cache
+from pyHexTextFile.bin_file import export_bin
+from pyHexTextFile.load_stats import load_stats
+from pyHexTextFile.hex_watch import hex_watch
 
 """
 グローバル変数
 """
 hex_file_info = None
+hex_file_watch = None
+hex_file_cache = parse_cache()
+# 実行中のジョブと完了時の処理
+running_job = None
+running_job_done = None
 checksum_blank = "FF"
 checksum_twos_compl = True
 
-class twos_compl_select(enum.Enum):
-	enable = enum.auto()
-	disable = enum.auto()
-	both = enum.auto()
-
-class checksum_preset_type(NamedTuple):
-	blank: int = 0xFF
-	twos_compl: twos_compl_select = twos_compl_select.enable
-	addr_begin: int = 0
-	addr_end: int = 0
-
-
-checksum_preset: Dict[str, checksum_preset_type] = {
-	"<default>": checksum_preset_type(None, twos_compl_select.enable, None, None),
-	"preset1": checksum_preset_type(0xFF, twos_compl_select.both, 0x00000000, 0x0000FFFF),
-	"preset2": checksum_preset_type(0xFF, twos_compl_select.enable, 0x00003000, 0x0007FFFF),
-}
-
 
 """
 GUIデータ作成
 """
 checksum_preset_list = [k for k in checksum_preset.keys()]
 checksum_preset_size = (30, len(checksum_preset_list))
+checksum_algorithm_list = [k for k in checksum_algorithm_tbl.keys()]
 
 font_log = ('Consolas', 10)
 font_wnd = ('Meiryo UI', 10)
@@ -57,7 +55,8 @@ layout_input = [
 	[
 		sg.Text('HEX File:'), sg.Input('', key='inp_hex_file'), sg.FileBrowse(),
 		sg.VerticalSeparator(),
-		sg.Button('Read', key='btn_hex_read', enable_events=True)
+		sg.Button('Read', key='btn_hex_read', enable_events=True),
+		sg.Checkbox('profile', key='chk_profile')
 	],
 ]
 layout_hex_file_info = [
@@ -86,12 +85,16 @@ layout_checksum_addr_range = [
 		sg.Input('', size=(10,1), key='inp_checksum_addr_end',)
 	],
 ]
+layout_checksum_algorithm = [
+	[sg.Combo(checksum_algorithm_list, default_value="byte_sum", size=(12, len(checksum_algorithm_list)), key='cmb_checksum_algorithm', readonly=True)],
+]
 layout_checksum = [
 	[
 		sg.Text('calc settings preset:'),
 		sg.Combo(checksum_preset_list, size=checksum_preset_size, key='cmb_checksum_preset', enable_events=True)
 	],
 	[
+		sg.Frame('アルゴリズム', layout_checksum_algorithm),
 		sg.Frame('Blank', layout_checksum_blank),
 		sg.Frame('2の補数', layout_checksum_twos_compl),
 		sg.Frame('計算範囲', layout_checksum_addr_range),
@@ -99,8 +102,11 @@ layout_checksum = [
 	[ sg.HorizontalSeparator() ],
 	[
 		sg.Button('calc', key='btn_checksum_calc', size=(15, 1)),
+		sg.Checkbox('watch', key='chk_watch'),
 		sg.Text(''),
-		sg.Input('', key='inp_checksum', size=(15, 1), readonly=True)
+		sg.Input('', key='inp_checksum', size=(20, 1), readonly=True),
+		sg.Button('calc all presets', key='btn_checksum_calc_presets', size=(15, 1)),
+		sg.Button('export bin', key='btn_export_bin', size=(15, 1)),
 	],
 ]
 
@@ -108,6 +114,10 @@ layout_window = [
 	[sg.Frame('Input File', layout_input)],
 	[sg.Frame('HEX File Info', layout_hex_file_info)],
 	[sg.Frame('checksum', layout_checksum)],
+	[
+		sg.ProgressBar(1000, orientation='h', size=(50, 15), key='prg_job'),
+		sg.Button('cancel', key='btn_job_cancel', disabled=True),
+	],
 	[sg.Output(size=(80, 5), font=font_log)]
 ]
 
@@ -119,28 +129,97 @@ def dad_inp_hex_file(dn: str):
 	window['inp_hex_file'].update(value=dn)
 
 
-adapt_dad_inp_hex_file = sg_helper.adapt_dad(window["inp_hex_file"], dad_inp_hex_file)
+if sys.platform == "win32":
+	# ドラッグ＆ドロップはWindows API(ctypes.windll)を使用するため、Windowsのときだけ読み込む
+	from PySimpleGUIHelper import PySimpleGUIHelper as sg_helper
+	adapt_dad_inp_hex_file = sg_helper.adapt_dad(window["inp_hex_file"], dad_inp_hex_file)
 
 
 
 """
 関数
 """
+def start_job(job: hex_job, done, error: str = None):
+	"""
+	ジョブをワーカースレッドで実行する
+	完了時はイベントループからdone(結果)を呼び出す
+	error: 失敗時のログ(Noneは例外の内容)
+	"""
+	global running_job
+	global running_job_done
+	if running_job is not None:
+		print('job is running!')
+		return
+	running_job = job
+	running_job_done = (done, error)
+	window['btn_job_cancel'].update(disabled=False)
+	window['prg_job'].update_bar(0)
+	job.future.add_done_callback(lambda future: window.write_event_value('job_done', None))
+	job.start()
+
+
+def progress_job(done: int, total: int):
+	# ワーカースレッドから呼び出されるためイベントで通知する
+	window.write_event_value('job_progress', (done, total))
+
+
+def show_progress(values):
+	done, total = values['job_progress']
+	if total:
+		window['prg_job'].update_bar(min(done * 1000 // total, 1000))
+
+
+def cancel_job():
+	if running_job is not None:
+		running_job.cancel()
+
+
+def finish_job():
+	global running_job
+	global running_job_done
+	job = running_job
+	done, error = running_job_done
+	running_job = None
+	running_job_done = None
+	window['btn_job_cancel'].update(disabled=True)
+	window['prg_job'].update_bar(0)
+	try:
+		result = job.result()
+	except job_cancelled:
+		print('cancelled.')
+		return
+	except Exception as exc:
+		print(error if error is not None else exc)
+		return
+	done(result)
+
+
 def read_file(values):
-	global hex_file_info
 	# GUIから情報取得
 	file_path_str = values["inp_hex_file"]
 	# HEXファイル情報作成
-	try:
-		file_path = pathlib.Path(file_path_str)
-		file_ext = file_path.suffix
-		if file_ext == '.mot':
-			hex_file_info = mot_s_record(file_path)
-		else:
-			hex_file_info = intel_hex(file_path)
-	except:
-		print('input file is invalid!')
-		return
+	file_path = pathlib.Path(file_path_str)
+	stats = None
+	if values["chk_profile"]:
+		# 解析/チェックサム計算の計測結果をログに出力
+		stats = load_stats()
+		stats.add_hook(print_stats)
+	job = load_job(file_path, hex_file_cache, "report", stats, progress_job)
+	start_job(job, lambda hex_file: read_file_done(hex_file, stats), 'input file is invalid!')
+
+
+def read_file_done(hex_file, stats: load_stats):
+	global hex_file_info
+	global hex_file_watch
+	hex_file_watch = None
+	hex_file_info = hex_file
+	# 計測結果(キャッシュから読み込んだときはcacheフェーズのみ)
+	if stats is not None:
+		for line in stats.format():
+			print(line)
+	# アドレスが重なるレコードを報告
+	for overlap in hex_file_info.overlaps:
+		print(f'overlapping records: {overlap.addr_begin:08X}-{overlap.addr_end:08X}')
 	# HEX情報取得
 	addr_begin = hex_file_info._address_begin
 	addr_end = hex_file_info._address_end
@@ -156,6 +235,12 @@ def read_file(values):
 	window['inp_checksum_addr_end'].update(value=f'{addr_end_adjust:08X}')
 
 
+def print_stats(event: str, stats: load_stats):
+	if event == "checksum":
+		# ワーカースレッドから呼び出されるためイベントでログに出力する
+		window.write_event_value('log', f'checksum: {stats.phase_time.get("checksum", 0.0) * 1e3:.1f} ms (total {stats.checksum_count})')
+
+
 def setting_checksum(values):
 	global checksum_blank
 	global hex_file_info
@@ -172,6 +257,8 @@ def setting_checksum(values):
 	if blank is None:
 		blank = int(checksum_blank, 16)
 	window['inp_checksum_blank'].update(value=f'{blank:02X}')
+	# algorithm
+	window['cmb_checksum_algorithm'].update(value=preset.algorithm)
 	# twos_compl
 	if preset.twos_compl == twos_compl_select.enable:
 		window['radio_twos_enable'].update(value=True)
@@ -196,48 +283,150 @@ def setting_checksum(values):
 	window['inp_checksum_addr_end'].update(value=f'{addr_end:08X}')
 
 
-def calc_checksum(values):
-	global hex_file_info
-	# 
-	if hex_file_info is None:
-		return
-	# GUIから情報取得
+def get_range_settings(values):
+	"""
+	GUIからblank/計算範囲を取得する
+	無効値のときはNoneを返す
+	"""
 	blank_str = values["inp_checksum_blank"]
 	addr_begin_str = values["inp_checksum_addr_begin"]
 	addr_end_str = values["inp_checksum_addr_end"]
-	twos_enable = values["radio_twos_enable"]
-	twos_disable = values["radio_twos_disable"]
-	twos_both = values["radio_twos_both"]
 	# 情報整形
 	re_hex = re.compile('[a-fA-F0-9]+')
 	# blank
 	if re_hex.match(blank_str) is None:
 		print(f'Blank Setting [{blank_str}] is invalid!')
-		return
+		return None
 	blank = int(blank_str, 16)
 	# address
 	if re_hex.match(addr_begin_str) is None:
 		print(f'Address Setting [{addr_begin_str}] is invalid!')
-		return
+		return None
 	addr_begin = int(addr_begin_str, 16)
 	if re_hex.match(addr_end_str) is None:
 		print(f'Address Setting [{addr_end_str}] is invalid!')
-		return
+		return None
 	addr_end = int(addr_end_str, 16)
+	return blank, addr_begin, addr_end
+
+
+def calc_checksum(values):
+	global hex_file_info
+	global hex_file_watch
+	# 
+	if hex_file_info is None:
+		return
+	# GUIから情報取得
+	settings = get_range_settings(values)
+	if settings is None:
+		return
+	blank, addr_begin, addr_end = settings
+	twos_enable = values["radio_twos_enable"]
+	twos_disable = values["radio_twos_disable"]
+	twos_both = values["radio_twos_both"]
+	algorithm = values["cmb_checksum_algorithm"]
+	# algorithm
+	if algorithm not in checksum_algorithm_tbl:
+		print(f'Algorithm Setting [{algorithm}] is invalid!')
+		return
 	# チェックサム計算
-	checksum = None
-	if twos_disable or twos_both:
-		checksum = hex_file_info.checksum(blank, False, addr_begin, addr_end)
+	configs = []
 	if twos_enable or twos_both:
-		checksum = hex_file_info.checksum(blank, True, addr_begin, addr_end)
+		configs.append(checksum_config(blank, True, addr_begin, addr_end, algorithm))
+	if twos_disable or twos_both:
+		configs.append(checksum_config(blank, False, addr_begin, addr_end, algorithm))
+	if values["chk_watch"]:
+		# ファイル変更時に差分で再計算する
+		file_path = pathlib.Path(values["inp_hex_file"])
+		start_job(hex_job(lambda: hex_watch(file_path, configs), progress_job), calc_checksum_watch_done, 'input file is invalid!')
+	else:
+		hex_file_watch = None
+		start_job(hex_file_info.checksum_job(configs, progress_job), lambda checksums: show_checksums(configs, checksums))
+
+
+def calc_checksum_watch_done(watch: hex_watch):
+	global hex_file_info
+	global hex_file_watch
+	hex_file_watch = watch
+	hex_file_info = watch.hex_file
 	# 情報展開
-	window['inp_checksum'].update(value=f'{checksum:08X}')
+	show_checksums(watch.configs, watch.checksums)
+
+
+def show_checksums(configs, checksums):
+	window['inp_checksum'].update(value=' / '.join(f'{checksum:08X}' for checksum in checksums))
+	for config, checksum in zip(configs, checksums):
+		print(checksum_log(config, checksum))
+
+
+def poll_watch():
+	global hex_file_info
+	error = hex_file_watch.error
+	if hex_file_watch.poll():
+		hex_file_info = hex_file_watch.hex_file
+		print(f'file changed: {hex_file_watch.last_update} ({hex_file_watch.changed_lines} lines)')
+		show_checksums(hex_file_watch.configs, hex_file_watch.checksums)
+	elif hex_file_watch.error is not None and hex_file_watch.error is not error:
+		print(f'file changed: {hex_file_watch.error}')
+
+
+def calc_checksum_presets(values):
+	global checksum_blank
+	global hex_file_info
+	#
+	if hex_file_info is None:
+		return
+	# 全プリセットをまとめて計算
+	names = []
+	configs = []
+	for key, preset in checksum_preset.items():
+		for config in preset_configs(preset, int(checksum_blank, 16)):
+			names.append(key)
+			configs.append(config)
+	start_job(hex_file_info.checksum_job(configs, progress_job), lambda checksums: show_checksums_presets(names, configs, checksums))
+
+
+def show_checksums_presets(names, configs, checksums):
+	# 情報展開
+	for key, config, checksum in zip(names, configs, checksums):
+		print(f'{key}: {checksum_log(config, checksum)}')
+
+
+def export_bin_file(values):
+	global hex_file_info
+	#
+	if hex_file_info is None:
+		return
+	settings = get_range_settings(values)
+	if settings is None:
+		return
+	blank, addr_begin, addr_end = settings
+	# 出力先取得
+	file_path_str = sg.popup_get_file('export bin', save_as=True, default_extension='.bin', file_types=(('Binary', '*.bin'),))
+	if not file_path_str:
+		return
+	# 広い範囲の出力は時間がかかるためジョブとして実行する(進捗表示/キャンセル可能)
+	hex_file = hex_file_info
+	job = hex_job(lambda: export_bin(hex_file, pathlib.Path(file_path_str), blank, addr_begin, addr_end), progress_job)
+	start_job(job, lambda size: print(f'export bin: {file_path_str} blank={blank:02X} {addr_begin:08X}-{addr_end:08X} ({size} bytes)'))
+
+
+def checksum_log(config: checksum_config, checksum: int) -> str:
+	addr_begin = config.addr_begin
+	if addr_begin is None:
+		addr_begin = hex_file_info._address_begin
+	addr_end = config.addr_end
+	if addr_end is None:
+		addr_end = hex_file_info._address_end
+	twos_compl = 'あり' if config.twos_compl else 'なし'
+	return f'{config.algorithm} blank={config.blank:02X} {addr_begin:08X}-{addr_end:08X} 2の補数{twos_compl}: {checksum:08X}'
 
 """
 イベントハンドラ
 """
 while True:
-	event, values = window.read()
+	# 監視中は一定間隔でファイルを確認する
+	event, values = window.read(timeout=500 if hex_file_watch is not None else None)
 
 	if event == 'btn_hex_read':
 		read_file(values)
@@ -245,8 +434,25 @@ while True:
 		setting_checksum(values)
 	elif event == 'btn_checksum_calc':
 		calc_checksum(values)
+	elif event == 'btn_checksum_calc_presets':
+		calc_checksum_presets(values)
+	elif event == sg.TIMEOUT_KEY:
+		# ジョブ実行中は監視を止める
+		if hex_file_watch is not None and running_job is None:
+			poll_watch()
+	elif event == 'btn_job_cancel':
+		cancel_job()
+	elif event == 'job_progress':
+		show_progress(values)
+	elif event == 'job_done':
+		finish_job()
+	elif event == 'log':
+		print(values['log'])
+	elif event == 'btn_export_bin':
+		export_bin_file(values)
 	elif event is None:
 		print("exit")
+		cancel_job()
 		break
 
 window.close()
@@ -0,0 +1,51 @@
+"""
+チェックサムアルゴリズム毎のスループット計測
+16MBの連続イメージ(データ部)と、4GB空間の大半が空白のイメージ(空白領域)を計測する
+NumPyがあれば連続イメージを展開済みイメージ(build_dense())で計算したときも計測する
+"""
+import os
+import sys
+import time
+import pathlib
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHexTextFile.intel_hex import intel_hex
+from pyHexTextFile.checksum_algorithm import checksum_algorithm_tbl
+from pyHexTextFile import dense_image
+import hex_gen
+
+image_size = 16 * 1024 * 1024
+
+
+def measure(hex_file: intel_hex, algorithm: str, addr_begin: int, addr_end: int) -> float:
+	time_begin = time.perf_counter()
+	hex_file.checksum(0xFF, True, addr_begin, addr_end, algorithm)
+	return time.perf_counter() - time_begin
+
+
+def main():
+	with tempfile.TemporaryDirectory() as tmp:
+		path = pathlib.Path(tmp) / "bench.hex"
+		hex_gen.write_intel_hex(path, [(0x00000000, image_size)], record_len=32)
+		dense = intel_hex(path)
+		path = pathlib.Path(tmp) / "sparse.hex"
+		hex_gen.write_intel_hex(path, [(0x00000000, 0x10000), (0xFFFF0000, 0x10000)], record_len=32)
+		sparse = intel_hex(path)
+		expanded = None
+		if dense_image.available:
+			expanded = intel_hex(path.with_name("bench.hex"))
+			expanded.build_dense()
+	print(f'{"algorithm":<12} {"data[MB/s]":>12} {"dense[MB/s]":>12} {"4GB range[s]":>14}')
+	for algorithm in checksum_algorithm_tbl.keys():
+		time_dense = measure(dense, algorithm, 0x00000000, image_size - 1)
+		time_sparse = measure(sparse, algorithm, 0x00000000, 0xFFFFFFFF)
+		expanded_mbps = "-"
+		if expanded is not None:
+			expanded_mbps = f'{image_size / measure(expanded, algorithm, 0x00000000, image_size - 1) / 1e6:.1f}'
+		print(f'{algorithm:<12} {image_size / time_dense / 1e6:>12.1f} {expanded_mbps:>12} {time_sparse:>14.4f}')
+
+
+if __name__ == "__main__":
+	main()
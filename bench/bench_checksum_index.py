@@ -0,0 +1,50 @@
+"""
+checksum_indexによる範囲チェックサムのスループット計測
+16MBのイメージに対してランダムな範囲のチェックサムを繰り返し計算する
+目標: 1000 query/s 以上
+"""
+import os
+import sys
+import time
+import random
+import pathlib
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHexTextFile.intel_hex import intel_hex
+import hex_gen
+
+image_size = 16 * 1024 * 1024
+query_count = 10000
+target_qps = 1000
+
+
+def main():
+	with tempfile.TemporaryDirectory() as tmp:
+		path = pathlib.Path(tmp) / "bench.hex"
+		hex_gen.write_intel_hex(path, [(0x00000000, image_size)], record_len=32)
+		hex_file = intel_hex(path)
+	# インデックス作成
+	time_begin = time.perf_counter()
+	hex_file.build_index()
+	time_index = time.perf_counter() - time_begin
+	# 範囲クエリ
+	rand = random.Random(0)
+	queries = []
+	for _ in range(query_count):
+		begin = rand.randrange(0, image_size)
+		queries.append((begin, rand.randrange(begin, image_size)))
+	time_begin = time.perf_counter()
+	for begin, end in queries:
+		hex_file.checksum(0xFF, True, begin, end)
+	time_query = time.perf_counter() - time_begin
+	qps = query_count / time_query
+	print(f'build_index: {time_index:.3f} s')
+	print(f'query: {qps:.0f} query/s (target: {target_qps} query/s)')
+	if qps < target_qps:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
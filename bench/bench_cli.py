@@ -0,0 +1,44 @@
+"""
+CLIのプロセスプール並列化のスケーラビリティ計測
+合成HEXファイル群をワーカー数を変えて処理し、スループットと速度向上率を出力する
+"""
+import os
+import sys
+import time
+import pathlib
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHexTextFile import cli
+from pyHexTextFile.checksum_preset import checksum_preset
+import hex_gen
+
+file_count = 32
+file_size = 1024 * 1024
+
+
+def main():
+	cpu_count = os.cpu_count() or 1
+	jobs_list = sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+	with tempfile.TemporaryDirectory() as tmp:
+		files = []
+		for i in range(file_count):
+			path = pathlib.Path(tmp) / f"bench_{i:03}.hex"
+			hex_gen.write_intel_hex(path, [(0x00000000, file_size)], record_len=32, seed=i)
+			files.append(str(path))
+		settings = [(None, checksum_preset["<default>"])]
+		print(f'{"jobs":>4} {"files/s":>10} {"speedup":>8}')
+		time_base = None
+		for jobs in jobs_list:
+			time_begin = time.perf_counter()
+			results = list(cli.run(files, settings, jobs, use_cache=False))
+			elapsed = time.perf_counter() - time_begin
+			assert all("error" not in result[0] for result in results)
+			if time_base is None:
+				time_base = elapsed
+			print(f'{jobs:>4} {file_count / elapsed:>10.1f} {time_base / elapsed:>8.2f}')
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,108 @@
+"""
+CLIの起動時間(コールドスタート)計測
+小さなHEXファイルのチェックサムをCLIプロセスで計算し、起動から結果出力までの時間を計測する
+あわせてコアモジュールのimportでGUI/NumPyなどの重いモジュールを読み込まないことを確認する
+目標: 小さなファイルで 100 ms 以内
+
+使い方:
+  python bench_cold_start.py                 計測(目標超過/重いモジュールの読み込みがあれば終了コード1)
+  python bench_cold_start.py --budget 150    目標時間[ms]を指定
+  python bench_cold_start.py --importtime    import時間の上位モジュールを表示
+"""
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import subprocess
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import hex_gen
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+# コアモジュール(GUIなしで使用するモジュール)
+core_modules = [
+	"pyHexTextFile.cli",
+	"pyHexTextFile.hex_loader",
+	"pyHexTextFile.hex_text_file",
+	"pyHexTextFile.checksum_algorithm",
+]
+# コアモジュールのimportで読み込まないモジュール
+heavy_modules = [
+	"PySimpleGUI",
+	"PySimpleGUIHelper",
+	"tkinter",
+	"ctypes",
+	"numpy",
+	"concurrent.futures",
+	"tracemalloc",
+	"csv",
+]
+
+
+def run_python(args, repeat: int) -> float:
+	"""
+	Pythonプロセスをrepeat回実行した最短時間[秒]
+	"""
+	elapsed = []
+	for _ in range(repeat):
+		time_begin = time.perf_counter()
+		subprocess.run([sys.executable, *args], cwd=root_dir, stdout=subprocess.DEVNULL, check=True)
+		elapsed.append(time.perf_counter() - time_begin)
+	return min(elapsed)
+
+
+def loaded_heavy_modules():
+	"""
+	コアモジュールのimportで読み込まれた重いモジュール
+	"""
+	code = f"import sys\nfor name in {core_modules!r}: __import__(name)\nprint(__import__('json').dumps([name for name in {heavy_modules!r} if name in sys.modules]))"
+	result = subprocess.run([sys.executable, "-c", code], cwd=root_dir, stdout=subprocess.PIPE, check=True)
+	return json.loads(result.stdout)
+
+
+def import_time(top: int = 10):
+	"""
+	CLIモジュールのimport時間(累積)の上位を(モジュール名, 秒)で返す
+	"""
+	result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import pyHexTextFile.cli"], cwd=root_dir, stderr=subprocess.PIPE, check=True)
+	times = []
+	for line in result.stderr.decode().splitlines()[1:]:
+		_, cumulative, name = line.split("|")
+		times.append((name.strip(), int(cumulative) / 1e6))
+	return sorted(times, key=lambda item: -item[1])[:top]
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(description="CLIの起動時間計測")
+	parser.add_argument("--budget", type=float, default=100.0, help="結果出力までの目標時間[ms]")
+	parser.add_argument("--repeat", type=int, default=10, help="計測回数(最短時間を使用)")
+	parser.add_argument("--importtime", action="store_true", help="import時間の上位モジュールを表示する")
+	args = parser.parse_args(argv)
+	ok = True
+	with tempfile.TemporaryDirectory() as tmp:
+		path = pathlib.Path(tmp) / "small.hex"
+		hex_gen.write_intel_hex(path, [(0x00000000, 4096)])
+		time_python = run_python(["-c", "pass"], args.repeat)
+		time_import = run_python(["-c", "import pyHexTextFile.cli"], args.repeat)
+		time_cli = run_python(["-m", "pyHexTextFile", str(path), "--no-cache", "--jobs", "1"], args.repeat)
+	print(f'python startup   : {time_python * 1e3:7.1f} ms')
+	print(f'import cli       : {time_import * 1e3:7.1f} ms')
+	print(f'first result     : {time_cli * 1e3:7.1f} ms (budget {args.budget:.0f} ms)')
+	if time_cli * 1e3 > args.budget:
+		ok = False
+	heavy = loaded_heavy_modules()
+	print(f'heavy modules    : {", ".join(heavy) if heavy else "none"}')
+	if heavy:
+		ok = False
+	if args.importtime:
+		for name, elapsed in import_time():
+			print(f'  {name:<40} {elapsed * 1e3:7.1f} ms')
+	return 0 if ok else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
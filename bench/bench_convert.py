@@ -0,0 +1,70 @@
+"""
+形式変換(Intel HEX ⇔ Sレコード)の出力スループット計測
+解析済みのイメージを出力する時間を計測し、出力中のメモリ増加量がブロックサイズ程度に収まることを確認する
+目標: 出力データ 50 MB/s 以上(NumPyあり)
+
+使い方:
+  python bench_convert.py               256MBのイメージで計測
+  python bench_convert.py --size 16M    サイズを指定
+"""
+import os
+import sys
+import time
+import pathlib
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_writer import export_intel_hex, export_s_record
+import hex_gen
+
+target_throughput = 50e6
+# 出力中のメモリ増加量の上限(ブロックサイズ1MBに対して)
+max_alloc = 64 * 1024 * 1024
+size_units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(value: str) -> int:
+	unit = size_units.get(value[-1:].upper())
+	if unit is None:
+		return int(value)
+	return int(value[:-1]) * unit
+
+
+def measure(name: str, export, hex_file, path: pathlib.Path, data_size: int, **kwargs) -> bool:
+	tracemalloc.start()
+	time_begin = time.perf_counter()
+	export(hex_file, path, **kwargs)
+	elapsed = time.perf_counter() - time_begin
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	throughput = data_size / elapsed
+	print(f'{name:<24}: {elapsed:7.2f} s, {throughput / 1e6:7.1f} MB/s, peak alloc {peak / 1e6:6.1f} MB, file {path.stat().st_size / 1e6:8.1f} MB')
+	path.unlink()
+	return throughput >= target_throughput and peak <= max_alloc
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(description="形式変換の出力スループット計測")
+	parser.add_argument("--size", default="256M", help="データサイズ(K/M/G単位可)")
+	args = parser.parse_args(argv)
+	size = parse_size(args.size)
+	ok = True
+	with tempfile.TemporaryDirectory() as tmp:
+		src = pathlib.Path(tmp) / "bench.mot"
+		hex_gen.write_s_record(src, [(0x00000000, size)], record_len=32, record_type=3)
+		hex_file = load_hex_file(src)
+		src.unlink()
+		dst = pathlib.Path(tmp) / "out"
+		ok &= measure("intel hex (16)", export_intel_hex, hex_file, dst.with_suffix(".hex"), size)
+		ok &= measure("intel hex (32)", export_intel_hex, hex_file, dst.with_suffix(".hex"), size, record_len=32)
+		ok &= measure("S3 (32)", export_s_record, hex_file, dst.with_suffix(".mot"), size, record_len=32, record_type=3)
+	print(f'target: {target_throughput / 1e6:.0f} MB/s, peak alloc <= {max_alloc / 1e6:.0f} MB')
+	return 0 if ok else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
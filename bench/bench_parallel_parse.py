@@ -0,0 +1,41 @@
+"""
+Intel HEX並列解析の速度向上率計測
+引数: 生成するイメージのサイズ[MB](デフォルト64MB、500MB以上のHEXファイルは200MB程度を指定)
+"""
+import os
+import sys
+import time
+import pathlib
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHexTextFile.intel_hex import intel_hex
+from pyHexTextFile.intel_hex_parallel import parse_parallel
+import hex_gen
+
+
+def main():
+	image_size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+	image_size *= 1024 * 1024
+	cpu_count = os.cpu_count() or 1
+	jobs_list = sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+	with tempfile.TemporaryDirectory() as tmp:
+		path = pathlib.Path(tmp) / "bench.hex"
+		hex_gen.write_intel_hex(path, [(0x00000000, image_size)], record_len=32)
+		print(f'file size: {path.stat().st_size / 1e6:.1f} MB')
+		time_begin = time.perf_counter()
+		reference = intel_hex(path)
+		time_base = time.perf_counter() - time_begin
+		print(f'{"jobs":>4} {"time[s]":>8} {"speedup":>8}')
+		print(f'{"seq":>4} {time_base:>8.2f} {1:>8.2f}')
+		for jobs in jobs_list:
+			time_begin = time.perf_counter()
+			hex_file = parse_parallel(path, jobs)
+			elapsed = time.perf_counter() - time_begin
+			assert hex_file.image.addr == reference.image.addr and hex_file.image.payload == reference.image.payload
+			print(f'{jobs:>4} {elapsed:>8.2f} {time_base / elapsed:>8.2f}')
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,211 @@
+"""
+解析/チェックサムの性能回帰ベンチマーク
+フォーマット(Intel HEX 02/04, S1/S2/S3)×配置(dense/sparse/overlapping)×サイズの組み合わせで
+解析時間, 最大RSS, チェックサム計算時間(狭い範囲/全範囲)を計測し、
+ベースラインと比較して劣化した項目を報告する
+
+使い方:
+  python bench_suite.py                     計測してベースラインと比較(劣化があれば終了コード1)
+  python bench_suite.py --save              計測結果をベースラインとして保存
+  python bench_suite.py --sizes 64K 1M 1G   計測するサイズを指定(デフォルト: 64K 1M 16M)
+生成したファイルは--work-dirに保存し、同じ条件なら再利用する
+ベースラインは計測したマシンでのみ有効
+(baseline.jsonは参照用。machineが異なるときは警告を表示する)
+
+CIでの比較(同じランナーで基準のコミットと比較する):
+  git checkout <base>  && python bench/bench_suite.py --save --baseline $RUNNER_TEMP/baseline.json
+  git checkout <head>  && python bench/bench_suite.py --baseline $RUNNER_TEMP/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import platform
+import subprocess
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import hex_gen
+
+try:
+	import resource
+except ImportError:
+	# Windowsでは最大RSSを計測しない
+	resource = None
+
+
+# フォーマット: (拡張子, アドレス上限, 生成関数)
+formats = {
+	"hex04": (".hex", 1 << 32, lambda path, blocks: hex_gen.write_intel_hex(path, blocks, 32, ext_record_type=4)),
+	"hex02": (".hex", 1 << 20, lambda path, blocks: hex_gen.write_intel_hex(path, blocks, 32, ext_record_type=2)),
+	"s1": (".mot", 1 << 16, lambda path, blocks: hex_gen.write_s_record(path, blocks, 32, record_type=1)),
+	"s2": (".mot", 1 << 24, lambda path, blocks: hex_gen.write_s_record(path, blocks, 32, record_type=2)),
+	"s3": (".mot", 1 << 32, lambda path, blocks: hex_gen.write_s_record(path, blocks, 32, record_type=3)),
+}
+layouts = ["dense", "sparse", "overlapping"]
+size_units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+default_sizes = ["64K", "1M", "16M"]
+default_baseline = pathlib.Path(__file__).parent / "baseline.json"
+# 劣化とみなす比率(計測誤差を除くため差がregression_min_time[s]未満の時間は比較しない)
+regression_ratio = 1.5
+regression_min_time = 0.001
+# 計測回数(最小値を結果とする)
+parse_repeat = 3
+narrow_repeat = 50
+full_repeat = 3
+narrow_size = 256
+
+
+def parse_size(value: str) -> int:
+	unit = size_units.get(value[-1:].upper())
+	if unit is None:
+		return int(value)
+	return int(value[:-1]) * unit
+
+
+def cases(sizes):
+	"""
+	アドレス上限に収まるフォーマット/配置/サイズの組み合わせを返す
+	"""
+	for size_str in sizes:
+		size = parse_size(size_str)
+		for fmt, (_, addr_limit, _) in formats.items():
+			for layout in layouts:
+				blocks = hex_gen.layout_blocks(layout, size, addr_limit)
+				if max(begin + length for begin, length in blocks) > addr_limit:
+					continue
+				yield f'{fmt}/{layout}/{size_str}', fmt, blocks
+
+
+def generate(work_dir: pathlib.Path, name: str, fmt: str, blocks) -> pathlib.Path:
+	suffix, _, write = formats[fmt]
+	path = work_dir / (name.replace('/', '_') + suffix)
+	if not path.exists():
+		tmp_path = path.with_name(path.name + ".tmp")
+		write(tmp_path, blocks)
+		os.replace(tmp_path, path)
+	return path
+
+
+def _max_rss() -> int:
+	"""
+	プロセスの最大RSS[byte]
+	"""
+	if resource is None:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# macOSはbyte, それ以外はKB
+	return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(path: pathlib.Path) -> dict:
+	"""
+	1ファイルを解析してチェックサムを計測する
+	peak_rssは解析による最大RSSの増加量
+	最大RSSを分離するため計測毎に別プロセスで実行する
+	"""
+	from pyHexTextFile.hex_loader import hex_file_type
+	cls = hex_file_type(path)
+	rss_begin = _max_rss()
+	parse = []
+	for _ in range(parse_repeat):
+		hex_file = None
+		time_begin = time.perf_counter()
+		hex_file = cls(path)
+		parse.append(time.perf_counter() - time_begin)
+	rss_end = _max_rss()
+	# 狭い範囲(中央)
+	addr_mid = (hex_file._address_begin + hex_file._address_end) // 2
+	narrow = []
+	for _ in range(narrow_repeat):
+		time_begin = time.perf_counter()
+		hex_file.checksum(0xFF, True, addr_mid, addr_mid + narrow_size - 1)
+		narrow.append(time.perf_counter() - time_begin)
+	# 全範囲
+	full = []
+	for _ in range(full_repeat):
+		time_begin = time.perf_counter()
+		hex_file.checksum(0xFF, True)
+		full.append(time.perf_counter() - time_begin)
+	return {
+		"file_size": path.stat().st_size,
+		"parse_time": min(parse),
+		"peak_rss": None if rss_end is None else rss_end - rss_begin,
+		"checksum_narrow": min(narrow),
+		"checksum_full": min(full),
+	}
+
+
+def run_case(path: pathlib.Path) -> dict:
+	proc = subprocess.run([sys.executable, __file__, "--measure", str(path)], stdout=subprocess.PIPE, check=True)
+	return json.loads(proc.stdout)
+
+
+def compare(results: dict, baseline: dict):
+	"""
+	ベースラインからregression_ratio以上劣化した項目を返す
+	"""
+	regressions = []
+	for name, result in results.items():
+		base = baseline.get(name)
+		if base is None:
+			continue
+		for key in ("parse_time", "peak_rss", "checksum_narrow", "checksum_full"):
+			if result[key] is None or not base.get(key):
+				continue
+			if key != "peak_rss" and result[key] - base[key] < regression_min_time:
+				continue
+			if result[key] > base[key] * regression_ratio:
+				regressions.append((name, key, base[key], result[key]))
+	return regressions
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(description="HEXファイル解析/チェックサムのベンチマーク")
+	parser.add_argument("--sizes", nargs="+", default=default_sizes, help="データサイズ(K/M/G単位可)")
+	parser.add_argument("--work-dir", type=pathlib.Path, default=pathlib.Path(tempfile.gettempdir()) / "pyHexTextFile_bench", help="生成ファイルの保存先")
+	parser.add_argument("--baseline", type=pathlib.Path, default=default_baseline, help="ベースラインファイル")
+	parser.add_argument("--save", action="store_true", help="計測結果をベースラインとして保存する")
+	parser.add_argument("--measure", type=pathlib.Path, help=argparse.SUPPRESS)
+	args = parser.parse_args(argv)
+	if args.measure is not None:
+		print(json.dumps(measure(args.measure)))
+		return 0
+	args.work_dir.mkdir(parents=True, exist_ok=True)
+	#
+	results = {}
+	print(f'{"case":<24} {"file[MB]":>9} {"parse[s]":>9} {"rss[MB]":>8} {"narrow[ms]":>10} {"full[ms]":>10}')
+	for name, fmt, blocks in cases(args.sizes):
+		path = generate(args.work_dir, name, fmt, blocks)
+		result = run_case(path)
+		results[name] = result
+		rss = "-" if result["peak_rss"] is None else f'{result["peak_rss"] / 1e6:.1f}'
+		print(f'{name:<24} {result["file_size"] / 1e6:>9.2f} {result["parse_time"]:>9.3f} {rss:>8} {result["checksum_narrow"] * 1e3:>10.3f} {result["checksum_full"] * 1e3:>10.1f}')
+		sys.stdout.flush()
+	#
+	if args.save:
+		baseline = {}
+		if args.baseline.exists():
+			baseline = json.loads(args.baseline.read_text())["results"]
+		baseline.update(results)
+		data = {"machine": platform.platform(), "python": platform.python_version(), "results": baseline}
+		args.baseline.write_text(json.dumps(data, indent=1, sort_keys=True))
+		print(f'baseline saved: {args.baseline}')
+		return 0
+	if not args.baseline.exists():
+		print('baseline not found. (run with --save)')
+		return 0
+	baseline = json.loads(args.baseline.read_text())
+	if baseline.get("machine") != platform.platform():
+		print(f'warning: baseline was measured on another machine ({baseline.get("machine")})')
+	regressions = compare(results, baseline["results"])
+	for name, key, base, value in regressions:
+		print(f'regression: {name} {key}: {base:.6g} -> {value:.6g}')
+	return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+ベンチマーク用の合成HEXファイル生成
+同じseedからは常に同じファイルを生成する
+"""
+import random
+import pathlib
+
+
+def _random_bytes(rand: random.Random, size: int) -> bytes:
+	if size == 0:
+		return b""
+	return rand.getrandbits(size * 8).to_bytes(size, 'little')
+
+
+def intel_hex_record(record_type: int, addr: int, data: bytes) -> str:
+	"""
+	Intel HEXの1レコード分のテキストを作成する
+	"""
+	record = bytes([len(data), (addr >> 8) & 0xFF, addr & 0xFF, record_type]) + data
+	return ':' + (record + bytes([-sum(record) & 0xFF])).hex().upper() + '\n'
+
+
+def write_intel_hex(path: pathlib.Path, blocks, record_len: int = 16, seed: int = 0, ext_record_type: int = 4):
+	"""
+	blocks: (開始アドレス, サイズ)のリスト(重なるブロックは後から出力したものが重なる)
+	64KB境界毎に拡張アドレスレコードを出力する
+	ext_record_type: 4:拡張リニアアドレスレコード, 2:拡張セグメントアドレスレコード(1MBまで)
+	"""
+	if ext_record_type not in (2, 4):
+		raise Exception(f"invalid extended address record type: {ext_record_type}")
+	rand = random.Random(seed)
+	with path.open("w") as f:
+		for begin, size in blocks:
+			ext_addr = None
+			addr = begin
+			while addr < begin + size:
+				if ext_addr != addr >> 16:
+					ext_addr = addr >> 16
+					if ext_record_type == 4:
+						f.write(intel_hex_record(4, 0, ext_addr.to_bytes(2, 'big')))
+					else:
+						f.write(intel_hex_record(2, 0, (ext_addr << 12).to_bytes(2, 'big')))
+				length = min(record_len, begin + size - addr, 0x10000 - (addr & 0xFFFF))
+				f.write(intel_hex_record(0, addr & 0xFFFF, _random_bytes(rand, length)))
+				addr += length
+		f.write(intel_hex_record(1, 0, b""))
+
+
+# Sレコードのデータレコード毎のアドレス長/エンドレコード
+s_record_addr_len = {1: 2, 2: 3, 3: 4}
+s_record_end_type = {1: 9, 2: 8, 3: 7}
+
+
+def s_record(record_type: int, addr: int, addr_len: int, data: bytes) -> str:
+	"""
+	Sレコードの1レコード分のテキストを作成する
+	"""
+	record = bytes([addr_len + len(data) + 1]) + addr.to_bytes(addr_len, 'big') + data
+	return f'S{record_type}' + (record + bytes([~sum(record) & 0xFF])).hex().upper() + '\n'
+
+
+def write_s_record(path: pathlib.Path, blocks, record_len: int = 16, seed: int = 0, record_type: int = 3):
+	"""
+	blocks: (開始アドレス, サイズ)のリスト(重なるブロックは後から出力したものが重なる)
+	record_type: データレコードのタイプ(1:S1, 2:S2, 3:S3)
+	"""
+	addr_len = s_record_addr_len[record_type]
+	addr_limit = 1 << (addr_len * 8)
+	rand = random.Random(seed)
+	with path.open("w") as f:
+		f.write(s_record(0, 0, 2, path.name.encode()))
+		for begin, size in blocks:
+			if begin + size > addr_limit:
+				raise Exception(f"address out of range for S{record_type}: {begin + size - 1:08X}")
+			addr = begin
+			while addr < begin + size:
+				length = min(record_len, begin + size - addr)
+				f.write(s_record(record_type, addr, addr_len, _random_bytes(rand, length)))
+				addr += length
+		end_type = s_record_end_type[record_type]
+		f.write(s_record(end_type, 0, s_record_addr_len[10 - end_type], b""))
+
+
+def layout_blocks(layout: str, size: int, addr_limit: int = 1 << 32):
+	"""
+	データサイズsizeのイメージ配置を(開始アドレス, サイズ)のリストで作成する
+	dense      : 先頭から隙間なく配置
+	sparse     : 256バイトのブロックを最大16倍のアドレス空間に分散して配置
+	overlapping: denseの後に中央半分を重ねて配置
+	"""
+	if layout == "dense":
+		return [(0, size)]
+	if layout == "sparse":
+		block = min(256, size)
+		stride = block
+		while stride < block * 16 and (size // block) * stride * 2 <= addr_limit:
+			stride *= 2
+		return [(addr, block) for addr in range(0, (size // block) * stride, stride)]
+	if layout == "overlapping":
+		return [(0, size), (size // 4, size // 2)]
+	raise Exception(f"unknown layout: {layout}")
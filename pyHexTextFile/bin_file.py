@@ -0,0 +1,139 @@
+"""
+バイナリイメージ(.bin)の入出力
+出力は指定範囲をblankで埋めたバイナリを大きなブロック単位でストリーム出力する
+入力はmmapで読み込み、チェックサム計算はマップしたページを直接参照する
+"""
+import os
+import sys
+import mmap
+import pathlib
+from array import array
+
+from .hex_image import hex_image
+from .load_stats import load_stats
+from .hex_text_file import hex_text_file, is_stream
+from .hex_job import hex_job, current_job
+
+
+# 空白領域をファイルの穴(sparse)にできるOS
+sparse_supported = sys.platform != "win32"
+
+
+def export_bin(hex_file: hex_text_file, file_path: pathlib.Path, blank: int = 0xFF, addr_begin: int = None, addr_end: int = None, block_size: int = 1024 * 1024) -> int:
+	"""
+	addr_begin～addr_endをblankで埋めたバイナリファイルを出力する
+	blankが0x00でOSが対応していれば空白領域はファイルの穴として書き込まない
+	ジョブ実行中はblock_size毎に出力したバイト数を通知し、キャンセル時は出力途中のファイルを削除する
+	return: 出力サイズ
+	"""
+	if addr_begin is None:
+		addr_begin = hex_file._address_begin
+	if addr_end is None:
+		addr_end = hex_file._address_end
+	size = addr_end - addr_begin + 1
+	sparse = sparse_supported and blank == 0x00
+	blank_block = bytes([blank]) * block_size
+	file_path = pathlib.Path(file_path)
+	segments = hex_file._segments(addr_begin, addr_end)
+	job = current_job()
+	if job is not None:
+		job.set_total(size)
+		segments = job.segments(segments, addr_begin)
+	try:
+		with file_path.open("wb", buffering=block_size) as f:
+			addr_next = addr_begin
+			for addr, data in segments:
+				_write_blank(f, addr - addr_next, blank_block, sparse, job)
+				f.write(data)
+				addr_next = addr + len(data)
+			_write_blank(f, addr_end + 1 - addr_next, blank_block, sparse, job)
+			if sparse:
+				# 末尾の穴を含めてファイルサイズを確定
+				f.truncate(size)
+	except BaseException:
+		# 出力途中のファイルは残さない
+		try:
+			file_path.unlink()
+		except OSError:
+			pass
+		raise
+	return size
+
+
+def _write_blank(f, length: int, blank_block: bytes, sparse: bool, job: hex_job = None):
+	if length <= 0:
+		return
+	if sparse:
+		f.seek(length, os.SEEK_CUR)
+		if job is not None:
+			job.advance(length)
+		return
+	block_size = len(blank_block)
+	while length > 0:
+		size = min(length, block_size)
+		f.write(blank_block[:size] if size < block_size else blank_block)
+		length -= size
+		if job is not None:
+			job.advance(size)
+
+
+class bin_file(hex_text_file):
+	"""
+	バイナリイメージファイル
+	ファイル全体をbase_addrから始まる1つのデータセグメントとしてmmapで参照する
+	file_pathがストリーム(展開中の圧縮ファイルなど)のときは全体を読み込んで保持する
+	"""
+	def __init__(self, file_path: pathlib.Path, base_addr: int = 0, stats: load_stats = None) -> None:
+		self.file_path = file_path
+		self.base_addr = base_addr
+		self.image = hex_image()
+		# 制御情報
+		self._address: int = 0
+		self._address_begin: int = None
+		self._address_end: int = None
+		if stats is not None:
+			self.attach_stats(stats)
+		self._analyze()
+
+	def _analyze(self):
+		"""
+		ファイルをmmapしてイメージを作成する
+		"""
+		if is_stream(self.file_path):
+			self._analyze_stream()
+			return
+		with self.file_path.open("rb") as f:
+			size = os.fstat(f.fileno()).st_size
+			if size == 0:
+				return
+			self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self.image.payload = memoryview(self._mmap)
+		# 4GB以上のファイルも1セグメントで扱う
+		self.image.length = array('Q')
+		self.image.addr.append(self.base_addr)
+		self.image.offset.append(0)
+		self.image.length.append(size)
+		self._address = self.base_addr
+		self._address_begin = self.base_addr
+		self._address_end = self.base_addr + size - 1
+
+	def _analyze_stream(self):
+		"""
+		ストリームを終端まで読み込んでイメージを作成する
+		"""
+		payload = bytearray()
+		while True:
+			chunk = self.file_path.read(self.read_chunk_size)
+			if not chunk:
+				break
+			payload += chunk
+		if not payload:
+			return
+		self.image.payload = payload
+		self.image.length = array('Q')
+		self.image.addr.append(self.base_addr)
+		self.image.offset.append(0)
+		self.image.length.append(len(payload))
+		self._address = self.base_addr
+		self._address_begin = self.base_addr
+		self._address_end = self.base_addr + len(payload) - 1
@@ -0,0 +1,313 @@
+"""
+ブロック単位のダイジェストマップとイメージ比較
+アドレス空間をblock_size単位のブロックに区切り、blank埋めしたブロック内容のダイジェストを保持する
+データを含まないブロックは保持せず、blankだけのブロックのダイジェストを1回だけ計算して使用する
+比較はダイジェストが異なるブロックだけデータを読み出してバイト単位で比較する
+sumはバイトの入れ替えを検出できないため、マップの保存のみに使用できる(比較にはハッシュを使用する)
+
+比較: python -m pyHexTextFile.block_map old.hex new.hex
+      python -m pyHexTextFile.block_map old.hex --save-map old.json
+      python -m pyHexTextFile.block_map old.json new.hex
+"""
+import sys
+import json
+import bisect
+import hashlib
+import pathlib
+import argparse
+from typing import List, NamedTuple
+
+try:
+	import xxhash
+except ImportError:
+	xxhash = None
+
+from .hex_text_file import hex_text_file
+from .hex_loader import load_hex_file
+
+
+class diff_range(NamedTuple):
+	"""
+	内容が異なるアドレス範囲
+	"""
+	addr_begin: int
+	addr_end: int
+
+
+def _digest_sum(pieces, block_size: int, blank: int) -> bytes:
+	"""
+	ブロックのバイト総和(空白領域はblank×サイズで計算)
+	"""
+	data_sum = 0
+	data_len = 0
+	for _, data in pieces:
+		data_sum += sum(data)
+		data_len += len(data)
+	data_sum += blank * (block_size - data_len)
+	return data_sum.to_bytes(8, 'little')
+
+
+def _digest_hash(factory):
+	"""
+	blank埋めしたブロック内容のハッシュを計算する関数を作成する
+	ブロック全体を1つのデータが占めるときはコピーせずにハッシュを計算する
+	"""
+	def digest(pieces, block_size: int, blank: int) -> bytes:
+		if len(pieces) == 1 and len(pieces[0][1]) == block_size:
+			return factory(pieces[0][1]).digest()
+		return factory(_fill_block(pieces, block_size, blank)).digest()
+	return digest
+
+
+def _fill_block(pieces, block_size: int, blank: int) -> bytearray:
+	"""
+	(ブロック内オフセット, データ)をblank埋めしたブロックに展開する
+	"""
+	block = bytearray([blank]) * block_size
+	for offset, data in pieces:
+		block[offset:offset + len(data)] = data
+	return block
+
+
+# ダイジェストのアルゴリズム
+# sumはバイトの入れ替えや相殺する変更を検出できないため、比較(diff_images/diff_map)には使用できない
+block_digest_tbl = {
+	"sum": _digest_sum,
+	"sha256": _digest_hash(hashlib.sha256),
+	"blake2b": _digest_hash(lambda data: hashlib.blake2b(data, digest_size=16)),
+}
+if xxhash is not None:
+	block_digest_tbl["xxh64"] = _digest_hash(xxhash.xxh64)
+# 内容が異なっても一致し得るダイジェスト(マップの作成/保存のみ)
+lossy_digests = {"sum"}
+
+
+def _check_diff_algorithm(algorithm: str):
+	if algorithm in lossy_digests:
+		raise Exception(f"digest algorithm '{algorithm}' cannot detect all differences (use a hash algorithm)")
+
+
+def _block_pieces(segments, block_size: int):
+	"""
+	アドレス昇順のデータセグメントをブロック毎に分割し、
+	(ブロック番号, [(ブロック内オフセット, データ), ...])をブロック番号の昇順で返す
+	"""
+	index = None
+	pieces = []
+	for addr, data in segments:
+		pos = 0
+		while pos < len(data):
+			block = (addr + pos) // block_size
+			offset = addr + pos - block * block_size
+			size = min(len(data) - pos, block_size - offset)
+			if block != index:
+				if pieces:
+					yield index, pieces
+				index = block
+				pieces = []
+			pieces.append((offset, data[pos:pos + size]))
+			pos += size
+	if pieces:
+		yield index, pieces
+
+
+class block_map:
+	"""
+	ブロック単位のダイジェストマップ
+	blocks: ブロック番号→ダイジェスト(データを含むブロックのみ)
+	"""
+	def __init__(self, block_size: int = 4096, blank: int = 0xFF, algorithm: str = "sha256") -> None:
+		if algorithm not in block_digest_tbl:
+			raise Exception(f"unknown digest algorithm: {algorithm}")
+		if block_size <= 0:
+			raise Exception(f"invalid block size: {block_size}")
+		self.block_size = block_size
+		self.blank = blank
+		self.algorithm = algorithm
+		self.blocks = {}
+		# blankだけのブロックのダイジェスト
+		self.blank_digest = block_digest_tbl[algorithm]([], block_size, blank)
+
+	@classmethod
+	def from_image(cls, hex_file: hex_text_file, block_size: int = 4096, blank: int = 0xFF, algorithm: str = "sha256", addr_begin: int = None, addr_end: int = None) -> "block_map":
+		"""
+		解析済みイメージのaddr_begin～addr_endのダイジェストマップを作成する
+		"""
+		digest_map = cls(block_size, blank, algorithm)
+		if addr_begin is None:
+			addr_begin = hex_file._address_begin
+		if addr_end is None:
+			addr_end = hex_file._address_end
+		if addr_begin is None or addr_end is None:
+			return digest_map
+		digest = block_digest_tbl[algorithm]
+		for index, pieces in _block_pieces(hex_file._segments(addr_begin, addr_end), block_size):
+			digest_map.blocks[index] = digest(pieces, block_size, blank)
+		return digest_map
+
+	def digest(self, index: int) -> bytes:
+		return self.blocks.get(index, self.blank_digest)
+
+	def compatible(self, other: "block_map") -> bool:
+		"""
+		同じ条件で作成したマップのときTrue(比較可能)
+		"""
+		return (self.block_size, self.blank, self.algorithm) == (other.block_size, other.blank, other.algorithm)
+
+	def diff_blocks(self, other: "block_map") -> List[int]:
+		"""
+		ダイジェストが異なるブロック番号を昇順で返す
+		"""
+		if not self.compatible(other):
+			raise Exception("block maps with different block size/blank/algorithm cannot be compared")
+		return sorted(index for index in self.blocks.keys() | other.blocks.keys() if self.digest(index) != other.digest(index))
+
+	def to_dict(self) -> dict:
+		return {
+			"block_size": self.block_size,
+			"blank": self.blank,
+			"algorithm": self.algorithm,
+			"blocks": {f"{index:X}": digest.hex() for index, digest in self.blocks.items()},
+		}
+
+	@classmethod
+	def from_dict(cls, data: dict) -> "block_map":
+		digest_map = cls(data["block_size"], data["blank"], data["algorithm"])
+		digest_map.blocks = {int(index, 16): bytes.fromhex(digest) for index, digest in data["blocks"].items()}
+		return digest_map
+
+	def save(self, file_path: pathlib.Path):
+		pathlib.Path(file_path).write_text(json.dumps(self.to_dict()))
+
+	@classmethod
+	def load(cls, file_path: pathlib.Path) -> "block_map":
+		return cls.from_dict(json.loads(pathlib.Path(file_path).read_text()))
+
+
+def _read_blocks(hex_file: hex_text_file, indices: List[int], block_size: int, blank: int) -> dict:
+	"""
+	indices(昇順)のブロックをblank埋めして読み出す
+	return: ブロック番号→ブロック内容
+	"""
+	blocks = {index: bytearray([blank]) * block_size for index in indices}
+	if not indices or hex_file._address_begin is None:
+		return blocks
+	addr_begin = max(indices[0] * block_size, hex_file._address_begin)
+	addr_end = min((indices[-1] + 1) * block_size - 1, hex_file._address_end)
+	for addr, data in hex_file._segments(addr_begin, addr_end):
+		# セグメントにかかる読み出し対象ブロックだけ展開
+		first = bisect.bisect_left(indices, addr // block_size)
+		last = bisect.bisect_right(indices, (addr + len(data) - 1) // block_size)
+		for index in indices[first:last]:
+			begin = max(addr, index * block_size)
+			end = min(addr + len(data), (index + 1) * block_size)
+			blocks[index][begin - index * block_size:end - index * block_size] = data[begin - addr:end - addr]
+	return blocks
+
+
+def _diff_bytes(a: bytes, b: bytes, base: int):
+	"""
+	同じ長さのa, bが異なる範囲をアドレス(base+位置)の(開始, 終了)で返す
+	"""
+	step = 64
+	begin = None
+	for pos in range(0, len(a), step):
+		if a[pos:pos + step] == b[pos:pos + step]:
+			if begin is not None:
+				yield base + begin, base + pos - 1
+				begin = None
+			continue
+		for i in range(pos, min(pos + step, len(a))):
+			if a[i] != b[i]:
+				if begin is None:
+					begin = i
+			elif begin is not None:
+				yield base + begin, base + i - 1
+				begin = None
+	if begin is not None:
+		yield base + begin, base + len(a) - 1
+
+
+def _merge_ranges(ranges) -> List[diff_range]:
+	"""
+	隣接する範囲を連結する
+	"""
+	merged = []
+	for begin, end in ranges:
+		if merged and merged[-1].addr_end + 1 == begin:
+			merged[-1] = diff_range(merged[-1].addr_begin, end)
+		else:
+			merged.append(diff_range(begin, end))
+	return merged
+
+
+def diff_images(old: hex_text_file, new: hex_text_file, block_size: int = 4096, blank: int = 0xFF, algorithm: str = "sha256", old_map: block_map = None) -> List[diff_range]:
+	"""
+	2つのイメージ(blank埋め)の内容が異なるアドレス範囲を返す
+	ダイジェストが異なるブロックだけデータを読み出して比較する
+	old_map: oldのダイジェストマップ(作成済みのとき)
+	algorithm: ハッシュのアルゴリズム(lossy_digestsは使用できない)
+	"""
+	_check_diff_algorithm(algorithm if old_map is None else old_map.algorithm)
+	if old_map is None:
+		old_map = block_map.from_image(old, block_size, blank, algorithm)
+	else:
+		block_size, blank, algorithm = old_map.block_size, old_map.blank, old_map.algorithm
+	new_map = block_map.from_image(new, block_size, blank, algorithm)
+	indices = old_map.diff_blocks(new_map)
+	old_blocks = _read_blocks(old, indices, block_size, blank)
+	new_blocks = _read_blocks(new, indices, block_size, blank)
+	ranges = []
+	for index in indices:
+		ranges.extend(_diff_bytes(old_blocks[index], new_blocks[index], index * block_size))
+	return _merge_ranges(ranges)
+
+
+def diff_map(old_map: block_map, new: hex_text_file) -> List[diff_range]:
+	"""
+	ダイジェストマップとイメージの内容が異なる範囲をブロック単位で返す
+	old_mapのアルゴリズムがlossy_digestsのときは使用できない
+	"""
+	_check_diff_algorithm(old_map.algorithm)
+	new_map = block_map.from_image(new, old_map.block_size, old_map.blank, old_map.algorithm)
+	block_size = old_map.block_size
+	return _merge_ranges((index * block_size, (index + 1) * block_size - 1) for index in old_map.diff_blocks(new_map))
+
+
+def main(argv: List[str] = None) -> int:
+	parser = argparse.ArgumentParser(prog="pyHexTextFile.block_map", description="HEXファイルの差分範囲を出力する")
+	parser.add_argument("old", type=pathlib.Path, help="比較元(HEXファイル または 保存したダイジェストマップ(.json))")
+	parser.add_argument("new", type=pathlib.Path, nargs="?", help="比較先のHEXファイル")
+	parser.add_argument("--block-size", type=int, default=4096, help="ブロックサイズ[byte]")
+	parser.add_argument("--blank", type=lambda value: int(value, 16), default=0xFF, help="空白領域の値(16進)")
+	parser.add_argument("--algorithm", choices=list(block_digest_tbl.keys()), default="sha256", help="ダイジェストのアルゴリズム(sumはマップの保存のみ, 比較にはハッシュを使用する)")
+	parser.add_argument("--save-map", type=pathlib.Path, help="比較元のダイジェストマップを保存する")
+	parser.add_argument("--format", choices=["text", "json"], default="text", help="出力形式")
+	args = parser.parse_args(argv)
+	# 比較元
+	old = None
+	if args.old.suffix == ".json":
+		old_map = block_map.load(args.old)
+	else:
+		old = load_hex_file(args.old)
+		old_map = block_map.from_image(old, args.block_size, args.blank, args.algorithm)
+	if args.save_map is not None:
+		old_map.save(args.save_map)
+	if args.new is None:
+		return 0
+	# 比較
+	new = load_hex_file(args.new)
+	if old is None:
+		ranges = diff_map(old_map, new)
+	else:
+		ranges = diff_images(old, new, old_map=old_map)
+	if args.format == "json":
+		print(json.dumps([diff._asdict() for diff in ranges]))
+	else:
+		for addr_begin, addr_end in ranges:
+			print(f'{addr_begin:08X}-{addr_end:08X}')
+	return 1 if ranges else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
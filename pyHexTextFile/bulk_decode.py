@@ -0,0 +1,230 @@
+"""
+NumPyによるHEXテキストの一括デコード
+NumPyが無い環境ではavailable=Falseとなり、呼び出し側は通常の解析にフォールバックする
+"""
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+available = np is not None
+
+
+if available:
+	# 16進文字→値 変換テーブル(不正文字は0xFF)
+	_hex_lut = np.full(256, 0xFF, dtype=np.uint8)
+	for _i, _c in enumerate(b"0123456789ABCDEF"):
+		_hex_lut[_c] = _i
+	for _i, _c in enumerate(b"abcdef"):
+		_hex_lut[_c] = 10 + _i
+	# 行頭/行末から除去する空白文字
+	_space = np.zeros(256, dtype=bool)
+	_space[list(b" \t\r\n\v\f")] = True
+
+
+class bulk_records:
+	"""
+	チャンク内の全レコードのデコード結果
+	各配列はチャンク内の(空行を除く)行順に並ぶ
+	"""
+	def __init__(self, n: int) -> None:
+		# 行のチャンク内位置
+		self.line = np.zeros(n, dtype=np.int64)		# 行番号(0始まり)
+		self.start = np.zeros(n, dtype=np.int64)	# 行開始位置
+		self.end = np.zeros(n, dtype=np.int64)		# 行終了位置
+		# 解析情報
+		self.valid = np.zeros(n, dtype=bool)		# チェックサムOK
+		self.data = np.zeros(n, dtype=bool)			# データレコード
+		self.rtype = np.zeros(n, dtype=np.int64)	# レコードタイプ
+		self.addr = np.zeros(n, dtype=np.int64)		# アドレス(Intel HEXはオフセット)
+		self.data_len = np.zeros(n, dtype=np.int64)	# データ長(データレコード以外は0)
+		self.data_off = np.zeros(n, dtype=np.int64)	# payload内のデータ開始位置
+		# データレコードのデータ部を行順に連結したもの
+		self.payload = b""
+
+	def failed_lines(self):
+		"""
+		チェックサムエラーとなった行番号(0始まり)のリスト
+		"""
+		return self.line[~self.valid].tolist()
+
+
+def _split_lines(chunk: bytes):
+	"""
+	チャンクを行に分割し、前後の空白を除いた(行番号, 開始位置, 終了位置)を返す
+	"""
+	arr = np.frombuffer(chunk, dtype=np.uint8)
+	nl = np.flatnonzero(arr == 0x0A)
+	start = np.concatenate(([0], nl + 1)).astype(np.int64)
+	end = np.concatenate((nl, [len(arr)])).astype(np.int64)
+	line = np.arange(len(start), dtype=np.int64)
+	# 前後の空白を除去
+	while True:
+		mask = (end > start) & _space[arr[np.minimum(start, len(arr) - 1)]]
+		if not mask.any():
+			break
+		start[mask] += 1
+	while True:
+		mask = (end > start) & _space[arr[np.maximum(end - 1, 0)]]
+		if not mask.any():
+			break
+		end[mask] -= 1
+	# 空行は除外
+	keep = end > start
+	return arr, line[keep], start[keep], end[keep]
+
+
+def _decode_hex(arr, start, skip: int, length: int):
+	"""
+	同じ長さの行をまとめてbytesの2次元配列に変換する
+	return: (bytes配列, 不正文字を含む行のマスク)
+	"""
+	pos = start[:, None] + skip + np.arange(length, dtype=np.int64)
+	nib = _hex_lut[arr[pos]]
+	bad = (nib == 0xFF).any(axis=1)
+	byte = (nib[:, 0::2] << 4) | nib[:, 1::2]
+	return byte, bad
+
+
+def _place_payload(rec: bulk_records, groups):
+	"""
+	グループ毎に取り出したデータ部を行順のpayloadに配置する
+	"""
+	data_len = np.where(rec.data & rec.valid, rec.data_len, 0)
+	rec.data_len = data_len
+	rec.data_off = np.concatenate(([0], np.cumsum(data_len)[:-1])).astype(np.int64)
+	payload = np.zeros(int(data_len.sum()), dtype=np.uint8)
+	for idx, data in groups:
+		use = rec.data[idx] & rec.valid[idx]
+		if not use.any() or data.shape[1] == 0:
+			continue
+		idx = idx[use]
+		pos = rec.data_off[idx][:, None] + np.arange(data.shape[1], dtype=np.int64)
+		payload[pos] = data[use]
+	rec.payload = payload.tobytes()
+
+
+def decode_intel_hex(chunk: bytes, data_types) -> bulk_records:
+	"""
+	Intel HEXのチャンクを一括デコードする
+	"""
+	arr, line, start, end = _split_lines(chunk)
+	rec = bulk_records(len(line))
+	rec.line, rec.start, rec.end = line, start, end
+	# 先頭の':'を除いた16進文字数でグループ化
+	hex_len = end - start - 1
+	groups = []
+	for length in np.unique(hex_len).tolist():
+		idx = np.flatnonzero(hex_len == length)
+		# 最小長(バイトカウント/アドレス/タイプ/チェックサム)未満、奇数長は不正
+		if length < 10 or length % 2 != 0:
+			continue
+		byte, bad = _decode_hex(arr, start[idx], 1, length)
+		byte_len = length // 2
+		# バイトカウントと行長の整合、チェックサムチェック
+		sum = byte.sum(axis=1, dtype=np.uint32) & 0xFF
+		ok = ~bad & (byte[:, 0].astype(np.int64) + 5 == byte_len) & (sum == 0)
+		rec.valid[idx] = ok
+		rec.rtype[idx] = byte[:, 3]
+		rec.addr[idx] = (byte[:, 1].astype(np.int64) << 8) | byte[:, 2]
+		rec.data_len[idx] = byte_len - 5
+		groups.append((idx, byte[:, 4:byte_len - 1]))
+	rec.data = rec.valid & np.isin(rec.rtype, data_types)
+	_place_payload(rec, groups)
+	return rec
+
+
+def decode_s_record(chunk: bytes, data_types, addr_len_tbl) -> bulk_records:
+	"""
+	Motorola S-recordのチャンクを一括デコードする
+	アドレス長が定義されていないレコードタイプは
+	データレコード以外として扱い、呼び出し側の通常解析に任せる
+	"""
+	arr, line, start, end = _split_lines(chunk)
+	rec = bulk_records(len(line))
+	rec.line, rec.start, rec.end = line, start, end
+	# レコードタイプ
+	rtype = arr[np.minimum(start + 1, len(arr) - 1)].astype(np.int64) - ord("0")
+	rtype[(end - start < 2) | (rtype < 0) | (rtype > 9)] = -1
+	rec.rtype = rtype
+	# アドレス長
+	addr_len = np.full(len(line), -1, dtype=np.int64)
+	for type, size in enumerate(addr_len_tbl):
+		if size is not None:
+			addr_len[rtype == type] = size
+	# 不明なレコードは通常解析に任せる
+	unknown = addr_len < 0
+	rec.valid[unknown] = True
+	# 先頭の'Sn'を除いた16進文字数とアドレス長でグループ化
+	hex_len = end - start - 2
+	groups = []
+	key = hex_len * 8 + addr_len
+	for k in np.unique(key[~unknown]).tolist():
+		idx = np.flatnonzero((key == k) & ~unknown)
+		length, size = k // 8, k % 8
+		if length < 2 * (size + 2) or length % 2 != 0:
+			continue
+		byte, bad = _decode_hex(arr, start[idx], 2, length)
+		byte_len = length // 2
+		# バイトカウントと行長の整合、チェックサムチェック
+		sum = byte.sum(axis=1, dtype=np.uint32) & 0xFF
+		ok = ~bad & (byte[:, 0].astype(np.int64) + 1 == byte_len) & (sum == 0xFF)
+		rec.valid[idx] = ok
+		addr = np.zeros(len(idx), dtype=np.int64)
+		for i in range(size):
+			addr = (addr << 8) | byte[:, 1 + i]
+		rec.addr[idx] = addr
+		rec.data_len[idx] = byte_len - size - 2
+		groups.append((idx, byte[:, 1 + size:byte_len - 1]))
+	rec.data = rec.valid & ~unknown & np.isin(rtype, data_types)
+	_place_payload(rec, groups)
+	return rec
+
+
+def scan_intel_hex(chunk: bytes) -> bulk_records:
+	"""
+	Intel HEXのチャンクのヘッダ(バイトカウント/アドレス/タイプ)だけを一括デコードする(遅延解析用)
+	データ長1以上のデータレコード(00)で行長が整合するものをdataとし、データ部はデコードしない
+	チェックサムは検査しない(データ部のデコード時に検査する)
+	"""
+	arr, line, start, end = _split_lines(chunk)
+	rec = bulk_records(len(line))
+	rec.line, rec.start, rec.end = line, start, end
+	hex_len = end - start - 1
+	idx = np.flatnonzero(hex_len >= 10)
+	byte, bad = _decode_hex(arr, start[idx], 1, 8)
+	count = byte[:, 0].astype(np.int64)
+	data = ~bad & (arr[start[idx]] == ord(":")) & (byte[:, 3] == 0) & (count > 0) & (hex_len[idx] == count * 2 + 10)
+	rec.data[idx] = data
+	rec.rtype[idx] = byte[:, 3]
+	rec.addr[idx] = (byte[:, 1].astype(np.int64) << 8) | byte[:, 2]
+	rec.data_len[idx] = np.where(data, count, 0)
+	return rec
+
+
+def scan_s_record(chunk: bytes, data_types, addr_len_tbl) -> bulk_records:
+	"""
+	Motorola S-recordのチャンクのヘッダ(バイトカウント/アドレス)だけを一括デコードする(遅延解析用)
+	データ長1以上のデータレコードで行長が整合するものをdataとし、データ部はデコードしない
+	"""
+	arr, line, start, end = _split_lines(chunk)
+	rec = bulk_records(len(line))
+	rec.line, rec.start, rec.end = line, start, end
+	hex_len = end - start - 2
+	rtype = arr[np.minimum(start + 1, len(arr) - 1)].astype(np.int64) - ord("0")
+	rtype[(end - start < 2) | (arr[start] != ord("S"))] = -1
+	rec.rtype = rtype
+	for type in data_types:
+		size = addr_len_tbl[type]
+		idx = np.flatnonzero((rtype == type) & (hex_len >= 2 * (size + 2)))
+		byte, bad = _decode_hex(arr, start[idx], 2, 2 * (size + 1))
+		count = byte[:, 0].astype(np.int64)
+		addr = np.zeros(len(idx), dtype=np.int64)
+		for i in range(size):
+			addr = (addr << 8) | byte[:, 1 + i]
+		data_len = count - size - 1
+		data = ~bad & (data_len > 0) & (hex_len[idx] == count * 2 + 2)
+		rec.data[idx] = data
+		rec.addr[idx] = addr
+		rec.data_len[idx] = np.where(data, data_len, 0)
+	return rec
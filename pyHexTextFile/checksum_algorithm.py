@@ -0,0 +1,269 @@
+"""
+チェックサムアルゴリズム
+各アルゴリズムはデータセグメントをupdate()、blank埋めの空白領域をfill()で受け取り、
+空白領域を展開せずに計算する
+"""
+import abc
+import zlib
+import inspect
+import binascii
+
+
+class checksum_algorithm(abc.ABC):
+	"""
+	チェックサムアルゴリズムの基底クラス
+	update()/fill()/result()を実装していないアルゴリズムはインスタンス化できない
+	"""
+	# 結果のビット幅
+	width: int = 32
+	# 2の補数を取れるアルゴリズム(総和系)
+	twos_compl: bool = False
+	# 結果がデータ毎の計算結果の和(mod 2^width)になるアルゴリズム
+	# データの差し替えを差分(追加分-削除分)で計算できる
+	additive: bool = False
+
+	def __init__(self, addr_begin: int) -> None:
+		# 計算範囲の開始アドレス(ワード境界の基準)
+		self.addr_begin = addr_begin
+
+	@abc.abstractmethod
+	def update(self, addr: int, data: memoryview):
+		"""
+		addrから始まるデータを計算に加える
+		"""
+
+	@abc.abstractmethod
+	def fill(self, addr: int, value: int, length: int):
+		"""
+		addrから始まるlengthバイトのvalue埋め領域を計算に加える
+		"""
+
+	@abc.abstractmethod
+	def result(self) -> int:
+		"""
+		計算結果
+		"""
+
+
+class byte_sum(checksum_algorithm):
+	"""
+	バイト単位の総和(32bit)
+	"""
+	width = 32
+	twos_compl = True
+	additive = True
+
+	def __init__(self, addr_begin: int) -> None:
+		super().__init__(addr_begin)
+		self.sum = 0
+
+	def update(self, addr: int, data: memoryview):
+		self.sum += sum(data)
+
+	def fill(self, addr: int, value: int, length: int):
+		self.sum += value * length
+
+	def result(self) -> int:
+		return self.sum & 0xFFFFFFFF
+
+
+class word_sum(checksum_algorithm):
+	"""
+	ワード単位の総和
+	ワードは計算範囲の開始アドレスから区切り、末尾の端数は0で埋める
+	総和はワード幅で切り捨てる
+	バイトの位置(レーン)毎に総和を取り、最後に重み付けして合算する
+	"""
+	twos_compl = True
+	additive = True
+	# ワードのバイト数
+	word_size: int = 2
+	# バイトオーダ
+	byteorder: str = 'little'
+
+	def __init__(self, addr_begin: int) -> None:
+		super().__init__(addr_begin)
+		self.lane_sum = [0] * self.word_size
+
+	def update(self, addr: int, data: memoryview):
+		size = self.word_size
+		rel = addr - self.addr_begin
+		for lane in range(size):
+			self.lane_sum[lane] += sum(data[(lane - rel) % size::size])
+
+	def fill(self, addr: int, value: int, length: int):
+		size = self.word_size
+		rel_begin = addr - self.addr_begin
+		rel_end = rel_begin + length
+		for lane in range(size):
+			count = (rel_end - lane + size - 1) // size - (rel_begin - lane + size - 1) // size
+			self.lane_sum[lane] += value * count
+
+	def result(self) -> int:
+		data_sum = 0
+		for lane, lane_sum in enumerate(self.lane_sum):
+			if self.byteorder == 'little':
+				data_sum += lane_sum << (8 * lane)
+			else:
+				data_sum += lane_sum << (8 * (self.word_size - 1 - lane))
+		return data_sum & ((1 << self.width) - 1)
+
+
+class word16_le(word_sum):
+	width = 16
+	word_size = 2
+	byteorder = 'little'
+
+
+class word16_be(word_sum):
+	width = 16
+	word_size = 2
+	byteorder = 'big'
+
+
+class word32_le(word_sum):
+	width = 32
+	word_size = 4
+	byteorder = 'little'
+
+
+class word32_be(word_sum):
+	width = 32
+	word_size = 4
+	byteorder = 'big'
+
+
+class crc_algorithm(checksum_algorithm):
+	"""
+	CRCの基底クラス
+	_kernel(data, crc)でデータを処理する
+	空白領域は、1バイト処理するときのCRC値の変化をアフィン写像として求め、
+	べき乗(二乗の繰り返し)でlengthバイト分を計算する
+	"""
+	# 初期値
+	init: int = 0
+	# この長さ以下の空白領域はそのまま_kernel()で処理する
+	fill_block_size: int = 64 * 1024
+	# 空白値毎の写像のべき乗のキャッシュ
+	_fill_maps = None
+
+	def __init__(self, addr_begin: int) -> None:
+		super().__init__(addr_begin)
+		self.crc = self.init
+
+	@staticmethod
+	@abc.abstractmethod
+	def _kernel(data, crc: int) -> int:
+		"""
+		dataを処理した後のCRC値
+		"""
+
+	def update(self, addr: int, data: memoryview):
+		self.crc = self._kernel(data, self.crc)
+
+	def fill(self, addr: int, value: int, length: int):
+		if length <= self.fill_block_size:
+			self.crc = self._kernel(bytes([value]) * length, self.crc)
+			return
+		# 2^bitバイト分の写像を順に適用
+		maps = self._fill_map_powers(value)
+		bit = 0
+		while length:
+			if length & 1:
+				self.crc = self._apply(maps[bit], self.crc)
+			length >>= 1
+			bit += 1
+
+	def result(self) -> int:
+		return self.crc
+
+	@classmethod
+	def _fill_map_powers(cls, value: int):
+		"""
+		valueを2^iバイト処理する写像(i=0～63)のリストを返す
+		写像は(各ビットの行き先のリスト, 定数項)で表す
+		"""
+		if cls._fill_maps is None:
+			cls._fill_maps = {}
+		if value not in cls._fill_maps:
+			byte = bytes([value])
+			const = cls._kernel(byte, 0)
+			cols = [cls._kernel(byte, 1 << i) ^ const for i in range(cls.width)]
+			maps = [(cols, const)]
+			for _ in range(63):
+				maps.append(cls._compose(maps[-1], maps[-1]))
+			cls._fill_maps[value] = maps
+		return cls._fill_maps[value]
+
+	@staticmethod
+	def _apply_linear(cols, crc: int) -> int:
+		value = 0
+		bit = 0
+		while crc:
+			if crc & 1:
+				value ^= cols[bit]
+			crc >>= 1
+			bit += 1
+		return value
+
+	@classmethod
+	def _apply(cls, fill_map, crc: int) -> int:
+		cols, const = fill_map
+		return cls._apply_linear(cols, crc) ^ const
+
+	@classmethod
+	def _compose(cls, first, second):
+		"""
+		firstを適用した後にsecondを適用する写像を作成する
+		"""
+		cols = [cls._apply_linear(second[0], col) for col in first[0]]
+		const = cls._apply(second, first[1])
+		return cols, const
+
+
+class crc32(crc_algorithm):
+	"""
+	CRC-32 (ISO-HDLC, zlib互換)
+	"""
+	width = 32
+	init = 0
+
+	@staticmethod
+	def _kernel(data, crc: int) -> int:
+		return zlib.crc32(data, crc)
+
+
+class crc16_ccitt(crc_algorithm):
+	"""
+	CRC-16/CCITT-FALSE (多項式0x1021, 初期値0xFFFF)
+	"""
+	width = 16
+	init = 0xFFFF
+
+	@staticmethod
+	def _kernel(data, crc: int) -> int:
+		return binascii.crc_hqx(data, crc)
+
+
+# アルゴリズム名→アルゴリズムのテーブル
+checksum_algorithm_tbl = {
+	"byte_sum": byte_sum,
+	"word16_le": word16_le,
+	"word16_be": word16_be,
+	"word32_le": word32_le,
+	"word32_be": word32_be,
+	"crc16_ccitt": crc16_ccitt,
+	"crc32": crc32,
+}
+
+
+def register_algorithm(name: str, algorithm: type):
+	"""
+	アルゴリズムを追加する
+	algorithm: checksum_algorithmの派生クラス(抽象メソッドを全て実装したもの)
+	"""
+	if not (isinstance(algorithm, type) and issubclass(algorithm, checksum_algorithm)):
+		raise Exception(f"not a checksum algorithm: {algorithm!r}")
+	if inspect.isabstract(algorithm):
+		raise Exception(f"checksum algorithm is not fully implemented: {algorithm.__name__}")
+	checksum_algorithm_tbl[name] = algorithm
@@ -0,0 +1,69 @@
+import bisect
+from array import array
+
+
+class checksum_index:
+	"""
+	任意範囲のデータ総和を二分探索と累積和で求めるインデックス
+	データセグメントをblock_size単位のブロックに分割し、
+	ブロック開始アドレスとブロック毎の累積和/累積データ長を保持する
+	範囲の端にかかるブロックだけ部分的に総和を計算する
+	"""
+	# ブロックサイズ：範囲端の部分計算の最大サイズ
+	block_size: int = 1024
+
+	def __init__(self, segments) -> None:
+		"""
+		segments: アドレス昇順で重なりのない(開始アドレス, memoryview)
+		"""
+		# セグメントデータ
+		self._data = []
+		# ブロック情報
+		self._begin = array('Q')		# 開始アドレス
+		self._end = array('Q')			# 終了アドレス+1
+		self._seg = array('Q')			# セグメント番号
+		self._offset = array('Q')		# セグメント内の開始位置
+		self._cum_sum = array('Q', [0])	# 先頭から直前ブロックまでの総和
+		self._cum_len = array('Q', [0])	# 先頭から直前ブロックまでのデータ長
+		#
+		data_sum = 0
+		data_len = 0
+		for addr, data in segments:
+			seg = len(self._data)
+			self._data.append(data)
+			for offset in range(0, len(data), self.block_size):
+				block = data[offset:offset + self.block_size]
+				self._begin.append(addr + offset)
+				self._end.append(addr + offset + len(block))
+				self._seg.append(seg)
+				self._offset.append(offset)
+				data_sum += sum(block)
+				data_len += len(block)
+				self._cum_sum.append(data_sum)
+				self._cum_len.append(data_len)
+
+	def _block(self, index: int) -> memoryview:
+		offset = self._offset[index]
+		return self._data[self._seg[index]][offset:offset + self._end[index] - self._begin[index]]
+
+	def data_sum(self, addr_begin: int, addr_end: int):
+		"""
+		addr_begin～addr_endに含まれるデータの(総和, バイト数)を返す
+		"""
+		# 範囲にかかるブロック[first, last)を探索
+		first = bisect.bisect_right(self._end, addr_begin)
+		last = bisect.bisect_right(self._begin, addr_end)
+		if first >= last:
+			return 0, 0
+		data_sum = self._cum_sum[last] - self._cum_sum[first]
+		data_len = self._cum_len[last] - self._cum_len[first]
+		# 範囲外にはみ出した部分を除外
+		if self._begin[first] < addr_begin:
+			out = self._block(first)[:addr_begin - self._begin[first]]
+			data_sum -= sum(out)
+			data_len -= len(out)
+		if self._end[last - 1] - 1 > addr_end:
+			out = self._block(last - 1)[addr_end + 1 - self._begin[last - 1]:]
+			data_sum -= sum(out)
+			data_len -= len(out)
+		return data_sum, data_len
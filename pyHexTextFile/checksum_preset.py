@@ -0,0 +1,44 @@
+"""
+チェックサム計算設定のプリセット
+GUIとCLIで共通に使用する
+"""
+import enum
+from typing import NamedTuple, Dict, List
+
+from .hex_text_file import checksum_config
+
+
+class twos_compl_select(enum.Enum):
+	enable = enum.auto()
+	disable = enum.auto()
+	both = enum.auto()
+
+class checksum_preset_type(NamedTuple):
+	blank: int = 0xFF
+	twos_compl: twos_compl_select = twos_compl_select.enable
+	addr_begin: int = 0
+	addr_end: int = 0
+	algorithm: str = "byte_sum"
+
+
+checksum_preset: Dict[str, checksum_preset_type] = {
+	"<default>": checksum_preset_type(None, twos_compl_select.enable, None, None),
+	"preset1": checksum_preset_type(0xFF, twos_compl_select.both, 0x00000000, 0x0000FFFF),
+	"preset2": checksum_preset_type(0xFF, twos_compl_select.enable, 0x00003000, 0x0007FFFF),
+}
+
+
+def preset_configs(preset: checksum_preset_type, blank_default: int = 0xFF) -> List[checksum_config]:
+	"""
+	プリセットをチェックサム計算設定のリストに展開する
+	2の補数「あり＋なし」は2つの設定(あり, なし)になる
+	"""
+	blank = preset.blank
+	if blank is None:
+		blank = blank_default
+	twos_compl_list = {
+		twos_compl_select.enable: [True],
+		twos_compl_select.disable: [False],
+		twos_compl_select.both: [True, False],
+	}[preset.twos_compl]
+	return [checksum_config(blank, twos_compl, preset.addr_begin, preset.addr_end, preset.algorithm) for twos_compl in twos_compl_list]
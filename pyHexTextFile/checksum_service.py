@@ -0,0 +1,314 @@
+"""
+ローカルのチェックサム計算サービス
+複数のビルドエージェントから同じHEXファイルを解析する重複をなくすため、
+解析済みイメージをメモリ上のLRUキャッシュ(ファイル内容のハッシュがキー)に保持して共有する
+
+プロトコル: Unixソケット/localhostのTCPで1行1リクエストのJSON
+  {"id": 1, "op": "load", "file": "/abs/path.hex"}
+  {"id": 2, "op": "checksum", "file": "/abs/path.hex", "configs": [{"blank": 255, "algorithm": "crc32"}, ...]}
+  {"id": 3, "op": "status"}
+応答: {"id": 1, "ok": true, ...} / {"id": 1, "ok": false, "error": "..."}
+
+起動: python -m pyHexTextFile.checksum_service --unix /tmp/pyHexTextFile.sock
+      python -m pyHexTextFile.checksum_service --port 8765
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import pathlib
+import argparse
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import List
+
+from .hex_loader import hex_file_type, load_hex_file
+from .bin_file import bin_file
+from .hex_text_file import checksum_config
+from .parse_cache import content_digest
+
+
+def _stat_key(file_path: str):
+	"""
+	ファイルの変更検出に使用する(サイズ, 更新日時)
+	"""
+	stat = os.stat(file_path)
+	return stat.st_size, stat.st_mtime_ns
+
+
+def _parse_file(file_path: str, stat_key):
+	"""
+	プロセスプールのワーカーで解析する
+	stat_key: ハッシュを計算したときの(サイズ, 更新日時)(ファイル内容は再度ハッシュしない)
+	ハッシュ計算後/解析中にファイルが変更されたときはキャッシュしないようFalseを返す
+	return: (ハッシュ計算時から変更されていないか, 解析クラス, 属性, パスの属性, イメージ)
+	"""
+	unchanged = _stat_key(file_path) == stat_key
+	# 圧縮ファイル(.gz/.bz2/.xz)は展開しながら解析する
+	hex_file = load_hex_file(pathlib.Path(file_path))
+	unchanged = unchanged and _stat_key(file_path) == stat_key
+	state, paths = hex_file._get_state()
+	return unchanged, type(hex_file), state, paths, hex_file.image
+
+
+class checksum_service:
+	"""
+	解析済みイメージのLRUキャッシュを持つチェックサム計算サービス
+	解析はプロセスプール、チェックサム計算はスレッドで実行してイベントループを止めない
+	同じファイル内容の解析要求が同時に来たときは1回だけ解析する
+	"""
+	def __init__(self, max_bytes: int = 1024 * 1024 * 1024, jobs: int = None, max_digests: int = 4096) -> None:
+		"""
+		max_bytes: キャッシュするイメージの合計サイズ上限[byte]
+		jobs: 解析プロセス数(None:CPU数)
+		max_digests: 保持するファイル内容のハッシュの上限数(古いものから破棄する)
+		"""
+		self.max_bytes = max_bytes
+		self.max_digests = max_digests
+		# (クラス名, ファイル内容のハッシュ)→解析結果
+		self._cache = OrderedDict()
+		self._cache_bytes = 0
+		# 解析中の要求
+		self._loading = {}
+		# パス→(サイズ, 更新日時, ファイル内容のハッシュ)
+		# パス毎に最新の1つだけ保持し、max_digestsを超えたら最も古く参照したものから破棄する
+		self._digests = OrderedDict()
+		self._digests_lock = threading.Lock()
+		self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+		self._threads = concurrent.futures.ThreadPoolExecutor()
+		# 統計
+		self.hits = 0
+		self.misses = 0
+
+	def close(self):
+		self._pool.shutdown()
+		self._threads.shutdown()
+
+	def _digest(self, file_path: str):
+		"""
+		ファイル内容のハッシュ(パス/サイズ/更新日時が同じなら前回の値を使用する)
+		return: (ハッシュ, ハッシュを計算したときの(サイズ, 更新日時))
+		"""
+		stat_key = _stat_key(file_path)
+		with self._digests_lock:
+			cached = self._digests.get(file_path)
+			if cached is not None and cached[:2] == stat_key:
+				self._digests.move_to_end(file_path)
+				return cached[2], stat_key
+		digest = content_digest(pathlib.Path(file_path))
+		with self._digests_lock:
+			self._digests[file_path] = (*stat_key, digest)
+			self._digests.move_to_end(file_path)
+			while len(self._digests) > self.max_digests:
+				self._digests.popitem(last=False)
+		return digest, stat_key
+
+	async def load(self, file_path: str):
+		"""
+		解析済みのインスタンスを返す(キャッシュに無ければ解析する)
+		"""
+		return (await self._load(file_path))[0]
+
+	async def _load(self, file_path: str):
+		"""
+		return: キャッシュのエントリ[解析済みのインスタンス, 計算設定→チェックサム(Future)]
+		"""
+		loop = asyncio.get_running_loop()
+		cls = hex_file_type(pathlib.Path(file_path))
+		digest, stat_key = await loop.run_in_executor(self._threads, self._digest, file_path)
+		key = (cls.__name__, digest)
+		entry = self._cache.get(key)
+		if entry is not None:
+			self._cache.move_to_end(key)
+			self.hits += 1
+			return entry
+		loading = self._loading.get(key)
+		if loading is not None:
+			# 解析中の要求に合流するときは解析しないためヒットとする
+			self.hits += 1
+		else:
+			self.misses += 1
+			loading = asyncio.ensure_future(self._parse(key, file_path, stat_key))
+			self._loading[key] = loading
+			loading.add_done_callback(lambda _: self._loading.pop(key, None))
+		return await asyncio.shield(loading)
+
+	async def _parse(self, key, file_path: str, stat_key):
+		"""
+		ファイルを解析してキャッシュする(stat_key: ハッシュを計算したときの(サイズ, 更新日時))
+		"""
+		loop = asyncio.get_running_loop()
+		if hex_file_type(pathlib.Path(file_path)) is bin_file:
+			# バイナリファイルは解析せずmmapで参照する
+			hex_file = await loop.run_in_executor(self._threads, bin_file, pathlib.Path(file_path))
+			unchanged = True
+		else:
+			unchanged, cls, state, paths, image = await loop.run_in_executor(self._pool, _parse_file, file_path, stat_key)
+			hex_file = cls._restore(state, paths, image)
+		entry = [hex_file, {}]
+		if unchanged:
+			self._store(key, entry)
+		return entry
+
+	def _store(self, key, entry):
+		size = entry[0].image.nbytes()
+		if size > self.max_bytes:
+			return
+		self._cache[key] = entry
+		self._cache_bytes += size
+		while self._cache_bytes > self.max_bytes:
+			_, evicted = self._cache.popitem(last=False)
+			self._cache_bytes -= evicted[0].image.nbytes()
+
+	async def checksum(self, file_path: str, configs: List[checksum_config]) -> List[int]:
+		"""
+		チェックサムを計算する
+		キャッシュしたイメージの計算結果は保持し、同じ計算設定の要求には再計算しない
+		"""
+		hex_file, checksums = await self._load(file_path)
+		calc = [config for config in dict.fromkeys(configs) if config not in checksums]
+		if calc:
+			loop = asyncio.get_running_loop()
+			future = loop.run_in_executor(self._threads, hex_file.checksum_multi, calc)
+			for index, config in enumerate(calc):
+				checksums[config] = asyncio.ensure_future(self._result(future, index))
+		try:
+			return [await asyncio.shield(checksums[config]) for config in configs]
+		except Exception:
+			# 失敗した計算は保持しない
+			for config in configs:
+				result = checksums.get(config)
+				if result is not None and result.done() and (result.cancelled() or result.exception() is not None):
+					del checksums[config]
+			raise
+
+	@staticmethod
+	async def _result(future, index: int) -> int:
+		return (await future)[index]
+
+	async def request(self, request: dict) -> dict:
+		"""
+		1リクエストを処理して応答を返す
+		"""
+		op = request.get("op")
+		if op == "load":
+			hex_file = await self.load(request["file"])
+			return {
+				"type": type(hex_file).__name__,
+				"addr_begin": hex_file._address_begin,
+				"addr_end": hex_file._address_end,
+			}
+		if op == "checksum":
+			configs = [checksum_config(**config) for config in request.get("configs", [{}])]
+			return {"checksums": await self.checksum(request["file"], configs)}
+		if op == "status":
+			return {
+				"entries": len(self._cache),
+				"cache_bytes": self._cache_bytes,
+				"max_bytes": self.max_bytes,
+				"hits": self.hits,
+				"misses": self.misses,
+			}
+		raise Exception(f"unknown op: {op}")
+
+	async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		"""
+		1接続分のリクエストを処理する
+		"""
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				request_id = None
+				try:
+					request = json.loads(line)
+					request_id = request.get("id")
+					response = await self.request(request)
+					response["ok"] = True
+				except Exception as e:
+					response = {"ok": False, "error": str(e) or type(e).__name__}
+				response["id"] = request_id
+				writer.write(json.dumps(response).encode() + b"\n")
+				await writer.drain()
+		except (ConnectionError, asyncio.CancelledError):
+			# 接続中に終了したときは接続を閉じて終了する
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self, unix_path: str = None, host: str = "127.0.0.1", port: int = None):
+		"""
+		unix_pathを指定したときはUnixソケット、それ以外はTCP(host:port)で待ち受ける
+		SIGTERMを受け取ると待ち受けを終了する(呼び出し側でclose()してプロセスプールを終了する)
+		"""
+		if unix_path is not None:
+			server = await asyncio.start_unix_server(self.handle, unix_path)
+		else:
+			server = await asyncio.start_server(self.handle, host, port)
+		stop = asyncio.Event()
+		if sys.platform != "win32":
+			asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+		async with server:
+			await stop.wait()
+
+
+class checksum_client:
+	"""
+	checksum_serviceのクライアント
+	address: "unix:<パス>" または "<host>:<port>" または "<port>"
+	"""
+	def __init__(self, address: str) -> None:
+		if address.startswith("unix:"):
+			self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self._sock.connect(address[len("unix:"):])
+		else:
+			host, _, port = address.rpartition(":")
+			self._sock = socket.create_connection((host or "127.0.0.1", int(port)))
+		self._file = self._sock.makefile("rwb")
+		self._id = 0
+
+	def close(self):
+		self._file.close()
+		self._sock.close()
+
+	def request(self, op: str, **params) -> dict:
+		self._id += 1
+		params.update(id=self._id, op=op)
+		self._file.write(json.dumps(params).encode() + b"\n")
+		self._file.flush()
+		response = json.loads(self._file.readline())
+		if not response.get("ok"):
+			raise Exception(response.get("error"))
+		return response
+
+	def load(self, file_path: str) -> dict:
+		return self.request("load", file=os.path.abspath(file_path))
+
+	def checksum(self, file_path: str, configs: List[checksum_config]) -> List[int]:
+		return self.request("checksum", file=os.path.abspath(file_path), configs=[config._asdict() for config in configs])["checksums"]
+
+
+def main(argv: List[str] = None) -> int:
+	parser = argparse.ArgumentParser(prog="pyHexTextFile.checksum_service", description="チェックサム計算サービス")
+	parser.add_argument("--unix", help="Unixソケットのパス")
+	parser.add_argument("--host", default="127.0.0.1", help="待ち受けアドレス")
+	parser.add_argument("--port", type=int, default=8765, help="待ち受けポート")
+	parser.add_argument("--max-mb", type=int, default=1024, help="キャッシュするイメージの合計サイズ上限[MB]")
+	parser.add_argument("--jobs", type=int, default=None, help="解析プロセス数(デフォルト:CPU数)")
+	args = parser.parse_args(argv)
+	service = checksum_service(args.max_mb * 1024 * 1024, args.jobs)
+	try:
+		asyncio.run(service.serve(args.unix, args.host, args.port))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		service.close()
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+GUIを使用しないコマンドライン実行
+複数のHEXファイルをプロセスプールで並列に解析/チェックサム計算し、
+1ファイル1行でJSON/CSVを出力する(--mergeは全ファイルをマージした1つのイメージとして計算する)
+起動時間を抑えるため、プロセスプール/CSV出力のモジュールは使用するときに読み込む
+"""
+import os
+import sys
+import glob
+import json
+import pathlib
+import time
+import argparse
+import itertools
+from typing import List, Tuple
+
+from .hex_loader import load_hex_file
+from .hex_merge import hex_merge
+from .hex_text_file import overlap_policy_list
+from .parse_cache import parse_cache
+from .hex_watch import hex_watch
+from .hex_text_file import checksum_config
+from .load_stats import load_stats
+from .checksum_algorithm import checksum_algorithm_tbl
+from .checksum_preset import twos_compl_select, checksum_preset_type, checksum_preset, preset_configs
+
+
+# 出力項目
+output_fields = ["file", "type", "preset", "algorithm", "blank", "addr_begin", "addr_end", "checksum", "checksum_no_twos_compl", "overlaps", "error"]
+
+
+def checksum_file(file_path: str, settings: List[Tuple[str, checksum_preset_type]], use_cache: bool = True, overlap_policy: str = None, stats: bool = False, trace_alloc: bool = False, lazy: bool = False) -> List[dict]:
+	"""
+	1ファイルを解析して全設定のチェックサムを計算し、設定毎に出力項目の辞書を返す
+	全設定のチェックサムはchecksum_multi()で1回の走査で計算する
+	プロセスプールのワーカーで実行する
+	settings: (プリセット名, 設定)のリスト
+	overlap_policy: アドレスが重なるレコードの扱い(指定時は重なりの数を出力する)
+	stats: 計測結果を先頭の結果の"stats"に格納する
+	lazy: 遅延解析する(計算範囲にかかるデータレコードだけデコードする, キャッシュは使用しない)
+	"""
+	try:
+		cache = parse_cache() if use_cache else None
+		file_stats = load_stats(trace_alloc) if stats else None
+		hex_file = load_hex_file(pathlib.Path(file_path), cache, overlap_policy, file_stats, lazy=lazy)
+		# 全設定を計算設定に展開
+		configs = setting_configs(settings)
+		results = make_results(file_path, hex_file, settings, hex_file.checksum_multi(configs))
+		if overlap_policy is not None:
+			for result in results:
+				result["overlaps"] = len(hex_file.overlaps)
+		if file_stats is not None and results:
+			results[0]["stats"] = file_stats.to_dict()
+		return results
+	except Exception as e:
+		return [{"file": file_path, "error": str(e) or type(e).__name__}]
+
+
+def checksum_merge(file_paths: List[str], settings: List[Tuple[str, checksum_preset_type]], use_cache: bool = True, overlap_policy: str = None, merge_policy: str = None, priority: List[int] = None, stats: bool = False, trace_alloc: bool = False, lazy: bool = False) -> List[dict]:
+	"""
+	全ファイルをマージした1つのイメージの全設定のチェックサムを計算し、設定毎に出力項目の辞書を返す
+	fileはファイル名を"+"で連結したものとする
+	merge_policy: ファイル間でアドレスが重なるときの扱い(指定時はファイル間の重なりの数を出力する)
+	priority: ファイル毎の優先度(大きいほど優先)
+	stats: ファイル毎の計測結果のリストを先頭の結果の"stats"に格納する
+	"""
+	file_name = "+".join(file_paths)
+	try:
+		cache = parse_cache() if use_cache else None
+		file_stats = [load_stats(trace_alloc) if stats else None for _ in file_paths]
+		sources = [load_hex_file(pathlib.Path(file_path), cache, overlap_policy, source_stats, lazy=lazy) for file_path, source_stats in zip(file_paths, file_stats)]
+		hex_file = hex_merge(sources, "last" if merge_policy is None else merge_policy, priority)
+		configs = setting_configs(settings)
+		results = make_results(file_name, hex_file, settings, hex_file.checksum_multi(configs))
+		if merge_policy is not None:
+			for result in results:
+				result["overlaps"] = len(hex_file.overlaps)
+		if stats and results:
+			results[0]["stats"] = [source_stats.to_dict() for source_stats in file_stats]
+		return results
+	except Exception as e:
+		return [{"file": file_name, "error": str(e) or type(e).__name__}]
+
+
+def setting_configs(settings: List[Tuple[str, checksum_preset_type]]) -> List[checksum_config]:
+	"""
+	全設定を計算設定に展開する
+	"""
+	return [config for _, setting in settings for config in preset_configs(setting)]
+
+
+def make_results(file_path: str, hex_file, settings: List[Tuple[str, checksum_preset_type]], checksums: List[int]) -> List[dict]:
+	"""
+	設定毎に出力項目の辞書を作成する
+	checksums: setting_configs(settings)の順のチェックサム
+	"""
+	configs = iter(zip(setting_configs(settings), checksums))
+	results = []
+	for name, setting in settings:
+		result = {"file": file_path, "type": type(hex_file).__name__}
+		if name is not None:
+			result["preset"] = name
+		for config, checksum in itertools.islice(configs, len(preset_configs(setting))):
+			blank, addr_begin, addr_end, algorithm = hex_file._checksum_key(config)
+			result["algorithm"] = algorithm
+			result["blank"] = f'{blank:02X}'
+			result["addr_begin"] = f'{addr_begin:08X}'
+			result["addr_end"] = f'{addr_end:08X}'
+			result["checksum" if config.twos_compl else "checksum_no_twos_compl"] = f'{checksum:08X}'
+		results.append(result)
+	return results
+
+
+def _checksum_file_args(args) -> List[dict]:
+	return checksum_file(*args)
+
+
+def expand_files(patterns: List[str]) -> List[str]:
+	"""
+	ファイル名/globパターンを展開する
+	マッチしないパターンはそのまま返し、解析時にエラーとする
+	"""
+	files = []
+	for pattern in patterns:
+		matches = sorted(glob.glob(pattern, recursive=True))
+		if matches:
+			files += [match for match in matches if os.path.isfile(match)]
+		else:
+			files.append(pattern)
+	return files
+
+
+def run(files: List[str], settings: List[Tuple[str, checksum_preset_type]], jobs: int = None, use_cache: bool = True, overlap_policy: str = None, stats: bool = False, trace_alloc: bool = False, lazy: bool = False):
+	"""
+	全ファイルのチェックサムを計算し、入力順にファイル毎の結果のリストを返す
+	jobs: ワーカープロセス数(None:CPU数, 1:プロセスプールを使用しない)
+	stdin("-")を含むときはワーカープロセスから読み込めないためプロセスプールを使用しない
+	"""
+	if jobs is None:
+		jobs = os.cpu_count() or 1
+	args = [(file, settings, use_cache, overlap_policy, stats, trace_alloc, lazy) for file in files]
+	if jobs <= 1 or len(files) <= 1 or "-" in files:
+		yield from map(_checksum_file_args, args)
+		return
+	import concurrent.futures
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		chunksize = max(1, len(args) // (jobs * 4))
+		yield from executor.map(_checksum_file_args, args, chunksize=chunksize)
+
+
+def watch(files: List[str], settings: List[Tuple[str, checksum_preset_type]], output, interval: float = 0.5):
+	"""
+	全ファイルを監視し、変更されたファイルのチェックサムを差分で再計算して出力する
+	output: ファイル毎の結果のリストを出力する関数
+	"""
+	configs = setting_configs(settings)
+	watches = []
+	for file in files:
+		try:
+			file_watch = hex_watch(file, configs)
+		except Exception as e:
+			output([{"file": file, "error": str(e) or type(e).__name__}])
+			continue
+		watches.append((file, file_watch))
+		output(make_results(file, file_watch.hex_file, settings, file_watch.checksums))
+	while True:
+		time.sleep(interval)
+		for file, file_watch in watches:
+			error = file_watch.error
+			if file_watch.poll():
+				output(make_results(file, file_watch.hex_file, settings, file_watch.checksums))
+			elif file_watch.error is not None and file_watch.error is not error:
+				output([{"file": file, "error": str(file_watch.error) or type(file_watch.error).__name__}])
+
+
+def _hex_int(value: str) -> int:
+	return int(value, 16)
+
+
+def _addr_range(value: str):
+	begin, sep, end = value.partition('-')
+	if not sep:
+		raise argparse.ArgumentTypeError(f'invalid range [{value}]')
+	return _hex_int(begin), _hex_int(end)
+
+
+def _priority_list(value: str) -> List[int]:
+	return [int(item) for item in value.split(",")]
+
+
+def make_parser() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog="pyHexTextFile", description="HEXファイルのチェックサムを計算する")
+	parser.add_argument("files", nargs="+", help="HEXファイル(globパターン可, .gz/.bz2/.xzは展開しながら解析, -:標準入力)")
+	parser.add_argument("--preset", choices=list(checksum_preset.keys()), help="計算設定プリセット")
+	parser.add_argument("--all-presets", action="store_true", help="全プリセットで計算する")
+	parser.add_argument("--blank", type=_hex_int, help="空白領域の値(16進)")
+	parser.add_argument("--range", type=_addr_range, dest="addr_range", help="計算範囲(16進) 例: 00000000-0007FFFF")
+	parser.add_argument("--algorithm", choices=list(checksum_algorithm_tbl.keys()), help="チェックサムアルゴリズム")
+	parser.add_argument("--twos-compl", choices=[select.name for select in twos_compl_select], help="2の補数")
+	parser.add_argument("--format", choices=["json", "csv"], default="json", help="出力形式")
+	parser.add_argument("--jobs", type=int, default=None, help="並列プロセス数(デフォルト:CPU数)")
+	parser.add_argument("--overlap", choices=overlap_policy_list, help="アドレスが重なるレコードの扱い")
+	parser.add_argument("--stats", type=pathlib.Path, help="解析/チェックサム計算の計測結果を出力するJSONファイル")
+	parser.add_argument("--trace-alloc", action="store_true", help="計測結果に最大メモリ確保量を含める(解析が遅くなる)")
+	parser.add_argument("--watch", action="store_true", help="ファイルを監視し、変更時にチェックサムを再計算して出力する")
+	parser.add_argument("--interval", type=float, default=0.5, help="監視間隔[s]")
+	parser.add_argument("--no-cache", action="store_true", help="解析結果のキャッシュを使用しない")
+	parser.add_argument("--merge", action="store_true", help="全ファイルをマージした1つのイメージのチェックサムを計算する")
+	parser.add_argument("--merge-overlap", choices=overlap_policy_list, help="マージ時にファイル間でアドレスが重なるときの扱い(デフォルト:後に指定したファイルを優先)")
+	parser.add_argument("--priority", type=_priority_list, help="マージ時のファイル毎の優先度(カンマ区切り, 大きいほど優先)")
+	parser.add_argument("--lazy", action="store_true", help="計算範囲にかかるデータレコードだけデコードする(狭い範囲の計算用, キャッシュは使用しない)")
+	return parser
+
+
+def make_settings(args) -> List[Tuple[str, checksum_preset_type]]:
+	"""
+	プリセットに個別指定を上書きして計算設定を作成する
+	--all-presetsのときは全プリセットをそのまま使用する
+	"""
+	if args.all_presets:
+		return list(checksum_preset.items())
+	preset = checksum_preset[args.preset if args.preset is not None else "<default>"]
+	if preset.blank is None:
+		preset = preset._replace(blank=0xFF)
+	if args.blank is not None:
+		preset = preset._replace(blank=args.blank)
+	if args.addr_range is not None:
+		preset = preset._replace(addr_begin=args.addr_range[0], addr_end=args.addr_range[1])
+	if args.algorithm is not None:
+		preset = preset._replace(algorithm=args.algorithm)
+	if args.twos_compl is not None:
+		preset = preset._replace(twos_compl=twos_compl_select[args.twos_compl])
+	return [(args.preset, preset)]
+
+
+def main(argv: List[str] = None) -> int:
+	args = make_parser().parse_args(argv)
+	settings = make_settings(args)
+	files = expand_files(args.files)
+	#
+	writer = None
+	if args.format == "csv":
+		import csv
+		writer = csv.DictWriter(sys.stdout, output_fields, lineterminator="\n")
+		writer.writeheader()
+	error = False
+	stats = []
+
+	def output(results: List[dict]):
+		nonlocal error
+		for result in results:
+			if "stats" in result:
+				file_stats = result.pop("stats")
+				# マージ時はファイル毎の計測結果のリスト
+				stats.extend(file_stats if isinstance(file_stats, list) else [file_stats])
+			error |= "error" in result
+			if writer is not None:
+				writer.writerow(result)
+			else:
+				print(json.dumps(result, ensure_ascii=False))
+		sys.stdout.flush()
+
+	if args.watch:
+		try:
+			watch(files, settings, output, args.interval)
+		except KeyboardInterrupt:
+			pass
+		return 0
+	if args.merge:
+		file_results = [checksum_merge(files, settings, not args.no_cache, args.overlap, args.merge_overlap, args.priority, args.stats is not None, args.trace_alloc, args.lazy)]
+	else:
+		file_results = run(files, settings, args.jobs, not args.no_cache, args.overlap, args.stats is not None, args.trace_alloc, args.lazy)
+	for results in file_results:
+		output(results)
+	if args.stats is not None:
+		args.stats.write_text(json.dumps(stats, ensure_ascii=False, indent=1))
+	return 1 if error else 0
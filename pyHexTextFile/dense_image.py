@@ -0,0 +1,85 @@
+"""
+NumPyによる展開済みメモリイメージ
+アドレス範囲をblank埋めしたuint8のバッファに展開し、範囲の総和をNumPyの集計で求める
+NumPyが無い環境ではavailable=Falseとなり、hex_text_file.build_dense()は例外を送出する
+"""
+from array import array
+
+from . import lazy_numpy
+from .checksum_algorithm import byte_sum, word_sum
+
+available = lazy_numpy.available
+
+
+def dense_word(algo):
+	"""
+	展開済みイメージで計算できるアルゴリズムの(ワードのバイト数, バイトオーダ)
+	計算できないアルゴリズムはNone
+	"""
+	if issubclass(algo, byte_sum):
+		return 1, 'little'
+	if issubclass(algo, word_sum):
+		return algo.word_size, algo.byteorder
+	return None
+
+
+class dense_image:
+	"""
+	addr_begin～addr_endを展開したメモリイメージ
+	データが無い領域(空白領域)の位置を保持し、異なるblankの計算では空白領域だけ書き換えて再利用する
+	"""
+	def __init__(self, segments, addr_begin: int, addr_end: int, blank: int = 0xFF) -> None:
+		"""
+		segments: addr_begin～addr_endにクリップした、アドレス昇順で重なりのない(開始アドレス, memoryview)
+		"""
+		np = lazy_numpy.load()
+		if np is None:
+			raise Exception("dense image requires NumPy")
+		self.addr_begin = addr_begin
+		self.addr_end = addr_end
+		self.blank = blank
+		self.buffer = np.full(addr_end - addr_begin + 1, blank, dtype=np.uint8)
+		# 空白領域(バッファ内の開始位置, 終了位置+1)
+		self._gap_begin = array('Q')
+		self._gap_end = array('Q')
+		pos_next = 0
+		for addr, data in segments:
+			pos = addr - addr_begin
+			if pos_next < pos:
+				self._gap_begin.append(pos_next)
+				self._gap_end.append(pos)
+			self.buffer[pos:pos + len(data)] = np.frombuffer(data, dtype=np.uint8)
+			pos_next = pos + len(data)
+		if pos_next < len(self.buffer):
+			self._gap_begin.append(pos_next)
+			self._gap_end.append(len(self.buffer))
+
+	def contains(self, addr_begin: int, addr_end: int) -> bool:
+		return self.addr_begin <= addr_begin and addr_end <= self.addr_end
+
+	def set_blank(self, blank: int):
+		"""
+		空白領域をblankで埋め直す
+		"""
+		if blank == self.blank:
+			return
+		for begin, end in zip(self._gap_begin, self._gap_end):
+			self.buffer[begin:end] = blank
+		self.blank = blank
+
+	def data_sum(self, blank: int, addr_begin: int, addr_end: int, word_size: int = 1, byteorder: str = 'little') -> int:
+		"""
+		addr_begin～addr_endの総和(空白領域はblank)
+		word_size>1のときはaddr_beginから区切ったワード単位の総和(末尾の端数は0で埋める)
+		"""
+		np = lazy_numpy.load()
+		self.set_blank(blank)
+		view = self.buffer[addr_begin - self.addr_begin:addr_end - self.addr_begin + 1]
+		if word_size == 1:
+			return int(view.sum(dtype=np.uint64))
+		full = len(view) - len(view) % word_size
+		words = view[:full].view(np.dtype(f'{"<" if byteorder == "little" else ">"}u{word_size}'))
+		data_sum = int(words.sum(dtype=np.uint64))
+		if full < len(view):
+			data_sum += int.from_bytes(view[full:].tobytes().ljust(word_size, b"\0"), byteorder)
+		return data_sum
@@ -0,0 +1,250 @@
+import itertools
+from array import array
+from typing import NamedTuple
+from collections.abc import Mapping
+
+from . import lazy_numpy
+
+
+class image_record(NamedTuple):
+	"""
+	hex_imageが保持するレコードの参照
+	"""
+	addr: int
+	data: memoryview
+	data_len: int
+
+
+class hex_image:
+	"""
+	HEXファイルから読み込んだデータ部だけを保持するメモリイメージ
+	レコードのデータは1つのbytearrayに連結し、
+	レコード毎には開始アドレス/payload内オフセット/データ長だけを
+	配列(array)で保持する
+	coalesce: 直前に追加したレコードとアドレスが連続するレコードは直前のレコードに連結し、
+	          1つのセグメントとして保持する(Falseは追加したレコード毎に保持する)
+	"""
+	# レコード情報の型
+	addr_typecode = 'I'
+	offset_typecode = 'Q'
+	length_typecode = 'I'
+	# segments()でレコード情報をまとめて処理する単位
+	run_chunk = 64 * 1024
+	# NumPyを読み込んでsegments()を処理するレコード数の下限(NumPyが読み込み済みなら常に使用する)
+	numpy_min_records = 4096
+
+	def __init__(self, coalesce: bool = True) -> None:
+		# 全レコードのデータ部を連結したバッファ
+		self.payload = bytearray()
+		# レコード情報(読み込み順)
+		self.addr = array(self.addr_typecode)
+		self.offset = array(self.offset_typecode)
+		self.length = array(self.length_typecode)
+		self.coalesce = coalesce
+		# 最後のレコードに連結できるレコードの開始アドレス(連結しないときはNone)
+		self._join_addr: int = None
+
+	def __len__(self) -> int:
+		return len(self.addr)
+
+	def nbytes(self) -> int:
+		"""
+		データとレコード情報のバッファサイズ[byte]
+		"""
+		return len(self.payload) + sum(len(info) * info.itemsize for info in (self.addr, self.offset, self.length))
+
+	def seal(self):
+		"""
+		追加済みのレコードに以降のレコードを連結しないようにする
+		"""
+		self._join_addr = None
+
+	def add(self, addr: int, data: bytes):
+		"""
+		レコードのデータを追加する
+		"""
+		if not data:
+			return
+		if addr == self._join_addr:
+			self.length[-1] += len(data)
+		else:
+			self.addr.append(addr)
+			self.offset.append(len(self.payload))
+			self.length.append(len(data))
+		self.payload += data
+		if self.coalesce:
+			self._join_addr = addr + len(data)
+
+	def add_bulk(self, addr, length, payload: bytes):
+		"""
+		複数レコードのデータをまとめて追加する
+		payloadは各レコードのデータをlengthの順に連結したもの
+		"""
+		if self.coalesce:
+			# アドレスが連続するレコードを連結(データ長0のレコードは除外)
+			runs = []
+			for a, n in zip(addr, length):
+				if not n:
+					continue
+				if runs and runs[-1][0] + runs[-1][1] == a:
+					runs[-1][1] += n
+				else:
+					runs.append([a, n])
+			if not runs:
+				return
+			join_addr = runs[-1][0] + runs[-1][1]
+			if runs[0][0] == self._join_addr:
+				self.length[-1] += runs[0][1]
+				self.payload += payload[:runs[0][1]]
+				payload = payload[runs[0][1]:]
+				runs = runs[1:]
+			self._join_addr = join_addr
+			addr = [a for a, _ in runs]
+			length = [n for _, n in runs]
+		elif 0 in length:
+			# データ長0のレコードは除外
+			records = [(a, n) for a, n in zip(addr, length) if n]
+			addr = [a for a, _ in records]
+			length = [n for _, n in records]
+		if not length:
+			return
+		self.offset.extend(itertools.accumulate(length[:-1], initial=len(self.payload)))
+		self.addr.extend(addr)
+		self.length.extend(length)
+		self.payload += payload
+
+	def record(self, index: int) -> image_record:
+		"""
+		index番目に追加したレコードを返す
+		"""
+		offset = self.offset[index]
+		length = self.length[index]
+		data = memoryview(self.payload)[offset:offset + length]
+		return image_record(self.addr[index], data, length)
+
+	def record_dict(self) -> "image_record_dict":
+		"""
+		開始アドレスをキーとしたレコードの辞書(読み取り専用のビュー)
+		coalesce=Trueのときはアドレスが連続するレコードを連結したセグメントの辞書になる
+		"""
+		return image_record_dict(self)
+
+	def records(self):
+		"""
+		追加した順にレコードを返す
+		"""
+		for index in range(len(self.addr)):
+			yield self.record(index)
+
+	def segments(self, addr_begin: int, addr_end: int, first_wins: bool = False):
+		"""
+		addr_begin～addr_endにクリップしたデータセグメントを
+		(開始アドレス, memoryview)としてアドレス昇順で返す
+		アドレスが重なるレコードは後から追加したものを優先する
+		first_wins: 先に追加したものを優先する
+		"""
+		runs = self._ordered_runs(addr_begin, addr_end)
+		if runs is not None:
+			yield from runs
+			return
+		payload = memoryview(self.payload)
+		# 範囲内のレコードを抽出してクリップ
+		pieces = []
+		for order, (addr, offset, length) in enumerate(zip(self.addr, self.offset, self.length)):
+			begin = max(addr, addr_begin)
+			end = min(addr + length - 1, addr_end)
+			if begin > end:
+				continue
+			data = payload[offset + begin - addr:offset + end - addr + 1]
+			pieces.append((begin, end, order, data))
+		pieces.sort(key=lambda piece: piece[0])
+		# 重なりのあるレコードをまとめて返す
+		i = 0
+		while i < len(pieces):
+			begin, end, _, data = pieces[i]
+			j = i + 1
+			while j < len(pieces) and pieces[j][0] <= end:
+				end = max(end, pieces[j][1])
+				j += 1
+			if j == i + 1:
+				# 重なりなし
+				yield begin, data
+			else:
+				# 重なりあり：重なった範囲だけ展開して優先度の低いレコードから上書き
+				buff = bytearray(end - begin + 1)
+				for piece in sorted(pieces[i:j], key=lambda piece: piece[2], reverse=first_wins):
+					buff[piece[0] - begin:piece[1] - begin + 1] = piece[3]
+				yield begin, memoryview(buff)
+			i = j
+
+
+	def _ordered_runs(self, addr_begin: int, addr_end: int):
+		"""
+		範囲内のレコードがアドレス昇順で重なりがないとき、
+		アドレスとpayloadが連続するレコードを1つにまとめたセグメントのリストを返す
+		(NumPyが無いとき/レコードが少ないとき/条件を満たさないときはNone)
+		レコード情報はrun_chunkレコード毎に処理して作業メモリを抑える
+		"""
+		if len(self.addr) < 2 or (len(self.addr) < self.numpy_min_records and not lazy_numpy.loaded()):
+			return None
+		np = lazy_numpy.load()
+		if np is None:
+			return None
+		# [開始アドレス, 終了アドレス+1, payload内オフセット]
+		runs = []
+		for chunk in range(0, len(self.addr), self.run_chunk):
+			addr = np.frombuffer(self.addr, dtype=np.dtype(self.addr.typecode))[chunk:chunk + self.run_chunk].astype(np.int64)
+			length = np.frombuffer(self.length, dtype=np.dtype(self.length.typecode))[chunk:chunk + self.run_chunk].astype(np.int64)
+			offset = np.frombuffer(self.offset, dtype=np.dtype(self.offset.typecode))[chunk:chunk + self.run_chunk].astype(np.int64)
+			end = addr + length
+			# 範囲内のレコード
+			index = np.flatnonzero((addr <= addr_end) & (end > addr_begin))
+			if len(index) == 0:
+				continue
+			addr = addr[index]
+			end = end[index]
+			offset = offset[index]
+			if np.any(addr[1:] < end[:-1]) or (runs and addr[0] < runs[-1][1]):
+				return None
+			# アドレス/payloadが前のレコードから連続しない位置で分割
+			split = np.flatnonzero((addr[1:] != end[:-1]) | (offset[1:] != offset[:-1] + (end[:-1] - addr[:-1]))) + 1
+			first = np.concatenate(([0], split))
+			last = np.concatenate((split, [len(addr)])) - 1
+			chunk_runs = zip(addr[first].tolist(), end[last].tolist(), offset[first].tolist())
+			begin, run_end, run_offset = next(chunk_runs)
+			if runs and runs[-1][1] == begin and runs[-1][2] + (runs[-1][1] - runs[-1][0]) == run_offset:
+				# 前のチャンクの最後のセグメントに連結
+				runs[-1][1] = run_end
+			else:
+				runs.append([begin, run_end, run_offset])
+			runs.extend([begin, run_end, run_offset] for begin, run_end, run_offset in chunk_runs)
+		payload = memoryview(self.payload)
+		segments = []
+		for begin, run_end, run_offset in runs:
+			clip_begin = max(begin, addr_begin)
+			clip_end = min(run_end - 1, addr_end)
+			segments.append((clip_begin, payload[run_offset + clip_begin - begin:run_offset + clip_end - begin + 1]))
+		return segments
+
+
+class image_record_dict(Mapping):
+	"""
+	hex_imageのレコードを開始アドレスで参照するビュー
+	レコードは参照時にimage_recordとして作成する
+	同じ開始アドレスのレコードは後から追加したものを返す
+	"""
+	__slots__ = ("_image", "_index")
+
+	def __init__(self, image: hex_image) -> None:
+		self._image = image
+		# 開始アドレス→レコード番号
+		self._index = {addr: index for index, addr in enumerate(image.addr)}
+
+	def __getitem__(self, addr: int) -> image_record:
+		return self._image.record(self._index[addr])
+
+	def __iter__(self):
+		return iter(self._index)
+
+	def __len__(self) -> int:
+		return len(self._index)
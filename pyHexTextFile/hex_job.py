@@ -0,0 +1,139 @@
+"""
+進捗通知/キャンセル可能なジョブ
+解析やチェックサム計算を関数として包み、実行中のスレッドから進捗を通知する
+hex_text_fileはファイル読み込み/データセグメントの走査の区切り毎に
+実行中のジョブ(current_job())に進捗を通知し、キャンセル要求があればjob_cancelledを送出する
+
+使い方:
+  job = hex_job(lambda: hex_file.checksum_multi(configs), progress)
+  job.start()           ワーカースレッドで実行(job.run()は呼び出したスレッドで実行)
+  job.cancel()          キャンセル要求
+  job.result()          完了を待って結果を返す(キャンセル時はjob_cancelled)
+"""
+import threading
+
+
+class job_cancelled(Exception):
+	"""
+	ジョブがキャンセルされたときの例外
+	"""
+	def __init__(self) -> None:
+		super().__init__("job cancelled")
+
+
+# スレッド毎の実行中のジョブ
+_current = threading.local()
+
+
+def current_job() -> "hex_job":
+	"""
+	呼び出したスレッドで実行中のジョブ(無ければNone)
+	"""
+	return getattr(_current, "job", None)
+
+
+class hex_job:
+	"""
+	進捗通知/キャンセル可能なジョブ
+	func: 実行する関数(引数なし)、戻り値がジョブの結果になる
+	progress: 進捗を通知する関数 progress(done, total)
+	          ジョブを実行するスレッドから呼び出す
+	          totalはフェーズ(ファイル読み込み[byte], チェックサム計算範囲[byte])毎の全体量(不明なときはNone)
+	future: 完了時に結果/例外を設定するconcurrent.futures.Future
+	"""
+	# データセグメントを分割して進捗を通知する単位[byte]
+	block_size: int = 4 * 1024 * 1024
+
+	def __init__(self, func, progress=None) -> None:
+		# concurrent.futuresは読み込みに時間がかかるため、ジョブを作成するときに読み込む
+		from concurrent.futures import Future
+		self._func = func
+		self._progress = progress
+		self._cancel = threading.Event()
+		self.future = Future()
+		self.done = 0
+		self.total = None
+
+	def cancel(self):
+		"""
+		キャンセルを要求する
+		実行中のジョブは次の進捗通知でjob_cancelledを送出して終了する
+		"""
+		self._cancel.set()
+		self.future.cancel()
+
+	@property
+	def cancelled(self) -> bool:
+		return self._cancel.is_set()
+
+	def check(self):
+		"""
+		キャンセル要求があればjob_cancelledを送出する
+		"""
+		if self._cancel.is_set():
+			raise job_cancelled()
+
+	def set_total(self, total: int):
+		"""
+		新しいフェーズの全体量を設定して進捗を0に戻す
+		"""
+		self.total = total
+		self.set_done(0)
+
+	def set_done(self, done: int):
+		"""
+		進捗を通知する(キャンセル要求があればjob_cancelled)
+		"""
+		self.done = done
+		if self._progress is not None:
+			self._progress(done, self.total)
+		self.check()
+
+	def advance(self, amount: int):
+		self.set_done(self.done + amount)
+
+	def segments(self, segments, addr_begin: int):
+		"""
+		データセグメントをblock_size単位に分割して返し、
+		呼び出し側が処理し終えたアドレスまで進捗を進める(addr_beginからのバイト数)
+		"""
+		block_size = self.block_size
+		for addr, data in segments:
+			for pos in range(0, len(data), block_size):
+				piece = data[pos:pos + block_size]
+				yield addr + pos, piece
+				self.set_done(addr + pos + len(piece) - addr_begin)
+
+	def run(self):
+		"""
+		呼び出したスレッドでジョブを実行する
+		"""
+		if not self.future.set_running_or_notify_cancel():
+			return self.future
+		prev = current_job()
+		_current.job = self
+		try:
+			result = self._func()
+		except BaseException as exc:
+			self.future.set_exception(job_cancelled() if self.cancelled else exc)
+		else:
+			self.future.set_result(result)
+		finally:
+			_current.job = prev
+		return self.future
+
+	def start(self):
+		"""
+		ワーカースレッドでジョブを実行する
+		"""
+		threading.Thread(target=self.run, daemon=True).start()
+		return self.future
+
+	def result(self, timeout: float = None):
+		"""
+		完了を待って結果を返す
+		キャンセルされたときはjob_cancelled、失敗したときはジョブの例外を送出する
+		"""
+		if self.future.cancelled():
+			raise job_cancelled()
+		return self.future.result(timeout)
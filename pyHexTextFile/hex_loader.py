@@ -0,0 +1,188 @@
+import sys
+import pathlib
+import importlib
+
+from .intel_hex import intel_hex
+from .mot_s_record import mot_s_record
+from .bin_file import bin_file
+from .parse_cache import parse_cache
+from .load_stats import load_stats
+from .hex_job import hex_job
+from .hex_text_file import is_stream
+
+
+# 圧縮形式: 拡張子→(ファイル先頭のマジックナンバー, 展開モジュール名)
+# 展開モジュールは使用するときに読み込む
+compress_tbl = {
+	".gz": (b"\x1f\x8b", "gzip"),
+	".bz2": (b"BZh", "bz2"),
+	".xz": (b"\xfd7zXZ\x00", "lzma"),
+}
+# 先頭のレコードの文字→解析クラス
+sniff_tbl = {
+	b":": intel_hex,
+	b"S": mot_s_record,
+}
+# 拡張子→解析クラス
+suffix_tbl = {
+	".hex": intel_hex,
+	".mot": mot_s_record,
+	".bin": bin_file,
+}
+# テキストの解析クラスだけが受け付ける解析オプション(bin_fileには渡さない)
+parser_options = ("use_numpy", "lazy", "coalesce", "sink")
+
+
+class _prefixed_stream:
+	"""
+	先読みしたデータを先頭に戻したストリーム
+	"""
+	def __init__(self, prefix: bytes, stream) -> None:
+		self._prefix = prefix
+		self._stream = stream
+		self.name = getattr(stream, "name", None)
+
+	def read(self, size: int = -1) -> bytes:
+		if not self._prefix:
+			return self._stream.read(size)
+		if size is None or size < 0:
+			data = self._prefix + self._stream.read()
+			self._prefix = b""
+			return data
+		data = self._prefix[:size]
+		self._prefix = self._prefix[size:]
+		return data
+
+	def read1(self, size: int = -1) -> bytes:
+		if not self._prefix:
+			return getattr(self._stream, "read1", self._stream.read)(size)
+		return self.read(size)
+
+
+def _peek(stream, size: int, skip_space: bool = False):
+	"""
+	ストリームの先頭size文字(skip_space:先頭の空白を除いて)以上を終端まで先読みする
+	return: (先読みしたデータ, 先読みしたデータを先頭に戻したストリーム)
+	"""
+	read = getattr(stream, "read1", stream.read)
+	head = b""
+	while len(head.lstrip() if skip_space else head) < size:
+		chunk = read(64 * 1024)
+		if not chunk:
+			break
+		head += chunk
+	return head, _prefixed_stream(head, stream)
+
+
+def open_hex_stream(stream):
+	"""
+	圧縮されたストリーム(gzip/bz2/xz)をマジックナンバーで判定し、展開するストリームにする
+	圧縮されていないストリームはそのまま読み込むストリームを返す
+	"""
+	head, stream = _peek(stream, max(len(magic) for magic, _ in compress_tbl.values()))
+	for magic, module in compress_tbl.values():
+		if head.startswith(magic):
+			return importlib.import_module(module).open(stream, "rb")
+	return stream
+
+
+def sniff_hex_type(stream):
+	"""
+	ストリームの先頭のレコードから解析クラスを判定する(':':Intel HEX, 'S':Sレコード)
+	return: (解析クラス, 先読みしたデータを先頭に戻したストリーム)
+	"""
+	head, stream = _peek(stream, 1, skip_space=True)
+	cls = sniff_tbl.get(head.lstrip()[:1])
+	if cls is None:
+		raise Exception("unknown hex file format")
+	return cls, stream
+
+
+def hex_file_type(file_path: pathlib.Path):
+	"""
+	ファイルの解析クラスを決定する
+	.binはバイナリファイル(内容からは判定できないため拡張子で決定する)
+	それ以外はファイル先頭のレコードから判定する(拡張子と内容が異なるときは内容を優先する)
+	判定できないときは拡張子(.hex/.mot)から決定する(拡張子も不明ならintel_hex)
+	"""
+	cls = suffix_tbl.get(file_path.suffix)
+	if cls is bin_file:
+		return cls
+	try:
+		with file_path.open("rb") as f:
+			return sniff_hex_type(f)[0]
+	except Exception:
+		# 読み込めない/判定できないファイルは解析時に例外とする
+		return intel_hex if cls is None else cls
+
+
+def _parser_kwargs(cls, kwargs: dict) -> dict:
+	"""
+	解析クラスに渡す引数を返す
+	バイナリファイルはmmap/全体読み込みで参照するため解析オプションを除く
+	"""
+	if cls is bin_file:
+		return {key: value for key, value in kwargs.items() if key not in parser_options}
+	return kwargs
+
+
+def load_hex_stream(stream, overlap_policy: str = None, stats: load_stats = None, cls=None, **kwargs):
+	"""
+	バイナリのストリーム(stdin/パイプ/gzip/bz2/lzmaなど)を先頭から1パスで解析する
+	圧縮形式はマジックナンバーで、フォーマットは先頭のレコードで判定する(キャッシュは使用しない)
+	cls: 解析クラス(Noneは先頭のレコードから判定する, バイナリはbin_fileを指定する)
+	"""
+	stream = open_hex_stream(stream)
+	if cls is None:
+		cls, stream = sniff_hex_type(stream)
+	if stats is not None:
+		kwargs["stats"] = stats
+	hex_file = cls(stream, **_parser_kwargs(cls, kwargs))
+	if overlap_policy is not None:
+		hex_file.set_overlap_policy(overlap_policy)
+	return hex_file
+
+
+def load_hex_file(file_path: pathlib.Path, cache: parse_cache = None, overlap_policy: str = None, stats: load_stats = None, **kwargs):
+	"""
+	HEXファイルを解析する
+	cacheを指定したときはキャッシュを使用する(バイナリファイル/遅延解析/レコードを連結しないときは直接読み込む)
+	overlap_policy: アドレスが重なるレコードの扱い(None:後から読み込んだレコードを優先)
+	stats: 解析/チェックサム計算を計測する(キャッシュの検索/保存はcacheフェーズで計測)
+	file_pathがストリーム/"-"(stdin)/圧縮ファイル(.gz/.bz2/.xz)のときはload_hex_stream()で解析する
+	"""
+	if is_stream(file_path):
+		return load_hex_stream(file_path, overlap_policy, stats, **kwargs)
+	file_path = pathlib.Path(file_path)
+	if str(file_path) == "-":
+		return load_hex_stream(sys.stdin.buffer, overlap_policy, stats, **kwargs)
+	if file_path.suffix in compress_tbl:
+		# 展開しながら解析する(バイナリ以外のフォーマットは内容から判定)
+		cls = bin_file if file_path.with_suffix("").suffix == '.bin' else None
+		with file_path.open("rb") as f:
+			return load_hex_stream(f, overlap_policy, stats, cls, **kwargs)
+	cls = hex_file_type(file_path)
+	if stats is not None:
+		kwargs["stats"] = stats
+	kwargs = _parser_kwargs(cls, kwargs)
+	if cache is not None and cls is not bin_file and not kwargs.get("lazy") and kwargs.get("coalesce", True):
+		if stats is None:
+			hex_file = cache.load(cls, file_path, **kwargs)
+		else:
+			with stats.phase("cache"):
+				hex_file = cache.load(cls, file_path, **kwargs)
+			# キャッシュから読み込んだときは以降のチェックサム計算を計測する
+			hex_file.attach_stats(stats)
+	else:
+		hex_file = cls(file_path, **kwargs)
+	if overlap_policy is not None:
+		hex_file.set_overlap_policy(overlap_policy)
+	return hex_file
+
+
+def load_job(file_path: pathlib.Path, cache: parse_cache = None, overlap_policy: str = None, stats: load_stats = None, progress=None, **kwargs) -> hex_job:
+	"""
+	load_hex_file()をジョブとして作成する(start()/run()で実行)
+	progress(done, total): ファイルの読み込み済みバイト数を通知する(キャッシュから読み込んだときは通知しない)
+	"""
+	return hex_job(lambda: load_hex_file(file_path, cache, overlap_policy, stats, **kwargs), progress)
@@ -0,0 +1,190 @@
+"""
+複数イメージのマージ(ブートローダ + アプリケーション + キャリブレーションなど)
+解析済みの各イメージのデータセグメントを1つの疎なイメージとして扱う
+マージ結果はデータをコピー/展開せず、チェックサム計算/出力時に各イメージのセグメントを
+開始アドレス順に走査して優先度の高いイメージのデータを返す(O(S log S), S:全セグメント数)
+
+マージ: python -m pyHexTextFile.hex_merge boot.mot app.hex calib.hex -o flash.hex
+"""
+import sys
+import heapq
+import pathlib
+import argparse
+from typing import List
+
+from .hex_text_file import hex_text_file, overlap_policy_list
+from .interval_index import interval_index, record_overlap
+from .hex_image import image_record
+from .hex_loader import load_hex_file
+from .parse_cache import parse_cache
+
+
+class hex_merge(hex_text_file):
+	"""
+	複数イメージをマージした疎なイメージ
+	sources: マージするイメージ(解析済みのhex_text_file)
+	overlap_policy: イメージ間でアドレスが重なるときの扱い(overlap_policy_listのいずれか)
+	                first:先に指定したイメージを優先, last/report:後に指定したイメージを優先
+	                イメージ内の重なりは各イメージのoverlap_policyに従う
+	priority: イメージ毎の優先度(大きいほど優先, 同じ優先度はoverlap_policyに従う)
+	overlapsのrecord_overlapのfirst/secondは重なったイメージの番号(sourcesの順)
+	"""
+	def __init__(self, sources: List[hex_text_file], overlap_policy: str = "last", priority: List[int] = None) -> None:
+		super().__init__()
+		if priority is not None and len(priority) != len(sources):
+			raise Exception(f"priority count mismatch: {len(priority)} (sources: {len(sources)})")
+		self.sources = list(sources)
+		self.priority = [0] * len(self.sources) if priority is None else list(priority)
+		self._overlaps: List[record_overlap] = None
+		# アドレス範囲は全イメージの最小/最大
+		for source in self.sources:
+			if source._address_begin is not None:
+				self._update_address_range(source._address_begin, source._address_end)
+		if overlap_policy != self.overlap_policy:
+			# 重なりの検出は全イメージを走査するため、既定(last)以外のときだけ行う
+			self.set_overlap_policy(overlap_policy)
+
+	def _update_address_range(self, addr_begin: int, addr_end: int):
+		if self._address_begin is None or self._address_begin > addr_begin:
+			self._address_begin = addr_begin
+		if self._address_end is None or self._address_end < addr_end:
+			self._address_end = addr_end
+
+	def _ranks(self) -> List[tuple]:
+		"""
+		イメージ毎の優先順位(大きいほど優先)
+		"""
+		order = -1 if self.overlap_policy == "first" else 1
+		return [(priority, order * index) for index, priority in enumerate(self.priority)]
+
+	@property
+	def overlaps(self) -> List[record_overlap]:
+		"""
+		アドレスが重なるイメージの組のリスト(全イメージのセグメントから初回参照時に検出する)
+		"""
+		if self._overlaps is None:
+			source_no = []
+			addr = []
+			length = []
+			for index, source in enumerate(self.sources):
+				if source._address_begin is None:
+					continue
+				for seg_addr, data in source._segments(source._address_begin, source._address_end):
+					source_no.append(index)
+					addr.append(seg_addr)
+					length.append(len(data))
+			# 同じイメージのセグメントは重ならないため、重なりは異なるイメージの組になる
+			self._overlaps = [
+				record_overlap(*sorted((source_no[overlap.first], source_no[overlap.second])), overlap.addr_begin, overlap.addr_end)
+				for overlap in interval_index(addr, length).overlaps
+			]
+		return self._overlaps
+
+	def records_at(self, addr: int) -> List[image_record]:
+		"""
+		addrを含むレコードをイメージの指定順に返す
+		"""
+		return [record for source in self.sources for record in source.records_at(addr)]
+
+	def record_at(self, addr: int) -> image_record:
+		"""
+		addrの値を決めるレコードを優先度の最も高いイメージから返す
+		"""
+		ranks = self._ranks()
+		for index in sorted(range(len(self.sources)), key=ranks.__getitem__, reverse=True):
+			record = self.sources[index].record_at(addr)
+			if record is not None:
+				return record
+		return None
+
+	def _segments(self, addr_begin: int, addr_end: int):
+		"""
+		addr_begin～addr_endにクリップしたデータセグメントを
+		(開始アドレス, memoryview)としてアドレス昇順で返す
+		各イメージのセグメントを開始アドレス順に走査し、
+		有効なセグメントを優先度のヒープで管理して最も優先度の高いセグメントのデータを返す
+		データはコピーせず、各イメージのデータのmemoryviewを返す
+		"""
+		ranks = self._ranks()
+		# (開始アドレス, 終了アドレス+1, 優先順位, データ)
+		pieces = [
+			(addr, addr + len(data), ranks[index], data)
+			for index, source in enumerate(self.sources)
+			for addr, data in source._segments(addr_begin, addr_end)
+			if len(data)
+		]
+		pieces.sort(key=lambda piece: piece[0])
+		# 出力するセグメント: [開始アドレス, 終了アドレス+1, セグメントの番号]
+		runs = []
+		# 有効なセグメントの(優先順位の符号反転, セグメントの番号)
+		heap = []
+		pos = 0
+		i = 0
+		while i < len(pieces) or heap:
+			if not heap:
+				pos = max(pos, pieces[i][0])
+			while i < len(pieces) and pieces[i][0] <= pos:
+				rank = pieces[i][2]
+				heapq.heappush(heap, ((-rank[0], -rank[1]), i))
+				i += 1
+			# 終了したセグメントを除外
+			while heap and pieces[heap[0][1]][1] <= pos:
+				heapq.heappop(heap)
+			if not heap:
+				continue
+			top = heap[0][1]
+			# 次に優先度が変わり得るアドレス(最優先のセグメントの終了/次のセグメントの開始)まで
+			next_pos = pieces[top][1]
+			if i < len(pieces):
+				next_pos = min(next_pos, pieces[i][0])
+			if runs and runs[-1][2] == top and runs[-1][1] == pos:
+				runs[-1][1] = next_pos
+			else:
+				runs.append([pos, next_pos, top])
+			pos = next_pos
+		for begin, end, top in runs:
+			addr, _, _, data = pieces[top]
+			yield begin, data[begin - addr:end - addr]
+
+
+def merge_hex_files(file_paths: List[pathlib.Path], cache: parse_cache = None, overlap_policy: str = None, priority: List[int] = None, **kwargs) -> hex_merge:
+	"""
+	複数のHEXファイルを解析してマージする
+	overlap_policy: イメージ間でアドレスが重なるときの扱い(None:後に指定したファイルを優先)
+	priority: ファイル毎の優先度(大きいほど優先)
+	kwargs: load_hex_file()の引数(各ファイルの解析に使用する)
+	"""
+	sources = [load_hex_file(file_path, cache, **kwargs) for file_path in file_paths]
+	return hex_merge(sources, "last" if overlap_policy is None else overlap_policy, priority)
+
+
+def _priority_list(value: str) -> List[int]:
+	return [int(item) for item in value.split(",")]
+
+
+def main(argv: List[str] = None) -> int:
+	parser = argparse.ArgumentParser(prog="pyHexTextFile.hex_merge", description="複数のHEXファイルをマージして出力する")
+	parser.add_argument("files", type=pathlib.Path, nargs="+", help="マージするファイル(指定順が優先順位)")
+	parser.add_argument("-o", "--output", type=pathlib.Path, required=True, help="出力ファイル(拡張子で形式を決定: .hex/.mot/.bin)")
+	parser.add_argument("--overlap", choices=overlap_policy_list, default="error", help="ファイル間でアドレスが重なるときの扱い")
+	parser.add_argument("--priority", type=_priority_list, help="ファイル毎の優先度(カンマ区切り, 大きいほど優先)")
+	parser.add_argument("--blank", type=lambda value: int(value, 16), help="空白領域の値(16進, .bin)")
+	args = parser.parse_args(argv)
+	# 出力はNumPyを使用するため使用するときに読み込む
+	from .hex_writer import export_tbl
+	export = export_tbl.get(args.output.suffix)
+	if export is None:
+		raise Exception(f"unknown output format: {args.output.suffix}")
+	merged = merge_hex_files(args.files, overlap_policy=args.overlap, priority=args.priority)
+	if args.overlap == "report":
+		for overlap in merged.overlaps:
+			print(f'overlap: {overlap.addr_begin:08X}-{overlap.addr_end:08X} ({args.files[overlap.first]}, {args.files[overlap.second]})')
+	kwargs = {}
+	if args.output.suffix == ".bin" and args.blank is not None:
+		kwargs["blank"] = args.blank
+	export(merged, args.output, **kwargs)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
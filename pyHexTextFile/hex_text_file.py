@@ -1,55 +1,750 @@
+import os
+import re
+import pathlib
+from array import array
+from typing import NamedTuple, List
+from .hex_image import hex_image, image_record
+from .interval_index import interval_index, record_overlap
+from .checksum_index import checksum_index
+from .dense_image import dense_image, dense_word
+from .line_index import line_index
+from .checksum_algorithm import checksum_algorithm_tbl
+from .load_stats import load_stats
+from . import lazy_numpy
+from .hex_job import hex_job, current_job
+
+
+def is_stream(source) -> bool:
+	"""
+	sourceがファイルパスではなくバイナリのファイルライクオブジェクト(stdin/gzip/bz2/lzmaなど)のときTrue
+	"""
+	return hasattr(source, "read")
+
+
+class hex_record_error(Exception):
+	"""
+	不正なレコードを検出したときの例外
+	lines: 不正レコードの行番号(1始まり)のリスト
+	"""
+	def __init__(self, lines) -> None:
+		self.lines = list(lines)
+		super().__init__(f"invalid hex file! (line: {', '.join(str(line) for line in self.lines)})")
+
+
+class record_overlap_error(Exception):
+	"""
+	overlap_policy="error"でアドレスが重なるレコードを検出したときの例外
+	overlaps: record_overlapのリスト
+	"""
+	def __init__(self, overlaps: List[record_overlap]) -> None:
+		self.overlaps = list(overlaps)
+		ranges = ', '.join(f'{overlap.addr_begin:08X}-{overlap.addr_end:08X}' for overlap in self.overlaps[:10])
+		if len(self.overlaps) > 10:
+			ranges += ', ...'
+		super().__init__(f"overlapping records! ({len(self.overlaps)}: {ranges})")
+
+
+# アドレスが重なるレコードの扱い
+#   error : record_overlap_errorを送出する
+#   first : 先に読み込んだレコードを優先する
+#   last  : 後から読み込んだレコードを優先する
+#   report: lastと同じ扱いで、検出した重なりをoverlapsに保持する
+overlap_policy_list = ["error", "first", "last", "report"]
+
+
+class checksum_config(NamedTuple):
+	"""
+	チェックサム計算設定
+	addr_begin/addr_endのNoneは読み込み済みデータの最小／最大アドレスを使用する
+	"""
+	blank: int = 0xFF
+	twos_compl: bool = True
+	addr_begin: int = None
+	addr_end: int = None
+	algorithm: str = "byte_sum"
+
 
 class hex_text_file:
+	# ファイル読み込み単位
+	read_chunk_size: int = 1024 * 1024
+	# use_numpy=Noneのとき一括デコードするファイルサイズの下限
+	# (これより小さいファイルはNumPyの読み込み時間が解析時間を上回る)
+	bulk_min_size: int = 1024 * 1024
+	# ファイルの読み込み範囲(Noneはファイル末尾まで)
+	_read_begin: int = 0
+	_read_end: int = None
+	# 範囲総和インデックス(build_index()で作成)
+	_index: checksum_index = None
+	# 展開済みメモリイメージ(build_dense()で作成)
+	_dense: dense_image = None
+	# 遅延解析の行インデックス(lazy=Trueで作成)
+	_line_index: line_index = None
+	# 重なりのあるレコードの扱い(set_overlap_policy()で設定)
+	overlap_policy: str = "last"
+	# レコード範囲インデックス(_get_interval_index()で作成)
+	_interval_index: interval_index = None
+	# 遅延解析時の行インデックスのレコード範囲インデックス(_get_lazy_interval_index()で作成)
+	_lazy_interval_index: interval_index = None
+	# 解析したデータセグメントを渡す関数(sink指定時はチャンク毎に渡してimageに保持しない)
+	_sink = None
+	# 計測結果(attach_stats()で設定)
+	stats: load_stats = None
+	# 計測結果のレコードタイプ名
+	record_name_format: str = "{}"
+
 	def __init__(self) -> None:
-		self.record_dict = {}
+		self.image = hex_image()
 		# 制御情報
 		self._address: int = 0
 		self._address_begin: int = None
 		self._address_end: int = None
 
+	def attach_stats(self, stats: load_stats) -> load_stats:
+		"""
+		解析/チェックサム計算の計測を開始する
+		"""
+		if self.stats is None:
+			self.stats = stats
+			stats.attach(self)
+		return self.stats
+
+	@property
+	def record_dict(self):
+		"""
+		開始アドレスをキーとしたレコードの辞書(読み取り専用のビュー)
+		アドレスが連続するレコードは解析時に連結したセグメントとして1つのエントリになる
+		"""
+		return self.image.record_dict()
+
+	def _get_state(self):
+		"""
+		解析結果の属性(image以外)を保存用に取り出す
+		return: (int/str/bool/Noneの属性, パスの属性)
+		"""
+		state = {}
+		paths = {}
+		for key, value in vars(self).items():
+			if isinstance(value, pathlib.PurePath):
+				paths[key] = str(value)
+			elif value is None or isinstance(value, (bool, int, str)):
+				state[key] = value
+		return state, paths
+
+	@classmethod
+	def _restore(cls, state: dict, paths: dict, image: hex_image):
+		"""
+		_get_state()で取り出した属性とimageから解析済みのインスタンスを作成する
+		"""
+		hex_file = cls.__new__(cls)
+		hex_file.__dict__.update(state)
+		for key, value in paths.items():
+			setattr(hex_file, key, pathlib.Path(value))
+		hex_file.image = image
+		return hex_file
+
+	def _select_numpy(self, use_numpy: bool, file_path: pathlib.Path) -> bool:
+		"""
+		NumPyで一括デコードするか決定する
+		use_numpy=Noneのときは、NumPyが読み込み済みか、ファイルがbulk_min_size以上なら使用する
+		"""
+		if not lazy_numpy.available:
+			return False
+		if use_numpy is None:
+			if is_stream(file_path):
+				# サイズが分からないストリームは一括デコードする
+				return True
+			try:
+				use_numpy = lazy_numpy.loaded() or os.path.getsize(file_path) >= self.bulk_min_size
+			except OSError:
+				# ファイルが無いときは読み込み時に例外とする
+				use_numpy = False
+		return use_numpy
+
+	def _read_chunks(self, file_path: pathlib.Path):
+		"""
+		ファイルをバイナリのチャンク単位で読み込み、行の途中で切れないように返す
+		file_pathがストリームのときは先頭から順にチャンク単位で読み込んで返す(展開と解析を1パスで行う)
+		ジョブ実行中は読み込んだバイト数を進捗として通知する(ストリームは全体量が不明)
+		"""
+		job = current_job()
+		if is_stream(file_path):
+			if job is not None:
+				job.set_total(None)
+			for chunk in self._split_chunks(file_path.read, None, job):
+				yield chunk
+				self._flush_sink()
+			return
+		with file_path.open("rb") as f:
+			f.seek(self._read_begin)
+			# 読み込み残りサイズ
+			size = None
+			if self._read_end is not None:
+				size = self._read_end - self._read_begin
+			if job is not None:
+				job.set_total(size if size is not None else os.fstat(f.fileno()).st_size - self._read_begin)
+			for chunk in self._split_chunks(f.read, size, job):
+				yield chunk
+				self._flush_sink()
+
+	def _flush_sink(self):
+		"""
+		sink指定時、imageに追加したデータセグメントを(開始アドレス, memoryview)でsinkに渡してimageを空にする
+		"""
+		if self._sink is None or len(self.image) == 0:
+			return
+		image = self.image
+		self.image = hex_image(image.coalesce)
+		for record in image.records():
+			self._sink(record.addr, record.data)
+
+	def _split_chunks(self, read, size: int, job: hex_job):
+		"""
+		read(サイズ)で読み込んだデータを行の区切りでチャンクに分けて返す
+		size: 読み込むサイズ(Noneは終端まで)
+		"""
+		remain = b""
+		while True:
+			read_size = self.read_chunk_size
+			if size is not None:
+				read_size = min(read_size, size)
+			chunk = read(read_size) if read_size > 0 else b""
+			if not chunk:
+				break
+			if size is not None:
+				size -= len(chunk)
+			if job is not None:
+				job.advance(len(chunk))
+			# 最後の改行以降は次のチャンクに続く
+			pos = chunk.rfind(b"\n") + 1
+			if pos == 0:
+				remain += chunk
+				continue
+			yield remain + chunk[:pos]
+			remain = chunk[pos:]
+		if remain:
+			yield remain
+
+	def _read_lines(self, file_path: pathlib.Path):
+		"""
+		ファイルを1行ずつ(行番号, bytes)で返す
+		行番号は1始まり、空行は読み飛ばす
+		"""
+		line_no = 0
+		for chunk in self._read_chunks(file_path):
+			for line in chunk.split(b"\n"):
+				line_no += 1
+				line = line.strip()
+				if line:
+					yield line_no, line
+			# 末尾の改行で分割した空要素は行に数えない
+			if chunk.endswith(b"\n"):
+				line_no -= 1
+
+	def _analyze_lines(self, file_path: pathlib.Path):
+		"""
+		ファイルを1行ずつ読み込んで解析する
+		不正レコードは_analyze_bulk()と同じくファイル全体(エンドレコードまで)を検査してからまとめて報告する
+		"""
+		failed = []
+		for line_no, line in self._read_lines(file_path):
+			if not failed:
+				try:
+					self._analyze_line(line_no, line)
+				except hex_record_error as e:
+					failed += e.lines
+				if self._analyze_done():
+					break
+				continue
+			# 不正レコードがあればimageは作成せず検査だけ続ける
+			try:
+				record = self._decode_line(line_no, line)
+			except hex_record_error as e:
+				failed += e.lines
+				continue
+			if record.record_type == self._bulk_end_type:
+				break
+		if failed:
+			raise hex_record_error(failed)
+
+	def _analyze_bulk(self, file_path: pathlib.Path, decode):
+		"""
+		NumPyでチャンク毎にまとめてデコードして解析する
+		データレコードはまとめてimageに追加し、
+		それ以外のレコードは_analyze_line()で1行ずつ解析する
+		不正レコードはファイル全体を検査してからまとめて報告する
+		"""
+		failed = []
+		line_base = 0
+		for chunk in self._read_chunks(file_path):
+			records = decode(chunk)
+			# エンドレコード以降は検査しない
+			stop = len(records.line)
+			found_end = False
+			if self._bulk_end_type is not None:
+				end = (records.rtype == self._bulk_end_type) & records.valid
+				if end.any():
+					stop = int(end.argmax()) + 1
+					found_end = True
+			failed += [line_base + line + 1 for line in records.line[:stop][~records.valid[:stop]].tolist()]
+			# 不正レコードがあればimageは作成せず検査だけ続ける
+			if not failed:
+				self._analyze_bulk_records(chunk, line_base, records)
+			if found_end or self._analyze_done():
+				break
+			line_base += chunk.count(b"\n")
+		if failed:
+			raise hex_record_error(failed)
+
+	def _analyze_bulk_records(self, chunk: bytes, line_base: int, records, add_data=None):
+		"""
+		一括デコード結果を行順に解析する
+		add_data: 連続したデータレコードを処理する関数(Noneは_analyze_bulk_data)
+		"""
+		if add_data is None:
+			add_data = self._analyze_bulk_data
+		count = len(records.line)
+		others = (~records.data).nonzero()[0].tolist()
+		pos = 0
+		for index in others + [count]:
+			# データレコードの連続部分をまとめて追加
+			if pos < index:
+				add_data(records, pos, index)
+			if index == count:
+				break
+			# データレコード以外は通常解析
+			begin = int(records.start[index])
+			end = int(records.end[index])
+			self._analyze_line(line_base + int(records.line[index]) + 1, chunk[begin:end])
+			if self._analyze_done():
+				break
+			pos = index + 1
+
+	def _analyze_bulk_data(self, records, begin: int, end: int):
+		"""
+		連続したデータレコードをまとめてimageに追加し、
+		読み込み済みデータ内の最大／最小アドレスを更新する
+		imageがレコードを連結するときはアドレスが連続するレコードを連結してから追加する
+		"""
+		addr = records.addr[begin:end] + self._bulk_address_base()
+		data_len = records.data_len[begin:end]
+		data_off = int(records.data_off[begin])
+		size = int(data_len.sum())
+		run_addr = addr
+		run_len = data_len
+		if self.image.coalesce and len(addr) > 1:
+			np = lazy_numpy.load()
+			keep = data_len > 0
+			run_addr = addr[keep]
+			run_len = data_len[keep]
+			if len(run_addr) > 1:
+				first = np.concatenate(([0], np.flatnonzero(run_addr[1:] != run_addr[:-1] + run_len[:-1]) + 1))
+				run_addr = run_addr[first]
+				run_len = np.add.reduceat(run_len, first)
+		self.image.add_bulk(run_addr.tolist(), run_len.tolist(), records.payload[data_off:data_off + size])
+		# アドレス情報更新
+		self._address = int(addr[-1])
+		addr_begin = int(addr.min())
+		addr_end = int((addr + data_len).max()) - 1
+		if self._address_begin is None or self._address_begin > addr_begin:
+			self._address_begin = addr_begin
+		if self._address_end is None or self._address_end < addr_end:
+			self._address_end = addr_end
+
+	def _analyze_lazy(self, file_path: pathlib.Path, scan_bulk=None):
+		"""
+		ファイルを1回走査してデータレコードの行インデックスを作成する(遅延解析)
+		データレコードはヘッダ(アドレス/データ長)だけを読み取り、データ部は範囲の計算時にデコードする
+		データレコード以外(拡張アドレス/エンドレコードなど)は通常通り解析する
+		scan_bulk: チャンクのヘッダを一括デコードする関数(Noneは1行ずつ読み取る)
+		"""
+		if is_stream(file_path):
+			raise Exception("lazy parsing requires a file path (stream is not seekable)")
+		self._lazy_path = file_path
+		self._line_index = line_index()
+		# imageのレコード毎の行インデックスのレコード番号
+		self._lazy_loaded = array('Q')
+		chunk_pos = self._read_begin
+		line_base = 0
+		for chunk in self._read_chunks(file_path):
+			if scan_bulk is not None:
+				self._analyze_bulk_records(chunk, line_base, scan_bulk(chunk), lambda records, begin, end: self._index_bulk_data(chunk_pos, line_base, records, begin, end))
+			else:
+				self._index_lines(chunk, chunk_pos, line_base)
+			if self._analyze_done():
+				break
+			chunk_pos += len(chunk)
+			line_base += chunk.count(b"\n")
+
+	def _index_lines(self, chunk: bytes, chunk_pos: int, line_base: int):
+		"""
+		チャンクを1行ずつ読み取り、データレコードを行インデックスに追加する
+		"""
+		pos = chunk_pos
+		for line_no, raw in enumerate(chunk.split(b"\n"), line_base + 1):
+			line = raw.strip()
+			header = self._scan_line(line) if line else None
+			if header is not None:
+				addr = header[0] + self._bulk_address_base()
+				self._line_index.add(pos + len(raw) - len(raw.lstrip()), len(line), line_no, addr, header[1])
+				self._update_address_range(addr, addr + header[1] - 1)
+			elif line:
+				self._analyze_line(line_no, line)
+				if self._analyze_done():
+					return
+			pos += len(raw) + 1
+
+	def _index_bulk_data(self, chunk_pos: int, line_base: int, records, begin: int, end: int):
+		"""
+		一括デコードした連続データレコードを行インデックスに追加する
+		"""
+		addr = records.addr[begin:end] + self._bulk_address_base()
+		data_len = records.data_len[begin:end]
+		start = records.start[begin:end]
+		self._line_index.extend(
+			(start + chunk_pos).tolist(), (records.end[begin:end] - start).tolist(),
+			(records.line[begin:end] + line_base + 1).tolist(), addr.tolist(), data_len.tolist())
+		self._update_address_range(int(addr.min()), int((addr + data_len).max()) - 1)
+
+	def _update_address_range(self, addr_begin: int, addr_end: int):
+		"""
+		読み込み済みデータ内の最大／最小アドレスを更新する
+		"""
+		if self._address_begin is None or self._address_begin > addr_begin:
+			self._address_begin = addr_begin
+		if self._address_end is None or self._address_end < addr_end:
+			self._address_end = addr_end
+
+	def _scan_line(self, line: bytes):
+		"""
+		データ長1以上のデータレコードの行のとき、ヘッダから(アドレス, データ長)を返す(遅延解析用)
+		アドレスはベースアドレス(_bulk_address_base())からのオフセット
+		データレコード以外はNone
+		"""
+		return None
 
-	def checksum(self, blank: int = 0xFF, twos_compl: bool = True, addr_begin: int = None, addr_end: int = None) -> int:
-		#
+	def _decode_data(self, line_no: int, line: bytes) -> bytes:
+		"""
+		データレコードの行をデコード/検査してデータ部を返す(遅延解析用)
+		デコードできないときはNone(_scan_line()がNoneのフォーマットは遅延解析時もレコードを登録しない)
+		"""
+		return None
+
+	def load_range(self, addr_begin: int, addr_end: int):
+		"""
+		遅延解析時、addr_begin～addr_endにかかる未デコードのデータレコードをデコードしてimageに追加する
+		imageのレコードはファイル内の順に並べる(重なりの優先順を保つ)
+		"""
+		index = self._line_index
+		if index is None:
+			return
+		indexes = index.unloaded(addr_begin, addr_end)
+		if not indexes:
+			return
+		decoded = []
+		job = current_job()
+		with self._lazy_path.open("rb") as f:
+			for i in indexes:
+				if job is not None:
+					job.check()
+				f.seek(index.offset[i])
+				line_no = index.line_no[i]
+				data = self._decode_data(line_no, f.read(index.size[i]))
+				if data is None or len(data) != index.length[i]:
+					raise hex_record_error([line_no])
+				decoded.append((i, data))
+		# デコード済みのレコードと行順にマージ(行インデックスと対応させるためレコードは連結しない)
+		image = hex_image(coalesce=False)
+		loaded = array('Q')
+		old = self.image
+		pos = 0
+		for i, data in decoded:
+			while pos < len(self._lazy_loaded) and self._lazy_loaded[pos] < i:
+				record = old.record(pos)
+				image.add(record.addr, record.data)
+				loaded.append(self._lazy_loaded[pos])
+				pos += 1
+			image.add(index.addr[i], data)
+			loaded.append(i)
+			index.loaded[i] = 1
+		for pos in range(pos, len(self._lazy_loaded)):
+			record = old.record(pos)
+			image.add(record.addr, record.data)
+			loaded.append(self._lazy_loaded[pos])
+		self.image = image
+		self._lazy_loaded = loaded
+		# imageから作成したインデックスは作り直す
+		self._index = None
+		self._interval_index = None
+		self._dense = None
+
+	def load_all(self):
+		"""
+		遅延解析時、全データレコードをデコードする
+		"""
+		if self._address_begin is not None:
+			self.load_range(self._address_begin, self._address_end)
+
+	# 一括デコード時のエンドレコードのタイプ(エンド以降を解析しない場合)
+	_bulk_end_type: int = None
+
+	def _bulk_address_base(self) -> int:
+		"""
+		一括デコードしたデータレコードのアドレスに加算するベースアドレス
+		"""
+		return 0
+
+	def _analyze_done(self) -> bool:
+		"""
+		解析を終了するときTrue
+		"""
+		return False
+
+	# データ長1以上のデータレコードの行(差分解析用)
+	_data_line_pattern: re.Pattern = None
+
+	def _set_line_context(self, content: bytes, pos: int) -> bool:
+		"""
+		content[pos:]の行を単独で解析するための状態(拡張アドレスなど)を設定する
+		行単位で解析できないときはFalse
+		"""
+		return self._data_line_pattern is not None
+
+	def _get_interval_index(self) -> interval_index:
+		"""
+		レコード範囲インデックスを返す(未作成なら作成する)
+		"""
+		if self._interval_index is None or len(self._interval_index) != len(self.image):
+			self._interval_index = interval_index(self.image.addr, self.image.length)
+		return self._interval_index
+
+	def _get_lazy_interval_index(self) -> interval_index:
+		"""
+		遅延解析時の行インデックスのレコード範囲インデックスを返す(未作成なら作成する)
+		未デコードのレコードも含めて重なりを検出する
+		レコードは通常の解析と同じくアドレスが連続するものを連結してから登録する
+		"""
+		if self._lazy_interval_index is None:
+			addr = array('Q')
+			length = array('Q')
+			join_addr = None
+			for record_addr, record_len in zip(self._line_index.addr, self._line_index.length):
+				if not record_len:
+					continue
+				if record_addr == join_addr:
+					length[-1] += record_len
+				else:
+					addr.append(record_addr)
+					length.append(record_len)
+				join_addr = record_addr + record_len
+			self._lazy_interval_index = interval_index(addr, length)
+		return self._lazy_interval_index
+
+	@property
+	def overlaps(self) -> List[record_overlap]:
+		"""
+		アドレスが重なるレコードの組のリスト
+		遅延解析時は未デコードのレコードを含めた行インデックスから検出する
+		"""
+		if self._line_index is not None:
+			return self._get_lazy_interval_index().overlaps
+		return self._get_interval_index().overlaps
+
+	def set_overlap_policy(self, policy: str) -> List[record_overlap]:
+		"""
+		アドレスが重なるレコードの扱いを設定する
+		policy: overlap_policy_listのいずれか
+		return: 検出した重なりのリスト
+		"""
+		if policy not in overlap_policy_list:
+			raise Exception(f"unknown overlap policy: {policy}")
+		overlaps = self.overlaps
+		if policy == "error" and overlaps:
+			raise record_overlap_error(overlaps)
+		if policy != self.overlap_policy:
+			self.overlap_policy = policy
+			# 優先レコードが変わるのでインデックスを作り直す
+			if self._index is not None:
+				self.build_index()
+			if self._dense is not None:
+				self.build_dense(self._dense.addr_begin, self._dense.addr_end)
+		return overlaps
+
+	def records_at(self, addr: int) -> List[image_record]:
+		"""
+		addrを含むレコードを読み込み順で返す
+		遅延解析時はaddrにかかるデータレコードをデコードしてから検索する
+		"""
+		if self._line_index is not None:
+			self.load_range(addr, addr)
+		return [self.image.record(index) for index in self._get_interval_index().covering(addr)]
+
+	def record_at(self, addr: int) -> image_record:
+		"""
+		addrの値を決めるレコードをoverlap_policyに従って返す
+		addrを含むレコードが無ければNone
+		"""
+		if self._line_index is not None:
+			self.load_range(addr, addr)
+		indexes = self._get_interval_index().covering(addr)
+		if not indexes:
+			return None
+		if self.overlap_policy == "first":
+			return self.image.record(indexes[0])
+		return self.image.record(indexes[-1])
+
+	def build_index(self) -> checksum_index:
+		"""
+		範囲総和インデックスを作成する
+		作成後のchecksum()はデータを走査せずに二分探索で総和を求める
+		"""
+		self._index = checksum_index(self._segments(self._address_begin, self._address_end))
+		return self._index
+
+	def build_dense(self, addr_begin: int = None, addr_end: int = None) -> dense_image:
+		"""
+		addr_begin～addr_endを展開したメモリイメージを作成する(NumPyが必要)
+		作成後の範囲内の総和系チェックサムはNumPyで計算する
+		データが密な範囲に使用する(範囲のサイズ分のメモリを確保する)
+		"""
 		if addr_begin is None:
 			addr_begin = self._address_begin
 		if addr_end is None:
 			addr_end = self._address_end
-		# データ総和計算
-		data_sum = self._checksum_sum(blank, addr_begin, addr_end)
+		blank = 0xFF if self._dense is None else self._dense.blank
+		self._dense = dense_image(self._segments(addr_begin, addr_end), addr_begin, addr_end, blank)
+		return self._dense
+
+	def checksum(self, blank: int = 0xFF, twos_compl: bool = True, addr_begin: int = None, addr_end: int = None, algorithm: str = "byte_sum") -> int:
+		"""
+		algorithm: checksum_algorithm_tblのアルゴリズム名
+		twos_compl: 2の補数を取る(総和系アルゴリズムのみ有効)
+		"""
+		return self.checksum_multi([checksum_config(blank, twos_compl, addr_begin, addr_end, algorithm)])[0]
+
+	def checksum_multi(self, configs: List[checksum_config]) -> List[int]:
+		"""
+		複数の計算設定のチェックサムをまとめて計算する
+		blank/範囲/アルゴリズムが同じ設定は計算を共有し(2の補数の有無は後処理)、
+		データセグメントの走査は全設定で1回だけ行う
+		return: configsと同じ順のチェックサムのリスト
+		"""
+		# 計算単位(blank, 開始アドレス, 終了アドレス, アルゴリズム)を作成
+		keys = [self._checksum_key(config) for config in configs]
+		# データ計算
+		results = {}
+		calc = []
+		for key in dict.fromkeys(keys):
+			blank, addr_begin, addr_end, algorithm = key
+			algo = checksum_algorithm_tbl[algorithm]
+			if algo is checksum_algorithm_tbl["byte_sum"] and self._index is not None:
+				# バイト総和はインデックスを使用できる
+				results[key] = self._checksum_sum(blank, addr_begin, addr_end)
+			elif self._dense is not None and self._dense.contains(addr_begin, addr_end) and dense_word(algo) is not None:
+				# 総和系は展開済みイメージから求める
+				word_size, byteorder = dense_word(algo)
+				results[key] = self._dense.data_sum(blank, addr_begin, addr_end, word_size, byteorder) & ((1 << algo.width) - 1)
+			else:
+				calc.append((key, algo(addr_begin)))
+		results.update(self._checksum_calc(calc))
 		# チェックサム計算
-		if twos_compl:
-			data_sum = -data_sum & 0xFFFFFFFF
-		else:
-			data_sum = data_sum & 0xFFFFFFFF
-		#
-		return data_sum
+		return [self._checksum_final(config, results[key]) for config, key in zip(configs, keys)]
+
+	def checksum_job(self, configs: List[checksum_config], progress=None) -> hex_job:
+		"""
+		checksum_multi()をジョブとして作成する(start()/run()で実行)
+		progress(done, total): 計算範囲の先頭から処理したバイト数を通知する
+		"""
+		return hex_job(lambda: self.checksum_multi(configs), progress)
+
+	def _checksum_key(self, config: checksum_config):
+		"""
+		計算設定の計算単位(blank, 開始アドレス, 終了アドレス, アルゴリズム)
+		"""
+		addr_begin = config.addr_begin
+		if addr_begin is None:
+			addr_begin = self._address_begin
+		addr_end = config.addr_end
+		if addr_end is None:
+			addr_end = self._address_end
+		return config.blank, addr_begin, addr_end, config.algorithm
+
+	def _checksum_final(self, config: checksum_config, result: int) -> int:
+		"""
+		計算単位の計算結果から計算設定のチェックサムを作成する
+		"""
+		algo = checksum_algorithm_tbl[config.algorithm]
+		mask = (1 << algo.width) - 1
+		if config.twos_compl and algo.twos_compl:
+			return -result & mask
+		return result & mask
+
+	def _checksum_calc(self, calc) -> dict:
+		"""
+		データセグメントを1回だけ走査し、各計算単位の範囲に含まれるデータを
+		アドレス順にアルゴリズムに渡して計算する
+		空白領域はblank埋めとしてfill()に渡す
+		ジョブ実行中はセグメントを分割して走査し、処理したアドレスまでの進捗を通知する
+		calc: (計算単位, アルゴリズム)のリスト
+		return: 計算単位→計算結果
+		"""
+		if not calc:
+			return {}
+		addr_next = [key[1] for key, _ in calc]
+		addr_min = min(key[1] for key, _ in calc)
+		addr_max = max(key[2] for key, _ in calc)
+		segments = self._segments(addr_min, addr_max)
+		job = current_job()
+		if job is not None:
+			job.set_total(addr_max - addr_min + 1)
+			segments = job.segments(segments, addr_min)
+		for addr, data in segments:
+			data_end = addr + len(data) - 1
+			for i, ((blank, addr_begin, addr_end, _), algo) in enumerate(calc):
+				# 計算範囲でクリップ
+				begin = max(addr, addr_begin)
+				end = min(data_end, addr_end)
+				if begin > end:
+					continue
+				if addr_next[i] < begin:
+					algo.fill(addr_next[i], blank, begin - addr_next[i])
+				algo.update(begin, data[begin - addr:end - addr + 1])
+				addr_next[i] = end + 1
+		results = {}
+		for i, ((blank, addr_begin, addr_end, _), algo) in enumerate(calc):
+			if addr_next[i] <= addr_end:
+				algo.fill(addr_next[i], blank, addr_end + 1 - addr_next[i])
+			results[calc[i][0]] = algo.result()
+		if job is not None:
+			job.set_done(job.total)
+		return results
 
 	def _checksum_sum(self, blank: int, addr_begin: int, addr_end: int) -> int:
-		# メモリ空間を作成する
-		# blankで埋めて初期化
-		addr_max = addr_end - addr_begin + 1
-		mem = [blank] * addr_max
-		# 保持しているレコードを展開
-		for addr, record in self.record_dict.items():
-			# record.data使用範囲
-			use_data_begin = 0
-			use_data_end = record.data_len
-			# 相対アドレス作成
-			rel_addr_begin = addr - addr_begin
-			rel_addr_end = rel_addr_begin + record.data_len
-			# アドレス範囲チェック
-			if rel_addr_begin < 0:
-				use_data_begin = rel_addr_begin * -1
-				rel_addr_begin = 0
-			if rel_addr_end > addr_max:
-				use_data_end -= rel_addr_end - addr_max
-				rel_addr_end = addr_max
-			# レコードデータのリストを作成
-			mem_record = [data for data in record.data[use_data_begin:use_data_end]]
-			# メモリ空間に展開
-			mem[rel_addr_begin:rel_addr_end] = mem_record
-		# メモリ空間の総和計算
-		data_sum = 0
-		for data in mem:
-			data_sum += data
+		"""
+		指定範囲のデータ総和を計算する
+		メモリ空間は展開せず、データが存在するセグメントの総和と
+		空白領域(blank埋め)の総和を分けて計算する
+		"""
+		if self._index is not None:
+			# インデックスから求める
+			data_sum, data_len = self._index.data_sum(addr_begin, addr_end)
+		else:
+			data_sum = 0
+			data_len = 0
+			# データ部の総和
+			for _, data in self._segments(addr_begin, addr_end):
+				data_sum += sum(data)
+				data_len += len(data)
+		# 空白領域はblank×サイズで計算(addr_begin > addr_endの範囲は空として0)
+		data_sum += blank * max(0, (addr_end - addr_begin + 1) - data_len)
 		return data_sum
+
+	def _segments(self, addr_begin: int, addr_end: int):
+		"""
+		addr_begin～addr_endにクリップしたデータセグメントを
+		(開始アドレス, memoryview)としてアドレス昇順で返す
+		重なりのあるレコードはoverlap_policyに従って優先する
+		遅延解析時は範囲にかかるデータレコードをデコードしてから返す
+		"""
+		if self._line_index is not None:
+			self.load_range(addr_begin, addr_end)
+		return self.image.segments(addr_begin, addr_end, self.overlap_policy == "first")
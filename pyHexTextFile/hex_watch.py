@@ -0,0 +1,317 @@
+"""
+HEXファイルの変更監視と差分再計算
+前回解析したファイル内容と比較して変更された行だけを再解析し、
+チェックサムを差分(追加されたデータ-削除されたデータ)で更新する
+"""
+import os
+import time
+import pathlib
+from array import array
+from typing import List
+
+from .hex_image import hex_image
+from .hex_loader import load_hex_file, open_hex_stream
+from .hex_text_file import hex_text_file, checksum_config
+from .checksum_algorithm import checksum_algorithm_tbl
+
+
+# 共通部分の比較単位
+_compare_block = 64 * 1024
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+	"""
+	aとbの先頭から一致するバイト数
+	"""
+	size = min(len(a), len(b))
+	pos = 0
+	# ブロック単位で比較
+	while pos < size and a[pos:pos + _compare_block] == b[pos:pos + _compare_block]:
+		pos += _compare_block
+	if pos >= size:
+		return size
+	# 不一致ブロック内を二分探索
+	low = pos
+	high = min(pos + _compare_block, size)
+	while low < high:
+		mid = (low + high + 1) // 2
+		if a[pos:mid] == b[pos:mid]:
+			low = mid
+		else:
+			high = mid - 1
+	return low
+
+
+def _common_suffix(a: bytes, b: bytes, limit: int) -> int:
+	"""
+	aとbの末尾から一致するバイト数(最大limit)
+	"""
+	size = min(len(a), len(b), limit)
+	pos = 0
+	# ブロック単位で比較
+	while pos + _compare_block <= size and a[len(a) - pos - _compare_block:len(a) - pos] == b[len(b) - pos - _compare_block:len(b) - pos]:
+		pos += _compare_block
+	# 不一致ブロック内を二分探索
+	low = pos
+	high = min(pos + _compare_block, size)
+	while low < high:
+		mid = (low + high + 1) // 2
+		if a[len(a) - mid:len(a) - pos] == b[len(b) - mid:len(b) - pos]:
+			low = mid
+		else:
+			high = mid - 1
+	return low
+
+
+class hex_watch:
+	"""
+	HEXファイルを監視し、変更時に計算設定毎のチェックサムを更新する
+	変更が連続したデータレコードの行だけのときは、その行だけを再解析して
+	イメージを差し替え、総和系アルゴリズムは差分でチェックサムを更新する
+	それ以外の変更(拡張アドレス/エンドレコードの変更、重なりのあるレコード)はファイル全体を再解析する
+	圧縮ファイル(.gz/.bz2/.xz)は展開した内容で比較する
+	"""
+	def __init__(self, file_path: pathlib.Path, configs: List[checksum_config], use_numpy: bool = None) -> None:
+		self.file_path = pathlib.Path(file_path)
+		self.configs = list(configs)
+		self.use_numpy = use_numpy
+		self.hex_file: hex_text_file = None
+		self.checksums: List[int] = None
+		# 直前の更新方法("full"/"incremental")と再解析した行数
+		self.last_update: str = None
+		self.changed_lines: int = 0
+		# 直前の更新で発生した例外(更新できなかったときは前回の結果を保持する)
+		self.error: Exception = None
+		#
+		self._content: bytes = None
+		self._stat = None
+		# 計算単位→計算結果(2の補数/ビット幅の処理前)
+		self._results = {}
+		# レコードがアドレス昇順で重なりがない
+		self._ordered = False
+		self._load()
+
+	def _file_stat(self):
+		stat = os.stat(self.file_path)
+		return stat.st_mtime_ns, stat.st_size
+
+	def poll(self) -> bool:
+		"""
+		ファイルが変更されていればチェックサムを更新する
+		return: 更新したときTrue
+		"""
+		try:
+			stat = self._file_stat()
+		except OSError as e:
+			self.error = e
+			return False
+		if stat == self._stat:
+			return False
+		try:
+			self._update()
+			self.error = None
+		except Exception as e:
+			# 書き込み途中などで解析できないときは次の変更を待つ
+			self._stat = stat
+			self.error = e
+			return False
+		return True
+
+	def watch(self, callback, interval: float = 0.5):
+		"""
+		interval[s]毎にファイルを確認し、更新したときcallback(hex_watch)を呼び出す
+		"""
+		while True:
+			if self.poll():
+				callback(self)
+			time.sleep(interval)
+
+	def _read(self):
+		"""
+		ファイル内容(圧縮ファイルは展開した内容)と、読み込み中に変更されていないことを確認した状態を返す
+		"""
+		while True:
+			stat = self._file_stat()
+			with self.file_path.open("rb") as f:
+				content = open_hex_stream(f).read()
+			if stat == self._file_stat():
+				return content, stat
+
+	def _load(self):
+		"""
+		ファイル全体を解析してチェックサムを計算する
+		"""
+		while True:
+			content, stat = self._read()
+			kwargs = {} if self.use_numpy is None else {"use_numpy": self.use_numpy}
+			# 行単位で差し替えるためレコードは連結しない(バイナリファイルは解析オプションを使用しない)
+			hex_file = load_hex_file(self.file_path, coalesce=False, **kwargs)
+			if stat == self._file_stat():
+				break
+		self.hex_file = hex_file
+		self._content = content
+		self._stat = stat
+		self._ordered = self._check_ordered(0, len(hex_file.image))
+		self._results = {}
+		self._calc_results(self._keys())
+		self.last_update = "full"
+		self.changed_lines = content.count(b"\n")
+
+	def _update(self):
+		content, stat = self._read()
+		if not self._update_lines(content):
+			self._load()
+			return
+		self._content = content
+		self._stat = stat
+		self.last_update = "incremental"
+
+	def _keys(self):
+		return [self.hex_file._checksum_key(config) for config in self.configs]
+
+	def _calc_results(self, keys):
+		"""
+		計算単位の結果をまとめて計算し、チェックサムを作成する
+		"""
+		calc = [(key, checksum_algorithm_tbl[key[3]](key[1])) for key in dict.fromkeys(keys) if key not in self._results]
+		self._results.update(self.hex_file._checksum_calc(calc))
+		self.checksums = [self.hex_file._checksum_final(config, self._results[key]) for config, key in zip(self.configs, keys)]
+
+	def _check_ordered(self, begin: int, end: int) -> bool:
+		"""
+		begin-1～end番目のレコードがアドレス昇順で重なりがないときTrue
+		"""
+		image = self.hex_file.image
+		addr_next = None
+		for index in range(max(begin - 1, 0), min(end + 1, len(image))):
+			addr = image.addr[index]
+			if addr_next is not None and addr < addr_next:
+				return False
+			addr_next = addr + image.length[index]
+		return True
+
+	def _update_lines(self, content: bytes) -> bool:
+		"""
+		変更された行だけを再解析してイメージとチェックサムを更新する
+		return: 差分で更新できなかったときFalse
+		"""
+		old = self._content
+		hex_file = self.hex_file
+		if not self._ordered:
+			return False
+		# 変更範囲を行単位で求める
+		prefix = _common_prefix(old, content)
+		prefix = old.rfind(b"\n", 0, prefix) + 1
+		suffix = _common_suffix(old, content, min(len(old), len(content)) - prefix)
+		old_end = len(old) - suffix
+		new_end = len(content) - suffix
+		if not (old_end == new_end == prefix or (old[old_end - 1:old_end] == b"\n" and content[new_end - 1:new_end] == b"\n")):
+			# 共通の末尾を行の先頭からにする
+			old_end = old.find(b"\n", old_end) + 1 or len(old)
+			new_end = len(content) - (len(old) - old_end)
+		old_lines = [line for line in old[prefix:old_end].split(b"\n") if line.strip()]
+		new_lines = [line.strip() for line in content[prefix:new_end].split(b"\n") if line.strip()]
+		# 変更範囲がデータレコードだけのときのみ差分更新する
+		pattern = hex_file._data_line_pattern
+		if pattern is None:
+			return False
+		old_count = len(pattern.findall(old, prefix, old_end))
+		if old_count != len(old_lines) or len(pattern.findall(content, prefix, new_end)) != len(new_lines):
+			return False
+		if not hex_file._set_line_context(content, prefix):
+			return False
+		# 変更前のレコード番号の範囲
+		rec_begin = len(pattern.findall(old, 0, prefix))
+		rec_end = rec_begin + old_count
+		# 変更後の行を解析
+		image = hex_file.image
+		state = (hex_file._address, hex_file._address_begin, hex_file._address_end)
+		region = hex_image(coalesce=False)
+		hex_file.image = region
+		hex_file._address_begin = None
+		hex_file._address_end = None
+		try:
+			for line in new_lines:
+				hex_file._analyze_line(0, line)
+		finally:
+			hex_file.image = image
+			region_begin = hex_file._address_begin
+			region_end = hex_file._address_end
+			hex_file._address, hex_file._address_begin, hex_file._address_end = state
+		if len(region) != len(new_lines) or len(image) - old_count + len(region) == 0:
+			return False
+		# 差し替え前のレコード
+		removed = [(record.addr, bytes(record.data)) for record in map(image.record, range(rec_begin, rec_end))]
+		keys = self._keys()
+		# イメージを差し替え(追加データはpayloadの末尾に置く)
+		hex_file._index = None
+		hex_file._interval_index = None
+		hex_file._dense = None
+		offset = len(image.payload)
+		image.addr = image.addr[:rec_begin] + region.addr + image.addr[rec_end:]
+		image.length = image.length[:rec_begin] + region.length + image.length[rec_end:]
+		image.offset = image.offset[:rec_begin] + array(image.offset_typecode, (offset + pos for pos in region.offset)) + image.offset[rec_end:]
+		image.payload += region.payload
+		self._compact()
+		image = hex_file.image
+		# アドレス情報更新
+		bounds_removed = any(addr <= hex_file._address_begin or addr + len(data) - 1 >= hex_file._address_end for addr, data in removed)
+		if bounds_removed:
+			hex_file._address_begin = min(image.addr)
+			hex_file._address_end = max(addr + length - 1 for addr, length in zip(image.addr, image.length))
+		elif region_begin is not None:
+			hex_file._address_begin = min(hex_file._address_begin, region_begin)
+			hex_file._address_end = max(hex_file._address_end, region_end)
+		self._ordered = self._check_ordered(rec_begin, rec_begin + len(region))
+		if not self._ordered:
+			# 重なりがあるときは差し替え後のイメージで全計算
+			self._results = {}
+			self._calc_results(self._keys())
+			self.changed_lines = len(new_lines)
+			return True
+		# チェックサムの差分更新
+		added = [(record.addr, record.data) for record in region.records()]
+		results = {}
+		for old_key, new_key in zip(keys, self._keys()):
+			if old_key != new_key or new_key in results or old_key not in self._results:
+				continue
+			algo = checksum_algorithm_tbl[new_key[3]]
+			if not algo.additive:
+				continue
+			results[new_key] = self._delta(new_key, self._results[old_key], removed, added)
+		self._results = results
+		self._calc_results(self._keys())
+		self.changed_lines = len(new_lines)
+		return True
+
+	def _delta(self, key, result: int, removed, added) -> int:
+		"""
+		削除したデータをblankに、blankを追加したデータに置き換えた差分で計算結果を更新する
+		"""
+		blank, addr_begin, addr_end, algorithm = key
+		algo = checksum_algorithm_tbl[algorithm]
+		add = algo(addr_begin)
+		sub = algo(addr_begin)
+		for records, plus, minus in ((added, add, sub), (removed, sub, add)):
+			for addr, data in records:
+				begin = max(addr, addr_begin)
+				end = min(addr + len(data) - 1, addr_end)
+				if begin > end:
+					continue
+				plus.update(begin, memoryview(data)[begin - addr:end - addr + 1])
+				minus.fill(begin, blank, end - begin + 1)
+		mask = (1 << algo.width) - 1
+		return (result + add.result() - sub.result()) & mask
+
+	def _compact(self):
+		"""
+		差し替えで参照されなくなったデータがpayloadの半分を超えたら詰め直す
+		"""
+		image = self.hex_file.image
+		used = sum(image.length)
+		if used * 2 >= len(image.payload):
+			return
+		compact = hex_image(coalesce=False)
+		for record in image.records():
+			compact.add(record.addr, record.data)
+		self.hex_file.image = compact
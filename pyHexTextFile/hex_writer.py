@@ -0,0 +1,508 @@
+"""
+Intel HEX / Sレコードの出力とフォーマット変換
+データセグメントをレコード長毎に分割し、block_size単位でまとめて出力する
+同じ長さのレコードはNumPyで一括エンコードする(NumPyが無い環境では1レコードずつエンコードする)
+変換はテキスト形式の入力を解析したチャンク毎に出力し、入力全体のイメージを保持しない
+
+変換: python -m pyHexTextFile.hex_writer input.hex output.mot --record-len 32
+"""
+import abc
+import sys
+import pathlib
+import argparse
+from typing import List
+
+from . import lazy_numpy
+from .hex_text_file import hex_text_file
+from .hex_loader import load_hex_file
+from .bin_file import export_bin, sparse_supported, _write_blank
+
+
+# 値→16進文字2文字 変換テーブル(NumPyで初めてエンコードするときに作成する)
+_hex_pairs = None
+
+# Sレコードのデータレコード毎のアドレス長/エンドレコード
+s_record_addr_len = {1: 2, 2: 3, 3: 4}
+s_record_end_type = {1: 9, 2: 8, 3: 7}
+
+
+def _hex_pair_table(np):
+	global _hex_pairs
+	if _hex_pairs is None:
+		_hex_pairs = np.frombuffer(b"".join(b"%02X" % value for value in range(256)), dtype=np.uint16)
+	return _hex_pairs
+
+
+class _record_format(abc.ABC):
+	"""
+	レコードのテキスト形式
+	header(addr, length)でレコード先頭(バイトカウント/アドレス等)を作成し、
+	チェックサムはヘッダ+データの総和から作成する
+	name: エラー表示用の形式名
+	addr_limit: 表現できるアドレスの上限+1
+	"""
+	def __init__(self, prefix: bytes, header_len: int, header, invert: bool, newline: bytes, name: str, addr_limit: int) -> None:
+		self.prefix = prefix
+		self.header_len = header_len
+		self.header = header
+		# True:1の補数(Sレコード) False:2の補数(Intel HEX)
+		self.invert = invert
+		self.newline = newline
+		self.name = name
+		self.addr_limit = addr_limit
+
+	def record(self, addr: int, data) -> bytes:
+		"""
+		1レコード分のテキスト
+		"""
+		return _encode(self.prefix, self.header(addr, len(data)) + bytes(data), self.invert, self.newline)
+
+	def records(self, addr: int, data: memoryview, record_len: int, use_numpy: bool) -> bytes:
+		"""
+		addrから連続するdataをrecord_len毎のレコードに分割したテキスト
+		"""
+		count = len(data) // record_len
+		if not use_numpy or count < 2:
+			return b"".join(self.record(addr + pos, data[pos:pos + record_len]) for pos in range(0, len(data), record_len))
+		full = count * record_len
+		text = self._records_numpy(addr, data[:full], record_len, count)
+		if full < len(data):
+			text += self.record(addr + full, data[full:])
+		return text
+
+	def _records_numpy(self, addr: int, data: memoryview, record_len: int, count: int) -> bytes:
+		"""
+		同じ長さのレコードをまとめてエンコードする
+		"""
+		np = lazy_numpy.load()
+		width = self.header_len + record_len + 1
+		body = np.empty((count, width), dtype=np.uint8)
+		# ヘッダ: 先頭レコードのヘッダにアドレス差分を加算
+		addrs = addr + np.arange(count, dtype=np.int64) * record_len
+		header = np.frombuffer(self.header(addr, record_len), dtype=np.uint8)
+		body[:, :self.header_len] = header
+		for column, shift in self._addr_columns():
+			body[:, column] = (addrs >> shift) & 0xFF
+		body[:, self.header_len:-1] = np.frombuffer(data, dtype=np.uint8).reshape(count, record_len)
+		# チェックサム
+		total = body[:, :-1].sum(axis=1, dtype=np.uint64)
+		body[:, -1] = (~total if self.invert else -total) & 0xFF
+		# 16進文字に変換
+		prefix_len = len(self.prefix)
+		text = np.empty((count, prefix_len + width * 2 + len(self.newline)), dtype=np.uint8)
+		text[:, :prefix_len] = np.frombuffer(self.prefix, dtype=np.uint8)
+		text[:, prefix_len:prefix_len + width * 2] = _hex_pair_table(np)[body].view(np.uint8)
+		text[:, prefix_len + width * 2:] = np.frombuffer(self.newline, dtype=np.uint8)
+		return text.tobytes()
+
+	@abc.abstractmethod
+	def _addr_columns(self):
+		"""
+		ヘッダ内のアドレスの(列, シフト量)
+		"""
+
+
+class _intel_hex_format(_record_format):
+	def __init__(self, newline: bytes) -> None:
+		super().__init__(b":", 4, self._header, False, newline, "Intel HEX", 1 << 32)
+
+	@staticmethod
+	def _header(addr: int, length: int) -> bytes:
+		return bytes([length, (addr >> 8) & 0xFF, addr & 0xFF, 0x00])
+
+	def _addr_columns(self):
+		return ((1, 8), (2, 0))
+
+
+class _s_record_format(_record_format):
+	def __init__(self, record_type: int, newline: bytes) -> None:
+		self.addr_len = s_record_addr_len[record_type]
+		super().__init__(f"S{record_type}".encode(), 1 + self.addr_len, self._header, True, newline, f"S{record_type}", 1 << (self.addr_len * 8))
+
+	def _header(self, addr: int, length: int) -> bytes:
+		return bytes([self.addr_len + length + 1]) + addr.to_bytes(self.addr_len, 'big')
+
+	def _addr_columns(self):
+		return tuple((1 + i, (self.addr_len - 1 - i) * 8) for i in range(self.addr_len))
+
+
+def _encode(prefix: bytes, record: bytes, invert: bool, newline: bytes) -> bytes:
+	"""
+	チェックサムを付加した1レコード分のテキスト
+	"""
+	checksum = (~sum(record) if invert else -sum(record)) & 0xFF
+	return prefix + (record + bytes([checksum])).hex().upper().encode() + newline
+
+
+def _close_output(f, file_path: pathlib.Path, completed: bool):
+	"""
+	出力ファイルを閉じる(出力を完了できなかったときは出力途中のファイルを削除する)
+	"""
+	f.close()
+	if not completed:
+		try:
+			file_path.unlink()
+		except OSError:
+			pass
+
+
+class _record_writer:
+	"""
+	データセグメントをレコードに分割してファイルに出力する
+	アドレスが連続するデータは連結し、block_size毎(boundary指定時はboundary境界でも)にまとめてエンコードする
+	with文で使用し、終了時にエンドレコードを出力する(例外時は出力途中のファイルを削除する)
+	"""
+	# レコードを分割するアドレス境界(Noneは分割しない)
+	boundary: int = None
+
+	def __init__(self, file_path: pathlib.Path, fmt: _record_format, record_len: int, block_size: int, use_numpy: bool) -> None:
+		self.file_path = pathlib.Path(file_path)
+		self.fmt = fmt
+		self.record_len = record_len
+		# レコード長の倍数で分割してレコードがブロックをまたがないようにする
+		self.block_size = max(block_size // record_len, 1) * record_len
+		self.use_numpy = _use_numpy(use_numpy)
+		# 出力したデータサイズ
+		self.data_size = 0
+		self._file = None
+		# 連結中のデータ
+		self._pending = []
+		self._pending_addr: int = None
+		self._pending_size = 0
+
+	def __enter__(self):
+		self._file = self.file_path.open("wb", buffering=self.block_size * 3)
+		self._write_header()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		completed = False
+		try:
+			if exc_type is None:
+				self._flush()
+				self._write_footer()
+				completed = True
+		finally:
+			_close_output(self._file, self.file_path, completed)
+		return False
+
+	def write(self, addr: int, data):
+		"""
+		addrから連続するdataを出力する
+		"""
+		if addr + len(data) > self.fmt.addr_limit:
+			raise Exception(f"address out of range for {self.fmt.name}: {addr + len(data) - 1:X}")
+		boundary = self.boundary
+		pos = 0
+		while pos < len(data):
+			if self._pending and addr + pos != self._pending_addr + self._pending_size:
+				self._flush()
+			if not self._pending:
+				self._pending_addr = addr + pos
+			size = min(self.block_size - self._pending_size, len(data) - pos)
+			if boundary is not None:
+				size = min(size, boundary - ((addr + pos) % boundary))
+			self._pending.append(data[pos:pos + size])
+			self._pending_size += size
+			pos += size
+			if self._pending_size == self.block_size or (boundary is not None and (addr + pos) % boundary == 0):
+				self._flush()
+
+	def _flush(self):
+		"""
+		連結中のデータをレコードにして出力する
+		"""
+		if not self._pending:
+			return
+		data = self._pending[0] if len(self._pending) == 1 else memoryview(b"".join(self._pending))
+		self._write_block(self._pending_addr, data)
+		self.data_size += len(data)
+		self._pending = []
+		self._pending_size = 0
+
+	def _write_block(self, addr: int, data: memoryview):
+		self._file.write(self.fmt.records(addr, data, self.record_len, self.use_numpy))
+
+	def _write_header(self):
+		pass
+
+	def _write_footer(self):
+		pass
+
+
+class _intel_hex_writer(_record_writer):
+	"""
+	Intel HEXの出力
+	レコードは64KB境界で分割し、上位16bitが変わるときに拡張リニアアドレスレコード(04)を出力する
+	"""
+	boundary = 0x10000
+
+	def __init__(self, file_path: pathlib.Path, record_len: int = 16, block_size: int = 1024 * 1024, newline: bytes = b"\n", use_numpy: bool = None) -> None:
+		if not 1 <= record_len <= 0xFF:
+			raise Exception(f"invalid record length: {record_len}")
+		super().__init__(file_path, _intel_hex_format(newline), record_len, block_size, use_numpy)
+		self._ext_addr: int = None
+
+	def _write_block(self, addr: int, data: memoryview):
+		if self._ext_addr != addr >> 16:
+			self._ext_addr = addr >> 16
+			self._file.write(_encode(b":", bytes([2, 0, 0, 4]) + self._ext_addr.to_bytes(2, 'big'), False, self.fmt.newline))
+		super()._write_block(addr & 0xFFFF, data)
+
+	def _write_footer(self):
+		# エンドレコード
+		self._file.write(_encode(b":", bytes([0, 0, 0, 1]), False, self.fmt.newline))
+
+
+class _s_record_writer(_record_writer):
+	"""
+	Sレコードの出力
+	record_type: データレコードのタイプ(1:S1/2:S2/3:S3)
+	header: S0レコードのデータ
+	"""
+	def __init__(self, file_path: pathlib.Path, record_len: int = 16, record_type: int = 3, header: bytes = b"", block_size: int = 1024 * 1024, newline: bytes = b"\n", use_numpy: bool = None) -> None:
+		if record_type not in s_record_addr_len:
+			raise Exception(f"invalid S-record type: {record_type}")
+		fmt = _s_record_format(record_type, newline)
+		if not 1 <= record_len <= 0xFF - fmt.addr_len - 1:
+			raise Exception(f"invalid record length: {record_len}")
+		super().__init__(file_path, fmt, record_len, block_size, use_numpy)
+		self.record_type = record_type
+		self.header = header
+
+	def _write_header(self):
+		# ヘッダレコード
+		self._file.write(_encode(b"S0", bytes([len(self.header) + 3, 0, 0]) + self.header, True, self.fmt.newline))
+
+	def _write_footer(self):
+		# エンドレコード
+		end_type = s_record_end_type[self.record_type]
+		self._file.write(_encode(f"S{end_type}".encode(), bytes([self.fmt.addr_len + 1]) + bytes(self.fmt.addr_len), True, self.fmt.newline))
+
+
+class _bin_writer:
+	"""
+	データセグメントをaddr_begin～addr_endのバイナリファイルの対応する位置に書き込む
+	空白領域は先にblankで埋める(blankが0x00でOSが対応していればファイルの穴にする)
+	データは渡された順に上書きする(アドレスが重なるときは後に渡したデータを優先)
+	"""
+	def __init__(self, file_path: pathlib.Path, blank: int, addr_begin: int, addr_end: int, block_size: int) -> None:
+		self.file_path = pathlib.Path(file_path)
+		self.blank = blank
+		self.addr_begin = addr_begin
+		self.addr_end = addr_end
+		self.block_size = block_size
+		self._file = None
+
+	def __enter__(self):
+		self._file = self.file_path.open("wb")
+		completed = False
+		try:
+			size = self.addr_end - self.addr_begin + 1
+			if sparse_supported and self.blank == 0x00:
+				self._file.truncate(size)
+			else:
+				_write_blank(self._file, size, bytes([self.blank]) * self.block_size, False)
+			completed = True
+		finally:
+			if not completed:
+				_close_output(self._file, self.file_path, False)
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		_close_output(self._file, self.file_path, exc_type is None)
+		return False
+
+	def write(self, addr: int, data):
+		self._file.seek(addr - self.addr_begin)
+		self._file.write(data)
+
+
+def _address_range(hex_file: hex_text_file, addr_begin: int, addr_end: int):
+	if addr_begin is None:
+		addr_begin = hex_file._address_begin
+	if addr_end is None:
+		addr_end = hex_file._address_end
+	return addr_begin, addr_end
+
+
+def _use_numpy(use_numpy: bool) -> bool:
+	if use_numpy is None:
+		return lazy_numpy.available
+	return use_numpy and lazy_numpy.available
+
+
+def _export(hex_file: hex_text_file, writer: _record_writer, addr_begin: int, addr_end: int) -> int:
+	"""
+	addr_begin～addr_endのデータセグメントをアドレス順にwriterで出力する
+	return: 出力したデータサイズ
+	"""
+	if addr_end is not None and addr_end >= writer.fmt.addr_limit:
+		raise Exception(f"address out of range for {writer.fmt.name}: {addr_end:X}")
+	with writer:
+		if addr_begin is not None and addr_end is not None:
+			for addr, data in hex_file._segments(addr_begin, addr_end):
+				writer.write(addr, data)
+	return writer.data_size
+
+
+def export_intel_hex(hex_file: hex_text_file, file_path: pathlib.Path, record_len: int = 16, addr_begin: int = None, addr_end: int = None, block_size: int = 1024 * 1024, newline: bytes = b"\n", use_numpy: bool = None) -> int:
+	"""
+	addr_begin～addr_endのデータをIntel HEXで出力する
+	レコードは64KB境界で分割し、上位16bitが変わるときに拡張リニアアドレスレコード(04)を出力する
+	return: 出力したデータサイズ
+	"""
+	writer = _intel_hex_writer(file_path, record_len, block_size, newline, use_numpy)
+	return _export(hex_file, writer, *_address_range(hex_file, addr_begin, addr_end))
+
+
+def s_record_type(addr_end: int) -> int:
+	"""
+	最大アドレスを表現できるデータレコードのタイプ(1:S1/2:S2/3:S3)
+	"""
+	if addr_end is None or addr_end <= 0xFFFF:
+		return 1
+	if addr_end <= 0xFFFFFF:
+		return 2
+	return 3
+
+
+def export_s_record(hex_file: hex_text_file, file_path: pathlib.Path, record_len: int = 16, record_type: int = None, header: bytes = b"", addr_begin: int = None, addr_end: int = None, block_size: int = 1024 * 1024, newline: bytes = b"\n", use_numpy: bool = None) -> int:
+	"""
+	addr_begin～addr_endのデータをSレコードで出力する
+	record_type: データレコードのタイプ(1:S1/2:S2/3:S3, None:最大アドレスから決定)
+	header: S0レコードのデータ
+	return: 出力したデータサイズ
+	"""
+	addr_begin, addr_end = _address_range(hex_file, addr_begin, addr_end)
+	if record_type is None:
+		record_type = s_record_type(addr_end)
+	writer = _s_record_writer(file_path, record_len, record_type, header, block_size, newline, use_numpy)
+	return _export(hex_file, writer, addr_begin, addr_end)
+
+
+# 出力ファイルの拡張子→出力関数
+export_tbl = {
+	".hex": export_intel_hex,
+	".mot": export_s_record,
+	".bin": export_bin,
+}
+
+
+def _discard(addr: int, data):
+	pass
+
+
+def _clip(sink, addr_begin: int, addr_end: int):
+	"""
+	データセグメントをaddr_begin～addr_end(Noneは制限しない)にクリップしてsinkに渡す関数
+	"""
+	if addr_begin is None and addr_end is None:
+		return sink
+
+	def clipped(addr: int, data):
+		begin = addr if addr_begin is None else max(addr, addr_begin)
+		end = addr + len(data) if addr_end is None else min(addr + len(data), addr_end + 1)
+		if begin < end:
+			sink(begin, data[begin - addr:end - addr])
+	return clipped
+
+
+def _load_segments(src_path: pathlib.Path, sink):
+	"""
+	src_pathを解析し、データセグメントを入力ファイル内の順にsink(開始アドレス, データ)へ渡す
+	テキスト形式は解析したチャンク毎に渡してイメージを保持しない(バイナリファイルはmmapしたデータを渡す)
+	return: 入力の(最小アドレス, 最大アドレス)
+	"""
+	hex_file = load_hex_file(src_path, sink=sink)
+	if hex_file._address_begin is None:
+		return None, None
+	# sinkに渡さずにimageに保持した解析クラス(バイナリファイル)のデータ
+	for addr, data in hex_file._segments(hex_file._address_begin, hex_file._address_end):
+		sink(addr, data)
+	return hex_file._address_begin, hex_file._address_end
+
+
+def _convert_intel_hex(src_path: pathlib.Path, dst_path: pathlib.Path, record_len: int = 16, addr_begin: int = None, addr_end: int = None, block_size: int = 1024 * 1024, newline: bytes = b"\n", use_numpy: bool = None) -> int:
+	with _intel_hex_writer(dst_path, record_len, block_size, newline, use_numpy) as writer:
+		_load_segments(src_path, _clip(writer.write, addr_begin, addr_end))
+	return writer.data_size
+
+
+def _convert_s_record(src_path: pathlib.Path, dst_path: pathlib.Path, record_len: int = 16, record_type: int = None, header: bytes = b"", addr_begin: int = None, addr_end: int = None, block_size: int = 1024 * 1024, newline: bytes = b"\n", use_numpy: bool = None) -> int:
+	if record_type is None:
+		if addr_end is None:
+			# 最大アドレスをデータを保持せずに求める
+			addr_end = _load_segments(src_path, _discard)[1]
+		record_type = s_record_type(addr_end)
+	with _s_record_writer(dst_path, record_len, record_type, header, block_size, newline, use_numpy) as writer:
+		_load_segments(src_path, _clip(writer.write, addr_begin, addr_end))
+	return writer.data_size
+
+
+def _convert_bin(src_path: pathlib.Path, dst_path: pathlib.Path, blank: int = 0xFF, addr_begin: int = None, addr_end: int = None, block_size: int = 1024 * 1024) -> int:
+	if addr_begin is None or addr_end is None:
+		# 出力範囲をデータを保持せずに求める
+		source_begin, source_end = _load_segments(src_path, _discard)
+		addr_begin = source_begin if addr_begin is None else addr_begin
+		addr_end = source_end if addr_end is None else addr_end
+	if addr_begin is None or addr_end is None or addr_begin > addr_end:
+		pathlib.Path(dst_path).write_bytes(b"")
+		return 0
+	with _bin_writer(dst_path, blank, addr_begin, addr_end, block_size) as writer:
+		_load_segments(src_path, _clip(writer.write, addr_begin, addr_end))
+	return addr_end - addr_begin + 1
+
+
+# 出力ファイルの拡張子→変換関数(入力を解析しながら出力する)
+_convert_tbl = {
+	".hex": _convert_intel_hex,
+	".mot": _convert_s_record,
+	".bin": _convert_bin,
+}
+
+
+def convert(src_path: pathlib.Path, dst_path: pathlib.Path, **kwargs) -> int:
+	"""
+	src_pathを解析してdst_pathの拡張子の形式で出力する
+	テキスト形式の入力は解析したチャンク毎にデータを出力し、入力全体のイメージを保持しない
+	レコードは入力ファイル内の順に出力する(アドレスが重なるデータは後のデータが優先される順序を保つ)
+	出力範囲が必要なとき(バイナリ/レコードタイプ未指定のSレコード)は、先にデータを保持せずに解析して範囲を求める
+	stdin("-")は読み直せないためイメージを読み込んでから出力する
+	kwargs: 出力関数の引数
+	return: 出力したデータサイズ
+	"""
+	dst_path = pathlib.Path(dst_path)
+	if dst_path.suffix not in export_tbl:
+		raise Exception(f"unknown output format: {dst_path.suffix}")
+	if str(src_path) == "-":
+		return export_tbl[dst_path.suffix](load_hex_file(src_path), dst_path, **kwargs)
+	return _convert_tbl[dst_path.suffix](pathlib.Path(src_path), dst_path, **kwargs)
+
+
+def main(argv: List[str] = None) -> int:
+	parser = argparse.ArgumentParser(prog="pyHexTextFile.hex_writer", description="HEX/Sレコード/バイナリの形式変換")
+	parser.add_argument("src", type=pathlib.Path, help="入力ファイル")
+	parser.add_argument("dst", type=pathlib.Path, help="出力ファイル(拡張子で形式を決定: .hex/.mot/.bin)")
+	parser.add_argument("--record-len", type=int, help="1レコードのデータ長(.hex/.mot)")
+	parser.add_argument("--s-type", type=int, choices=[1, 2, 3], help="Sレコードのデータレコードタイプ(デフォルト:最大アドレスから決定)")
+	parser.add_argument("--blank", type=lambda value: int(value, 16), help="空白領域の値(16進, .bin)")
+	parser.add_argument("--crlf", action="store_true", help="改行をCRLFにする(.hex/.mot)")
+	args = parser.parse_args(argv)
+	kwargs = {}
+	if args.dst.suffix == ".bin":
+		if args.blank is not None:
+			kwargs["blank"] = args.blank
+	else:
+		if args.record_len is not None:
+			kwargs["record_len"] = args.record_len
+		if args.crlf:
+			kwargs["newline"] = b"\r\n"
+		if args.dst.suffix == ".mot" and args.s_type is not None:
+			kwargs["record_type"] = args.s_type
+	convert(args.src, args.dst, **kwargs)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,9 +1,15 @@
+import re
 import pathlib
-from .hex_text_file import hex_text_file
+import binascii
+from .load_stats import load_stats
+from .hex_text_file import hex_text_file, hex_record_error
+from .hex_image import hex_image
 
 # http://tool-support.renesas.com/autoupdate/support/onlinehelp/ja-JP/csp/V8.04.00/CS+.chm/Compiler-CCRX.chm/Output/ccrx03c0400y.html
 
 class record_type:
+	__slots__ = ("enable", "record_raw", "byte_count", "addr_offset", "record_type", "data", "data_len", "checksum")
+
 	class offset:
 		byte_count = 0			# バイトカウント開始位置
 		addr_offset_begin = 1	# アドレスオフセット開始位置
@@ -48,9 +54,26 @@ class record_type:
 
 
 class intel_hex(hex_text_file):
-	def __init__(self, file_path: pathlib.Path) -> None:
+	# 一括デコード時のエンドレコード
+	_bulk_end_type = 1
+	# 計測結果のレコードタイプ名
+	record_name_format = "{:02X}"
+
+	def __init__(self, file_path: pathlib.Path, use_numpy: bool = None, stats: load_stats = None, lazy: bool = False, coalesce: bool = True, sink=None) -> None:
+		"""
+		use_numpy: NumPyで一括デコードする(None:NumPyがあり、ファイルがbulk_min_size以上なら使用する)
+		stats: 解析/チェックサム計算を計測する
+		lazy: 遅延解析する(データレコードは行インデックスだけ作成し、計算範囲にかかるレコードだけデコードする)
+		coalesce: アドレスが連続するデータレコードを1つのセグメントに連結する(Falseはレコード毎に保持する, 遅延解析時は連結しない)
+		sink: 解析したデータセグメントをチャンク毎にsink(開始アドレス, データ)で渡し、imageには保持しない(遅延解析時は使用できない)
+		"""
+		if lazy and sink is not None:
+			raise Exception("sink cannot be used with lazy parsing")
 		self.hex_file_path = file_path
-		self.record_dict = {}
+		self._lazy = lazy
+		self._sink = sink
+		self._use_numpy = self._select_numpy(use_numpy, file_path)
+		self.image = hex_image(coalesce and not lazy)
 		# 制御情報
 		self._address: int = 0
 		self._address_begin: int = None
@@ -67,38 +90,118 @@ class intel_hex(hex_text_file):
 			4: self._analyze_04_record,
 			5: self._analyze_05_record,
 		}
+		if stats is not None:
+			self.attach_stats(stats)
 		self._analyze()
 
 	def _analyze(self):
 		"""
 		HEXファイルを読み込んで解析する
 		"""
-		# ファイル読み込み
-		lines = None
-		with self.hex_file_path.open("r") as f:
-			lines = f.readlines()
-		# 
-		for line in lines:
-			# 先頭の:を除いてbytesに変換
-			byte = bytes.fromhex(line[1:])
-			# hexレコード情報を作成
-			data = record_type(byte)
-			# 有効チェック
-			if not data.enable:
-				raise Exception("invalid hex file!")
-			#
-			self._analyze_tbl[data.record_type](data)
-			#
-			if self._end:
-				break
+		self._analyze_records()
+		# 最後のチャンクのデータを渡す
+		self._flush_sink()
 		#
 		if not self._end:
 			print("finish without end record.")
 
+	def _analyze_records(self):
+		"""
+		ファイルのレコードをエンドレコードまで解析する
+		"""
+		if self._lazy:
+			# データレコードは行インデックスだけ作成
+			self._analyze_lazy(self.hex_file_path, self._scan_bulk if self._use_numpy else None)
+		elif self._use_numpy:
+			# チャンク単位で一括デコード
+			self._analyze_bulk(self.hex_file_path, self._decode_bulk)
+		else:
+			# ファイルを1行ずつ読み込み
+			self._analyze_lines(self.hex_file_path)
+
+	def _analyze_line(self, line_no: int, line: bytes):
+		"""
+		1行分のレコードを解析する
+		"""
+		data = self._decode_line(line_no, line)
+		self._analyze_tbl[data.record_type](data)
+
+	def _decode_line(self, line_no: int, line: bytes) -> record_type:
+		"""
+		1行分のレコードをデコードして検査する
+		"""
+		try:
+			# 先頭の:を除いてbytesに変換
+			byte = binascii.unhexlify(line[1:])
+			# hexレコード情報を作成
+			data = record_type(byte)
+		except (ValueError, IndexError):
+			raise hex_record_error([line_no])
+		# 有効チェック
+		if not data.enable:
+			raise hex_record_error([line_no])
+		return data
+
+	def _scan_line(self, line: bytes):
+		if line[7:9] != b"00" or line[:1] != b":":
+			return None
+		try:
+			byte_count = int(line[1:3], 16)
+			addr_offset = int(line[3:7], 16)
+		except ValueError:
+			return None
+		if byte_count == 0 or len(line) != byte_count * 2 + 11:
+			return None
+		return addr_offset, byte_count
+
+	def _decode_data(self, line_no: int, line: bytes) -> bytes:
+		data = self._decode_line(line_no, line)
+		if data.record_type != 0:
+			raise hex_record_error([line_no])
+		return data.data
+
+	def _decode_bulk(self, chunk: bytes):
+		from . import bulk_decode
+		return bulk_decode.decode_intel_hex(chunk, [0])
+
+	def _scan_bulk(self, chunk: bytes):
+		from . import bulk_decode
+		return bulk_decode.scan_intel_hex(chunk)
+
+	def _bulk_address_base(self) -> int:
+		if self._ext_linear_addr is not None:
+			return self._ext_linear_addr
+		elif self._ext_segment_addr is not None:
+			return self._ext_segment_addr
+		return 0
+
+	def _analyze_done(self) -> bool:
+		return self._end
+
+	# データ長1以上のデータレコード(00)の行(':'は行頭にしか現れない)
+	_data_line_pattern = re.compile(rb':(?!00)[0-9A-Fa-f]{6}00')
+
+	def _set_line_context(self, content: bytes, pos: int) -> bool:
+		"""
+		pos以前の最後の拡張アドレスレコードを解析して拡張アドレスを設定する
+		pos以前にエンドレコードがあるときは以降の行は解析対象外のためFalse
+		"""
+		if content.rfind(b":00000001", 0, pos) >= 0:
+			return False
+		self._ext_linear_addr = None
+		self._ext_segment_addr = None
+		line_begin = max(content.rfind(b":02000004", 0, pos), content.rfind(b":02000002", 0, pos))
+		if line_begin >= 0:
+			line_end = content.find(b"\n", line_begin)
+			if line_end < 0:
+				line_end = len(content)
+			self._analyze_line(0, content[line_begin:line_end].strip())
+		return True
+
 	def _analyze_00_record(self, record: record_type):
 		# データレコード
 		self._analyze_curr_address(record)
-		self.record_dict[self._address] = record
+		self.image.add(self._address, record.data)
 
 	def _analyze_curr_address(self, record: record_type):
 		"""
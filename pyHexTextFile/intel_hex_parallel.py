@@ -0,0 +1,205 @@
+"""
+Intel HEXの並列解析
+ファイルを行境界で分割し、各チャンクをワーカープロセスで解析する
+拡張アドレスレコード(02/04)は後続レコードのアドレスを変えるため、
+各チャンクは引き継ぐ拡張アドレスを0として解析し、
+マージ時に直前チャンクまでの拡張アドレスを順に求めて(プレフィックススキャン)補正する
+"""
+import os
+import pathlib
+import concurrent.futures
+from array import array
+from typing import List, Tuple
+
+from .intel_hex import intel_hex, record_type
+from .hex_image import hex_image
+from .hex_text_file import hex_record_error
+
+
+class intel_hex_chunk(intel_hex):
+	"""
+	ファイルの一部(read_begin～read_end)を解析するintel_hex
+	最初の拡張アドレスレコードより前のデータレコードは
+	アドレスオフセットのみで保持し(pending)、マージ時に補正する
+	"""
+	def __init__(self, file_path: pathlib.Path, read_begin: int, read_end: int, use_numpy: bool = None) -> None:
+		self._read_begin = read_begin
+		self._read_end = read_end
+		# 拡張アドレスレコードの有無
+		self.ext_found = False
+		# 最初の拡張アドレスレコードより前の情報
+		self.pending: int = None
+		self.pending_address: Tuple[int, int, int] = None
+		# 不正レコードの行番号(チャンク内)
+		self.error_lines: List[int] = []
+		try:
+			super().__init__(file_path, use_numpy)
+		except hex_record_error as e:
+			self.error_lines = e.lines
+		if self.pending is None:
+			self._set_pending()
+
+	def _analyze(self):
+		# エンドレコード無しの判定はマージ後に行う
+		self._analyze_records()
+
+	def _set_pending(self):
+		"""
+		ここまでのデータレコードを補正対象とし、アドレス情報を退避する
+		補正対象のレコードには以降のレコードを連結しない
+		"""
+		self.image.seal()
+		self.pending = len(self.image)
+		self.pending_address = (self._address_begin, self._address_end, self._address)
+		self._address_begin = None
+		self._address_end = None
+
+	def _analyze_02_record(self, record: record_type):
+		if self.pending is None:
+			self._set_pending()
+		self.ext_found = True
+		super()._analyze_02_record(record)
+
+	def _analyze_04_record(self, record: record_type):
+		if self.pending is None:
+			self._set_pending()
+		self.ext_found = True
+		super()._analyze_04_record(record)
+
+	def result(self) -> dict:
+		"""
+		マージ用の解析結果
+		"""
+		return {
+			"addr": self.image.addr,
+			"length": self.image.length,
+			"payload": bytes(self.image.payload),
+			"pending": self.pending,
+			"pending_address": self.pending_address,
+			"address": (self._address_begin, self._address_end, self._address),
+			"ext": (self._ext_linear_addr, self._ext_segment_addr) if self.ext_found else None,
+			"end": self._end,
+			"regs": {key: value for key, value in vars(self).items() if key.startswith("reg_")},
+			"error_lines": self.error_lines,
+		}
+
+
+def _parse_chunk(args) -> dict:
+	return intel_hex_chunk(*args).result()
+
+
+def split_lines(file_path: pathlib.Path, count: int, min_size: int) -> List[Tuple[int, int]]:
+	"""
+	ファイルを行境界でおおよそcount等分した(開始位置, 終了位置)のリストを返す
+	1チャンクはmin_size以上とする
+	"""
+	size = file_path.stat().st_size
+	count = max(1, min(count, size // max(1, min_size)))
+	bounds = [0]
+	with file_path.open("rb") as f:
+		for i in range(1, count):
+			pos = size * i // count
+			if pos <= bounds[-1]:
+				continue
+			# 次の行頭まで進める
+			f.seek(pos - 1)
+			f.readline()
+			pos = f.tell()
+			if bounds[-1] < pos < size:
+				bounds.append(pos)
+	bounds.append(size)
+	return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _count_lines(file_path: pathlib.Path, end: int) -> int:
+	"""
+	ファイル先頭からendまでの行数
+	"""
+	count = 0
+	with file_path.open("rb") as f:
+		while end > 0:
+			chunk = f.read(min(end, 1024 * 1024))
+			if not chunk:
+				break
+			count += chunk.count(b"\n")
+			end -= len(chunk)
+	return count
+
+
+def parse_parallel(file_path: pathlib.Path, jobs: int = None, use_numpy: bool = None, min_chunk_size: int = 4 * 1024 * 1024) -> intel_hex:
+	"""
+	Intel HEXファイルを並列に解析する
+	結果はintel_hex(file_path)と同一になる
+	jobs: ワーカープロセス数(None:CPU数)
+	min_chunk_size: 1チャンクの最小サイズ(これ未満のファイルは分割しない)
+	"""
+	file_path = pathlib.Path(file_path)
+	if jobs is None:
+		jobs = os.cpu_count() or 1
+	bounds = split_lines(file_path, jobs * 4, min_chunk_size)
+	if jobs <= 1 or len(bounds) <= 1:
+		return intel_hex(file_path, use_numpy)
+	args = [(file_path, begin, end, use_numpy) for begin, end in bounds]
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		results = list(executor.map(_parse_chunk, args))
+	return merge_chunks(file_path, bounds, results, use_numpy)
+
+
+def merge_chunks(file_path: pathlib.Path, bounds, results, use_numpy: bool = None) -> intel_hex:
+	"""
+	チャンク毎の解析結果をファイル順にマージする
+	"""
+	image = hex_image()
+	state = {
+		"_use_numpy": use_numpy,
+		"_address": 0,
+		"_address_begin": None,
+		"_address_end": None,
+		"_ext_linear_addr": None,
+		"_ext_segment_addr": None,
+		"_end": False,
+	}
+	error_lines = []
+	for (begin, _), result in zip(bounds, results):
+		# 直前チャンクまでの拡張アドレス
+		base = 0
+		if state["_ext_linear_addr"] is not None:
+			base = state["_ext_linear_addr"]
+		elif state["_ext_segment_addr"] is not None:
+			base = state["_ext_segment_addr"]
+		# 不正レコードはファイル全体の行番号に変換
+		if result["error_lines"]:
+			line_base = _count_lines(file_path, begin)
+			error_lines += [line_base + line for line in result["error_lines"]]
+		if not error_lines:
+			# 拡張アドレスレコードより前のレコードを補正して追加
+			pending = result["pending"]
+			addr = result["addr"]
+			if pending and base:
+				addr = array(addr.typecode, [a + base for a in addr[:pending]]) + addr[pending:]
+			image.add_bulk(addr, result["length"], result["payload"])
+			# アドレス情報
+			addr_info = [result["address"]]
+			pending_begin, pending_end, pending_address = result["pending_address"]
+			if pending_begin is not None:
+				addr_info.insert(0, (pending_begin + base, pending_end + base, pending_address + base))
+			for addr_begin, addr_end, address in addr_info:
+				if addr_begin is None:
+					continue
+				state["_address"] = address
+				if state["_address_begin"] is None or state["_address_begin"] > addr_begin:
+					state["_address_begin"] = addr_begin
+				if state["_address_end"] is None or state["_address_end"] < addr_end:
+					state["_address_end"] = addr_end
+			# 拡張アドレス/レジスタ
+			if result["ext"] is not None:
+				state["_ext_linear_addr"], state["_ext_segment_addr"] = result["ext"]
+			state.update(result["regs"])
+		if result["end"]:
+			state["_end"] = True
+			break
+	if error_lines:
+		raise hex_record_error(error_lines)
+	if not state["_end"]:
+		print("finish without end record.")
+	return intel_hex._restore(state, {"hex_file_path": str(file_path)}, image)
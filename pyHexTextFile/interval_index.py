@@ -0,0 +1,69 @@
+import bisect
+import itertools
+from array import array
+from typing import NamedTuple, List
+
+
+class record_overlap(NamedTuple):
+	"""
+	アドレスが重なるレコードの組
+	first/second: 重なったレコードの番号(読み込み順, first < second)
+	addr_begin/addr_end: 重なった範囲
+	"""
+	first: int
+	second: int
+	addr_begin: int
+	addr_end: int
+
+
+class interval_index:
+	"""
+	レコードのアドレス範囲を開始アドレス順に並べたインデックス
+	ソート済みの開始/終了アドレスと終了アドレスの累積最大値を保持し、
+	重なり検出をO(n log n)、アドレスを含むレコードの検索を二分探索で行う
+	"""
+	def __init__(self, addr, length) -> None:
+		"""
+		addr/length: 読み込み順のレコードの開始アドレス/データ長
+		"""
+		# 開始アドレス順(同じアドレスは読み込み順)のレコード番号
+		self._order = array('Q', sorted(range(len(addr)), key=addr.__getitem__))
+		self._begin = array('Q', (addr[i] for i in self._order))
+		self._end = array('Q', (addr[i] + length[i] - 1 for i in self._order))
+		# 先頭から各位置までの終了アドレスの最大値
+		self._max_end = array('Q', itertools.accumulate(self._end, max))
+		self.overlaps = self._find_overlaps()
+
+	def __len__(self) -> int:
+		return len(self._order)
+
+	def _find_overlaps(self) -> List[record_overlap]:
+		"""
+		開始アドレス順に走査して重なりを検出する
+		各レコードはそれより前で終了アドレスが最大のレコードとの組で1回だけ報告する
+		"""
+		overlaps = []
+		owner = 0
+		for pos in range(1, len(self._order)):
+			begin = self._begin[pos]
+			max_end = self._max_end[pos - 1]
+			if begin <= max_end:
+				first, second = sorted((self._order[owner], self._order[pos]))
+				overlaps.append(record_overlap(first, second, begin, min(max_end, self._end[pos])))
+			if self._end[pos] > max_end:
+				owner = pos
+		return overlaps
+
+	def covering(self, addr: int) -> List[int]:
+		"""
+		addrを含むレコードの番号を読み込み順で返す
+		addr以前に開始するレコードを終了アドレスの累積最大値がaddrを下回るまで遡る
+		"""
+		indexes = []
+		pos = bisect.bisect_right(self._begin, addr) - 1
+		while pos >= 0 and self._max_end[pos] >= addr:
+			if self._end[pos] >= addr:
+				indexes.append(self._order[pos])
+			pos -= 1
+		indexes.sort()
+		return indexes
@@ -0,0 +1,27 @@
+"""
+NumPyの遅延読み込み
+NumPyのimportは小さなファイルの解析/チェックサム計算全体より時間がかかるため、
+一括デコード/展開済みイメージなどNumPyで処理するときに初めて読み込む
+"""
+import sys
+import importlib.util
+
+# NumPyがインストールされているか(importせずに確認する)
+available = importlib.util.find_spec("numpy") is not None
+
+
+def load():
+	"""
+	NumPyを読み込んで返す(無ければNone)
+	"""
+	if not available:
+		return None
+	import numpy
+	return numpy
+
+
+def loaded() -> bool:
+	"""
+	NumPyが読み込み済みのときTrue(以降はNumPyで処理しても読み込み時間がかからない)
+	"""
+	return "numpy" in sys.modules
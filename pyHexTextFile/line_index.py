@@ -0,0 +1,55 @@
+from array import array
+
+from . import lazy_numpy
+
+
+class line_index:
+	"""
+	遅延解析用のデータレコードの行インデックス
+	データレコード毎にファイル内の行位置と、ヘッダから求めたアドレス/データ長を保持する
+	データ部はデコードせず、必要になったレコードだけload()で読み出す
+	"""
+	def __init__(self) -> None:
+		# 行情報(ファイル内位置, 行長(前後の空白を除く), 行番号(1始まり))
+		self.offset = array('Q')
+		self.size = array('I')
+		self.line_no = array('Q')
+		# レコード情報(開始アドレス, データ長)
+		self.addr = array('Q')
+		self.length = array('I')
+		# デコード済みのレコード
+		self.loaded = bytearray()
+
+	def __len__(self) -> int:
+		return len(self.addr)
+
+	def add(self, offset: int, size: int, line_no: int, addr: int, length: int):
+		self.offset.append(offset)
+		self.size.append(size)
+		self.line_no.append(line_no)
+		self.addr.append(addr)
+		self.length.append(length)
+		self.loaded.append(0)
+
+	def extend(self, offset, size, line_no, addr, length):
+		self.offset.extend(offset)
+		self.size.extend(size)
+		self.line_no.extend(line_no)
+		self.addr.extend(addr)
+		self.length.extend(length)
+		self.loaded.extend(bytes(len(addr)))
+
+	def unloaded(self, addr_begin: int, addr_end: int):
+		"""
+		addr_begin～addr_endにかかる未デコードのレコード番号(昇順)
+		"""
+		np = lazy_numpy.load() if lazy_numpy.loaded() else None
+		if np is not None:
+			addr = np.frombuffer(self.addr, dtype=np.uint64)
+			end = addr + np.frombuffer(self.length, dtype=np.uint32)
+			loaded = np.frombuffer(self.loaded, dtype=np.uint8)
+			return np.flatnonzero((addr <= addr_end) & (end > addr_begin) & (loaded == 0)).tolist()
+		return [
+			index for index, (addr, length, loaded) in enumerate(zip(self.addr, self.length, self.loaded))
+			if addr <= addr_end and addr + length > addr_begin and not loaded
+		]
@@ -0,0 +1,231 @@
+import time
+import json
+from collections import Counter
+
+
+class load_stats:
+	"""
+	HEXファイル解析/チェックサム計算の計測結果
+	hex_text_file.attach_stats()でインスタンスのメソッドを計測用のラッパーに置き換えて計測する
+	置き換えはインスタンス単位のため、アタッチしないときは計測コストがかからない
+
+	フェーズ(phase_time, 秒, 入れ子になったフェーズの時間は含まない)
+	  read       : ファイル読み込み
+	  decode     : レコードのデコード/チェックサム検査
+	  bulk_decode: NumPyによる一括デコード
+	  dispatch   : レコードタイプ毎の解析処理
+	  address    : アドレス情報の更新
+	  image      : イメージへのデータ追加
+	  parse      : 上記以外の解析処理(行分割など)
+	  cache      : 解析キャッシュの検索/保存
+	  index      : 範囲総和インデックスの作成
+	  checksum   : チェックサム計算
+	"""
+	def __init__(self, trace_alloc: bool = False) -> None:
+		"""
+		trace_alloc: tracemallocで解析中の最大メモリ確保量を計測する(解析が遅くなる)
+		"""
+		self.trace_alloc = trace_alloc
+		self.file = None
+		self.phase_time = {}
+		self.load_time = 0.0
+		self.record_count = Counter()
+		self.bytes_read = 0
+		self.data_bytes = 0
+		self.peak_alloc = None
+		self.checksum_count = 0
+		# 計測中のフェーズ: [フェーズ名, 開始時刻]のスタック
+		self._stack = []
+		self._hooks = []
+
+	def add_hook(self, hook):
+		"""
+		計測イベント毎に呼び出す関数を登録する
+		hook(event, stats) eventは"load"/"index"/"checksum"
+		"""
+		self._hooks.append(hook)
+
+	def _notify(self, event: str):
+		for hook in self._hooks:
+			hook(event, self)
+
+	def _begin(self, name: str):
+		now = time.perf_counter()
+		if self._stack:
+			# 親フェーズの計測を中断
+			parent = self._stack[-1]
+			self.phase_time[parent[0]] = self.phase_time.get(parent[0], 0.0) + now - parent[1]
+		self._stack.append([name, now])
+
+	def _end(self):
+		now = time.perf_counter()
+		name, begin = self._stack.pop()
+		self.phase_time[name] = self.phase_time.get(name, 0.0) + now - begin
+		if self._stack:
+			# 親フェーズの計測を再開
+			self._stack[-1][1] = now
+
+	def phase(self, name: str):
+		"""
+		withブロックを1つのフェーズとして計測する
+		"""
+		return _phase(self, name)
+
+	def _wrap(self, func, name: str):
+		def wrapper(*args, **kwargs):
+			self._begin(name)
+			try:
+				return func(*args, **kwargs)
+			finally:
+				self._end()
+		return wrapper
+
+	def _wrap_record(self, func, name: str, record_name: str):
+		def wrapper(record):
+			self.record_count[record_name] += 1
+			self._begin(name)
+			try:
+				return func(record)
+			finally:
+				self._end()
+		return wrapper
+
+	def _wrap_read(self, func):
+		def wrapper(*args):
+			chunks = func(*args)
+			while True:
+				self._begin("read")
+				try:
+					chunk = next(chunks, None)
+				finally:
+					self._end()
+				if chunk is None:
+					return
+				self.bytes_read += len(chunk)
+				yield chunk
+		return wrapper
+
+	def _wrap_bulk_data(self, func, record_format: str):
+		def wrapper(records, begin, end):
+			for rtype, count in Counter(records.rtype[begin:end].tolist()).items():
+				self.record_count[record_format.format(rtype)] += count
+			self._begin("image")
+			try:
+				return func(records, begin, end)
+			finally:
+				self._end()
+		return wrapper
+
+	def _wrap_load(self, hex_file, func):
+		def wrapper():
+			started = False
+			if self.trace_alloc:
+				# tracemallocは読み込みに時間がかかるため計測時だけ読み込む
+				import tracemalloc
+				started = not tracemalloc.is_tracing()
+				if started:
+					tracemalloc.start()
+				if hasattr(tracemalloc, "reset_peak"):
+					tracemalloc.reset_peak()
+				alloc_begin = tracemalloc.get_traced_memory()[0]
+			time_begin = time.perf_counter()
+			self._begin("parse")
+			try:
+				return func()
+			finally:
+				self._end()
+				self.load_time += time.perf_counter() - time_begin
+				if self.trace_alloc:
+					self.peak_alloc = tracemalloc.get_traced_memory()[1] - alloc_begin
+					if started:
+						tracemalloc.stop()
+				self.data_bytes = len(hex_file.image.payload)
+				self._notify("load")
+		return wrapper
+
+	def _wrap_event(self, func, name: str):
+		def wrapper(*args, **kwargs):
+			self._begin(name)
+			try:
+				result = func(*args, **kwargs)
+			finally:
+				self._end()
+			if name == "checksum":
+				self.checksum_count += len(args[0])
+			self._notify(name)
+			return result
+		return wrapper
+
+	def attach(self, hex_file):
+		"""
+		hex_fileのメソッドを計測用のラッパーに置き換える
+		ファイルタイプに存在しないメソッドは置き換えない
+		"""
+		source = getattr(hex_file, "hex_file_path", None) or getattr(hex_file, "file_path", "")
+		# ストリームはストリームの名前
+		self.file = str(getattr(source, "name", source))
+		record_format = hex_file.record_name_format
+		wrappers = {
+			"_analyze": lambda func: self._wrap_load(hex_file, func),
+			"_read_chunks": self._wrap_read,
+			"_analyze_line": lambda func: self._wrap(func, "decode"),
+			"_decode_bulk": lambda func: self._wrap(func, "bulk_decode"),
+			"_analyze_bulk_data": lambda func: self._wrap_bulk_data(func, record_format),
+			"_analyze_curr_address": lambda func: self._wrap(func, "address"),
+			"build_index": lambda func: self._wrap_event(func, "index"),
+			"checksum_multi": lambda func: self._wrap_event(func, "checksum"),
+		}
+		for name, wrap in wrappers.items():
+			if hasattr(hex_file, name):
+				setattr(hex_file, name, wrap(getattr(hex_file, name)))
+		hex_file.image.add = self._wrap(hex_file.image.add, "image")
+		hex_file.image.add_bulk = self._wrap(hex_file.image.add_bulk, "image")
+		analyze_tbl = getattr(hex_file, "_analyze_tbl", {})
+		for key, func in analyze_tbl.items():
+			analyze_tbl[key] = self._wrap_record(func, "dispatch", record_format.format(key))
+		# 解析済み(キャッシュから読み込み)のときのデータサイズ
+		self.data_bytes = len(hex_file.image.payload)
+
+	def to_dict(self) -> dict:
+		return {
+			"file": self.file,
+			"load_time": self.load_time,
+			"phase_time": dict(self.phase_time),
+			"record_count": dict(self.record_count),
+			"bytes_read": self.bytes_read,
+			"data_bytes": self.data_bytes,
+			"peak_alloc": self.peak_alloc,
+			"checksum_count": self.checksum_count,
+		}
+
+	def to_json(self, **kwargs) -> str:
+		return json.dumps(self.to_dict(), **kwargs)
+
+	def format(self):
+		"""
+		計測結果を表示用の行で返す
+		"""
+		lines = [f'load: {self.load_time * 1e3:.1f} ms, read {self.bytes_read} bytes, data {self.data_bytes} bytes']
+		for name, elapsed in sorted(self.phase_time.items(), key=lambda item: -item[1]):
+			lines.append(f'  {name:<12}: {elapsed * 1e3:10.1f} ms')
+		if self.record_count:
+			lines.append('  records     : ' + ', '.join(f'{name}={count}' for name, count in sorted(self.record_count.items())))
+		if self.peak_alloc is not None:
+			lines.append(f'  peak alloc  : {self.peak_alloc / 1e6:.1f} MB')
+		return lines
+
+
+class _phase:
+	__slots__ = ("_stats", "_name")
+
+	def __init__(self, stats: load_stats, name: str) -> None:
+		self._stats = stats
+		self._name = name
+
+	def __enter__(self):
+		self._stats._begin(self._name)
+		return self._stats
+
+	def __exit__(self, *exc):
+		self._stats._end()
+		return False
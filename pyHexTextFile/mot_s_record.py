@@ -1,7 +1,13 @@
+import re
 import pathlib
-from .hex_text_file import hex_text_file
+import binascii
+from .load_stats import load_stats
+from .hex_text_file import hex_text_file, hex_record_error
+from .hex_image import hex_image
 
 class record_type:
+	__slots__ = ("enable", "record_raw", "record_type", "byte_count", "addr", "addr_len", "data", "data_len", "checksum", "data_pos", "fcc_pos", "data_end_pos")
+
 	class offset:
 		byte_count = 0			# バイトカウント開始位置
 		addr_offset_begin = 1	# ロードアドレス開始位置
@@ -23,7 +29,7 @@ class record_type:
 	)
 
 
-	def __init__(self, record: str) -> None:
+	def __init__(self, record: bytes) -> None:
 		self.enable = False
 		# 解析情報
 		self.record_type: int = None	# 0:S0/1:S1/2:S2/3:S3/
@@ -36,12 +42,12 @@ class record_type:
 		# 解析
 		self._analyze(record)
 
-	def _analyze(self, record_str: str):
+	def _analyze(self, record_str: bytes):
 		record_offset = record_type.offset
 		# レコードタイプ取得
 		self.record_type = self._analyze_record_type(record_str[0:2])
 		# 生bytes
-		self.record_raw = bytes.fromhex(record_str[2:])
+		self.record_raw = binascii.unhexlify(record_str[2:])
 		# 固定長データ抽出
 		self.byte_count = self.record_raw[record_offset.byte_count]
 		# 各種レコード位置を作成
@@ -73,14 +79,29 @@ class record_type:
 		self.data_end_pos = self.fcc_pos - 1
 
 
-	def _analyze_record_type(self, record: str):
-		return int(record[1])
+	def _analyze_record_type(self, record: bytes):
+		return int(record[1:2])
 
 
 class mot_s_record(hex_text_file):
-	def __init__(self, file_path: pathlib.Path) -> None:
+	# 計測結果のレコードタイプ名
+	record_name_format = "S{}"
+
+	def __init__(self, file_path: pathlib.Path, use_numpy: bool = None, stats: load_stats = None, lazy: bool = False, coalesce: bool = True, sink=None) -> None:
+		"""
+		use_numpy: NumPyで一括デコードする(None:NumPyがあり、ファイルがbulk_min_size以上なら使用する)
+		stats: 解析/チェックサム計算を計測する
+		lazy: 遅延解析する(データレコードは行インデックスだけ作成し、計算範囲にかかるレコードだけデコードする)
+		coalesce: アドレスが連続するデータレコードを1つのセグメントに連結する(Falseはレコード毎に保持する, 遅延解析時は連結しない)
+		sink: 解析したデータセグメントをチャンク毎にsink(開始アドレス, データ)で渡し、imageには保持しない(遅延解析時は使用できない)
+		"""
+		if lazy and sink is not None:
+			raise Exception("sink cannot be used with lazy parsing")
 		self.file_path = file_path
-		self.record_dict = {}
+		self._lazy = lazy
+		self._sink = sink
+		self._use_numpy = self._select_numpy(use_numpy, file_path)
+		self.image = hex_image(coalesce and not lazy)
 		# 制御情報
 		self._address: int = 0
 		self._address_begin: int = None
@@ -103,26 +124,77 @@ class mot_s_record(hex_text_file):
 			8: self._analyze_S8_record,
 			9: self._analyze_S9_record,
 		}
+		if stats is not None:
+			self.attach_stats(stats)
 		self._analyze()
 
 	def _analyze(self):
 		"""
 		HEXファイルを読み込んで解析する
 		"""
-		# ファイル読み込み
-		lines = None
-		with self.file_path.open("r") as f:
-			lines = f.readlines()
-		#
-		for line in lines:
+		if self._lazy:
+			# データレコードは行インデックスだけ作成
+			self._analyze_lazy(self.file_path, self._scan_bulk if self._use_numpy else None)
+		elif self._use_numpy:
+			# チャンク単位で一括デコード
+			self._analyze_bulk(self.file_path, self._decode_bulk)
+		else:
+			# ファイルを1行ずつ読み込み
+			self._analyze_lines(self.file_path)
+		# 最後のチャンクのデータを渡す
+		self._flush_sink()
+
+	def _analyze_line(self, line_no: int, line: bytes):
+		"""
+		1行分のレコードを解析する
+		"""
+		data = self._decode_line(line_no, line)
+		self._analyze_tbl[data.record_type](data)
+
+	def _decode_line(self, line_no: int, line: bytes) -> record_type:
+		"""
+		1行分のレコードをデコードして検査する
+		"""
+		try:
 			# レコード情報を作成
 			data = record_type(line)
-			# 有効チェック
-			if not data.enable:
-				raise Exception("invalid hex file!")
-			#
-			self._analyze_tbl[data.record_type](data)
-			#
+		except (ValueError, IndexError, TypeError):
+			raise hex_record_error([line_no])
+		# 有効チェック
+		if not data.enable:
+			raise hex_record_error([line_no])
+		return data
+
+	def _decode_bulk(self, chunk: bytes):
+		from . import bulk_decode
+		return bulk_decode.decode_s_record(chunk, [1, 2, 3], record_type.record_size_tbl)
+
+	def _scan_bulk(self, chunk: bytes):
+		from . import bulk_decode
+		return bulk_decode.scan_s_record(chunk, [1, 2, 3], record_type.record_size_tbl)
+
+	def _scan_line(self, line: bytes):
+		if line[:1] != b"S" or line[1:2] not in (b"1", b"2", b"3"):
+			return None
+		addr_len = record_type.record_size_tbl[int(line[1:2])]
+		try:
+			byte_count = int(line[2:4], 16)
+			addr = int(line[4:4 + addr_len * 2], 16)
+		except ValueError:
+			return None
+		data_len = byte_count - addr_len - 1
+		if data_len <= 0 or len(line) != byte_count * 2 + 4:
+			return None
+		return addr, data_len
+
+	def _decode_data(self, line_no: int, line: bytes) -> bytes:
+		data = self._decode_line(line_no, line)
+		if data.record_type not in (1, 2, 3):
+			raise hex_record_error([line_no])
+		return data.data
+
+	# データ長1以上のデータレコード(S1/S2/S3)の行('S'は行頭にしか現れない)
+	_data_line_pattern = re.compile(rb'S(?:1(?!03)|2(?!04)|3(?!05))')
 
 	def _analyze_S0_record(self, record: record_type):
 		# データレコード
@@ -131,17 +203,17 @@ class mot_s_record(hex_text_file):
 	def _analyze_S1_record(self, record: record_type):
 		# データレコード
 		self._analyze_curr_address(record)
-		self.record_dict[self._address] = record
+		self.image.add(self._address, record.data)
 
 	def _analyze_S2_record(self, record: record_type):
 		# データレコード
 		self._analyze_curr_address(record)
-		self.record_dict[self._address] = record
+		self.image.add(self._address, record.data)
 
 	def _analyze_S3_record(self, record: record_type):
 		# データレコード
 		self._analyze_curr_address(record)
-		self.record_dict[self._address] = record
+		self.image.add(self._address, record.data)
 
 	def _analyze_curr_address(self, record: record_type):
 		"""
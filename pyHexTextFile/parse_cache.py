@@ -0,0 +1,219 @@
+"""
+解析結果のディスクキャッシュ
+ファイルのパス/サイズ/更新日時/内容のハッシュをキーとして、
+解析済みのメモリイメージをバイナリ形式で保存する
+キャッシュヒット時はテキスト解析をせずにmmapで読み込む
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import pathlib
+import tempfile
+from array import array
+
+from .hex_image import hex_image
+
+
+def default_cache_dir() -> pathlib.Path:
+	"""
+	OS標準のキャッシュディレクトリ
+	"""
+	if sys.platform == "win32":
+		base = os.environ.get("LOCALAPPDATA")
+	else:
+		base = os.environ.get("XDG_CACHE_HOME")
+	if not base:
+		base = pathlib.Path.home() / ".cache"
+	return pathlib.Path(base) / "pyHexTextFile"
+
+
+def content_digest(file_path: pathlib.Path) -> bytes:
+	"""
+	ファイル内容のハッシュ
+	"""
+	content = hashlib.blake2b(digest_size=32)
+	with pathlib.Path(file_path).open("rb") as f:
+		while True:
+			chunk = f.read(1024 * 1024)
+			if not chunk:
+				break
+			content.update(chunk)
+	return content.digest()
+
+
+class parse_cache:
+	# ファイルフォーマット
+	magic = b"PHTC"
+	version = 3
+	# ヘッダ: magic, version, JSONヘッダ長
+	_header = struct.Struct("<4sII")
+	# キャッシュファイル拡張子
+	suffix = ".phtc"
+
+	def __init__(self, cache_dir: pathlib.Path = None, max_size: int = 256 * 1024 * 1024) -> None:
+		"""
+		max_size: キャッシュの合計サイズ上限[byte]、超えた分は古いものから削除する
+		"""
+		if cache_dir is None:
+			cache_dir = default_cache_dir()
+		self.cache_dir = pathlib.Path(cache_dir)
+		self.max_size = max_size
+
+	def load(self, cls, file_path: pathlib.Path, **kwargs):
+		"""
+		file_pathをclsで解析した結果を返す
+		キャッシュがあればキャッシュから読み込み、無ければ解析してキャッシュに保存する
+		kwargs: キャッシュが無いときにclsに渡す引数
+		"""
+		file_path = pathlib.Path(file_path)
+		cache_path = self._cache_path(cls, file_path)
+		if cache_path.exists():
+			try:
+				hex_file = self._read(cls, cache_path)
+				# アクセス日時を更新(LRU)
+				os.utime(cache_path)
+				return hex_file
+			except (OSError, ValueError, KeyError, struct.error):
+				# 壊れたキャッシュは作り直す
+				pass
+		hex_file = cls(file_path, **kwargs)
+		try:
+			self._write(hex_file, cache_path)
+			self._evict()
+		except OSError:
+			# キャッシュに保存できなくても解析結果は返す
+			pass
+		return hex_file
+
+	def clear(self):
+		"""
+		キャッシュを全て削除する
+		"""
+		for path in self._entries():
+			try:
+				path.unlink()
+			except OSError:
+				pass
+
+	def _cache_path(self, cls, file_path: pathlib.Path) -> pathlib.Path:
+		"""
+		キャッシュのキーからキャッシュファイルのパスを作成する
+		"""
+		stat = file_path.stat()
+		key = hashlib.blake2b(digest_size=20)
+		key.update(f"{cls.__name__}|{file_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|".encode("utf-8"))
+		key.update(content_digest(file_path))
+		return self.cache_dir / (key.hexdigest() + self.suffix)
+
+	def _write(self, hex_file, cache_path: pathlib.Path):
+		"""
+		一時ファイルに書き込んでからcache_pathに置き換える
+		一時ファイルは書き込み毎に作成し、同じキャッシュを同時に書き込むプロセス間で共有しない
+		"""
+		image = hex_file.image
+		state, paths = hex_file._get_state()
+		tables = [table.tobytes() for table in (image.addr, image.offset, image.length)]
+		body_size = sum(len(data) + (-len(data) % 8) for data in tables) + len(image.payload)
+		header_info = {
+			"class": type(hex_file).__name__,
+			"state": state,
+			"paths": paths,
+			"count": len(image),
+			"typecode": [image.addr.typecode, image.offset.typecode, image.length.typecode],
+			"payload": len(image.payload),
+			# ファイル全体のサイズ(ヘッダ長が決まってから設定する)
+			"size": 0,
+		}
+		# ファイルサイズの桁数でヘッダ長が変わるため、サイズが一致するまで作り直す
+		while True:
+			header = json.dumps(header_info).encode("utf-8")
+			# レコード情報を8byte境界に配置する
+			header += b" " * (-(self._header.size + len(header)) % 8)
+			size = self._header.size + len(header) + body_size
+			if header_info["size"] == size:
+				break
+			header_info["size"] = size
+		self.cache_dir.mkdir(parents=True, exist_ok=True)
+		fd, temp_name = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+		try:
+			with os.fdopen(fd, "wb") as f:
+				f.write(self._header.pack(self.magic, self.version, len(header)))
+				f.write(header)
+				for data in tables:
+					f.write(data)
+					f.write(b"\0" * (-len(data) % 8))
+				f.write(image.payload)
+			os.replace(temp_name, cache_path)
+		except BaseException:
+			try:
+				os.unlink(temp_name)
+			except OSError:
+				pass
+			raise
+
+	def _read(self, cls, cache_path: pathlib.Path):
+		"""
+		キャッシュファイルを読み込む
+		ヘッダと一致しない(途中で切れたなど)キャッシュファイルはValueErrorとし、作り直す
+		"""
+		with cache_path.open("rb") as f:
+			buff = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+		magic, version, header_len = self._header.unpack_from(buff)
+		if magic != self.magic or version != self.version:
+			raise ValueError("invalid cache file")
+		pos = self._header.size
+		header = json.loads(bytes(buff[pos:pos + header_len]))
+		if header["class"] != cls.__name__:
+			raise ValueError("invalid cache file")
+		if len(buff) != header["size"]:
+			raise ValueError("truncated cache file")
+		pos += header_len
+		# レコード情報
+		count = header["count"]
+		tables = []
+		for typecode in header["typecode"]:
+			table = array(typecode)
+			size = table.itemsize * count
+			data = buff[pos:pos + size]
+			if len(data) != size:
+				raise ValueError("truncated cache file")
+			table.frombytes(data)
+			tables.append(table)
+			pos += size + (-size % 8)
+		image = hex_image()
+		image.addr, image.offset, image.length = tables
+		# データはmmapを直接参照する
+		image.payload = buff[pos:pos + header["payload"]]
+		if len(image.payload) != header["payload"]:
+			raise ValueError("truncated cache file")
+		return cls._restore(header["state"], header["paths"], image)
+
+	def _entries(self):
+		if not self.cache_dir.exists():
+			return []
+		return list(self.cache_dir.glob("*" + self.suffix))
+
+	def _evict(self):
+		"""
+		合計サイズが上限を超えていたら、最終アクセスの古いものから削除する
+		"""
+		entries = []
+		for path in self._entries():
+			try:
+				stat = path.stat()
+			except OSError:
+				continue
+			entries.append((stat.st_mtime_ns, stat.st_size, path))
+		total = sum(size for _, size, _ in entries)
+		for _, size, path in sorted(entries):
+			if total <= self.max_size:
+				break
+			try:
+				path.unlink()
+				total -= size
+			except OSError:
+				# 使用中(mmap中)のものは残す
+				pass
@@ -0,0 +1,78 @@
+"""
+テスト共通の設定とHEXファイル生成
+データを指定してIntel HEX/Sレコードのファイルを作成し、バイト単位の参照値と比較する
+"""
+import sys
+import pathlib
+
+import pytest
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root_dir))
+sys.path.insert(0, str(root_dir / "bench"))
+
+import hex_gen
+from pyHexTextFile import lazy_numpy
+
+
+def write_intel_hex(path: pathlib.Path, blocks, record_len: int = 16):
+	"""
+	blocks: (開始アドレス, データ)のリスト
+	64KB境界毎に拡張リニアアドレスレコード(04)を出力する
+	"""
+	with path.open("w") as f:
+		for begin, data in blocks:
+			ext_addr = None
+			pos = 0
+			while pos < len(data):
+				addr = begin + pos
+				if ext_addr != addr >> 16:
+					ext_addr = addr >> 16
+					f.write(hex_gen.intel_hex_record(4, 0, ext_addr.to_bytes(2, 'big')))
+				length = min(record_len, len(data) - pos, 0x10000 - (addr & 0xFFFF))
+				f.write(hex_gen.intel_hex_record(0, addr & 0xFFFF, data[pos:pos + length]))
+				pos += length
+		f.write(hex_gen.intel_hex_record(1, 0, b""))
+
+
+def write_s_record(path: pathlib.Path, blocks, record_len: int = 16, record_type: int = 3):
+	"""
+	blocks: (開始アドレス, データ)のリスト
+	"""
+	addr_len = hex_gen.s_record_addr_len[record_type]
+	with path.open("w") as f:
+		f.write(hex_gen.s_record(0, 0, 2, path.name.encode()))
+		for begin, data in blocks:
+			for pos in range(0, len(data), record_len):
+				f.write(hex_gen.s_record(record_type, begin + pos, addr_len, data[pos:pos + record_len]))
+		end_type = hex_gen.s_record_end_type[record_type]
+		f.write(hex_gen.s_record(end_type, 0, hex_gen.s_record_addr_len[10 - end_type], b""))
+
+
+# フォーマット名→(拡張子, 出力関数)
+writer_tbl = {
+	"intel_hex": (".hex", write_intel_hex),
+	"s_record": (".mot", write_s_record),
+}
+
+
+@pytest.fixture(params=list(writer_tbl.keys()))
+def make_hex_file(request, tmp_path):
+	"""
+	blocksのデータのHEXファイルを作成する関数(フォーマット毎にパラメータ化)
+	"""
+	suffix, write = writer_tbl[request.param]
+
+	def make(blocks, **kwargs) -> pathlib.Path:
+		path = tmp_path / ("image" + suffix)
+		write(path, blocks, **kwargs)
+		return path
+	return make
+
+
+@pytest.fixture(params=[False, pytest.param(True, marks=pytest.mark.skipif(not lazy_numpy.available, reason="NumPy is not installed"))])
+def use_numpy(request):
+	"""
+	1行ずつの解析/NumPyの一括デコードでパラメータ化する
+	"""
+	return request.param
@@ -0,0 +1,63 @@
+"""
+バイナリファイル(.bin)の入出力のテスト
+HEXファイルから出力したバイナリを読み込み、データとチェックサムが元のイメージと一致することを確認する
+"""
+import gzip
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.bin_file import bin_file, export_bin
+
+
+blocks = [(0x1000, bytes(range(256)) * 4), (0x1800, b"\x12\x34\x56"), (0x2000, bytes(range(255, -1, -1)))]
+
+
+def expected_bin(blank: int, addr_begin: int, addr_end: int) -> bytes:
+	memory = bytearray([blank]) * (addr_end - addr_begin + 1)
+	for begin, data in blocks:
+		for pos, value in enumerate(data):
+			if addr_begin <= begin + pos <= addr_end:
+				memory[begin + pos - addr_begin] = value
+	return bytes(memory)
+
+
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+@pytest.mark.parametrize("addr_range", [(None, None), (0x0F00, 0x2200), (0x1200, 0x1801)])
+def test_export_bin(make_hex_file, tmp_path, blank, addr_range):
+	hex_file = load_hex_file(make_hex_file(blocks))
+	addr_begin, addr_end = addr_range
+	path = tmp_path / "image.bin"
+	size = export_bin(hex_file, path, blank, addr_begin, addr_end, block_size=256)
+	if addr_begin is None:
+		addr_begin, addr_end = hex_file._address_begin, hex_file._address_end
+	expected = expected_bin(blank, addr_begin, addr_end)
+	assert size == len(expected)
+	assert path.read_bytes() == expected
+
+
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+def test_bin_round_trip(make_hex_file, tmp_path, blank):
+	hex_file = load_hex_file(make_hex_file(blocks))
+	path = tmp_path / "image.bin"
+	export_bin(hex_file, path, blank)
+	loaded = bin_file(path, base_addr=hex_file._address_begin)
+	assert (loaded._address_begin, loaded._address_end) == (hex_file._address_begin, hex_file._address_end)
+	# 出力範囲内はblankで埋めているため同じblankのチェックサムは一致する
+	assert loaded.checksum(blank, False) == hex_file.checksum(blank, False)
+	assert loaded.checksum(blank, True, 0x1010, 0x1FFF) == hex_file.checksum(blank, True, 0x1010, 0x1FFF)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("kwargs", [{"use_numpy": True}, {"use_numpy": False, "lazy": True, "coalesce": False}])
+def test_load_bin_ignores_parser_options(tmp_path, compress, kwargs):
+	data = bytes(range(256)) * 3
+	path = tmp_path / "image.bin"
+	path.write_bytes(data)
+	if compress:
+		path = tmp_path / "image.bin.gz"
+		path.write_bytes(gzip.compress(data))
+	hex_file = load_hex_file(path, **kwargs)
+	assert isinstance(hex_file, bin_file)
+	assert (hex_file._address_begin, hex_file._address_end) == (0, len(data) - 1)
+	assert hex_file.checksum(0xFF, False) == sum(data) & 0xFFFFFFFF
@@ -0,0 +1,169 @@
+"""
+ブロック単位のダイジェストマップとイメージ比較のテスト
+差分範囲が、アドレス範囲をバイト毎に比較する参照実装と一致することを確認する
+"""
+import json
+import random
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.block_map import block_map, diff_range, diff_images, diff_map, main
+
+
+old_blocks = [(0x0000, bytes(range(256)) * 4), (0x1800, bytes([0x5A]) * 0x300), (0x10000, bytes(range(200)))]
+
+
+def make_pair(make_hex_file, tmp_path, new_blocks):
+	"""
+	old_blocks/new_blocksのファイルを作成する
+	"""
+	old_path = make_hex_file(old_blocks)
+	old_path = old_path.rename(tmp_path / ("old" + old_path.suffix))
+	new_path = make_hex_file(new_blocks)
+	return old_path, new_path
+
+
+def memory_of(blocks) -> dict:
+	memory = {}
+	for begin, data in blocks:
+		for pos, value in enumerate(data):
+			memory[begin + pos] = value
+	return memory
+
+
+def reference_diff(new_blocks, blank: int = 0xFF):
+	"""
+	blank埋めしたイメージをバイト毎に比較した差分範囲
+	"""
+	old = memory_of(old_blocks)
+	new = memory_of(new_blocks)
+	ranges = []
+	for addr in sorted(old.keys() | new.keys()):
+		if old.get(addr, blank) == new.get(addr, blank):
+			continue
+		if ranges and ranges[-1][1] + 1 == addr:
+			ranges[-1][1] = addr
+		else:
+			ranges.append([addr, addr])
+	return [diff_range(begin, end) for begin, end in ranges]
+
+
+def modified_blocks(seed: int):
+	"""
+	ランダムな位置のバイトを書き換え、データの追加/削除をしたブロック
+	"""
+	rand = random.Random(seed)
+	blocks = []
+	for begin, data in old_blocks:
+		data = bytearray(data)
+		for _ in range(8):
+			pos = rand.randrange(len(data))
+			for i in range(pos, min(len(data), pos + rand.randrange(1, 40))):
+				data[i] = rand.randrange(256)
+		blocks.append((begin, bytes(data)))
+	# 末尾を削除/新しい領域を追加
+	blocks[1] = (blocks[1][0], blocks[1][1][:0x200])
+	blocks.append((0x20000, bytes([0x33]) * 0x10))
+	return blocks
+
+
+@pytest.mark.parametrize("block_size", [16, 100, 4096])
+@pytest.mark.parametrize("algorithm", ["sha256", "blake2b"])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_diff_images(make_hex_file, tmp_path, block_size, algorithm, seed):
+	new_blocks = modified_blocks(seed)
+	old_path, new_path = make_pair(make_hex_file, tmp_path, new_blocks)
+	ranges = diff_images(load_hex_file(old_path), load_hex_file(new_path), block_size, 0xFF, algorithm)
+	assert ranges == reference_diff(new_blocks)
+
+
+def test_identical_images(make_hex_file, tmp_path):
+	old_path, new_path = make_pair(make_hex_file, tmp_path, old_blocks)
+	assert diff_images(load_hex_file(old_path), load_hex_file(new_path)) == []
+
+
+def test_blank_data_is_not_a_difference(make_hex_file, tmp_path):
+	"""
+	データが無いアドレスとblankのデータは同じ内容とする
+	"""
+	new_blocks = old_blocks + [(0x4000, bytes([0xFF]) * 0x100)]
+	old_path, new_path = make_pair(make_hex_file, tmp_path, new_blocks)
+	assert diff_images(load_hex_file(old_path), load_hex_file(new_path), blank=0xFF) == []
+	assert diff_images(load_hex_file(old_path), load_hex_file(new_path), blank=0x00) == [diff_range(0x4000, 0x40FF)]
+
+
+def test_swapped_bytes(make_hex_file, tmp_path):
+	"""
+	総和が変わらない入れ替えも検出する
+	"""
+	data = bytearray(old_blocks[0][1])
+	data[0x10], data[0x11] = data[0x11], data[0x10]
+	new_blocks = [(old_blocks[0][0], bytes(data))] + old_blocks[1:]
+	old_path, new_path = make_pair(make_hex_file, tmp_path, new_blocks)
+	assert diff_images(load_hex_file(old_path), load_hex_file(new_path)) == [diff_range(0x10, 0x11)]
+
+
+@pytest.mark.parametrize("block_size", [64, 4096])
+def test_diff_map(make_hex_file, tmp_path, block_size):
+	"""
+	マップとの比較はブロック単位の範囲を返す
+	"""
+	new_blocks = modified_blocks(3)
+	old_path, new_path = make_pair(make_hex_file, tmp_path, new_blocks)
+	map_path = tmp_path / "old.json"
+	block_map.from_image(load_hex_file(old_path), block_size).save(map_path)
+	ranges = diff_map(block_map.load(map_path), load_hex_file(new_path))
+	for addr_begin, addr_end in ranges:
+		assert addr_begin % block_size == 0
+		assert (addr_end + 1) % block_size == 0
+	# バイト単位の差分をすべて含み、差分の無いブロックを含まない
+	expected = reference_diff(new_blocks)
+	blocks = {addr // block_size for addr_begin, addr_end in expected for addr in range(addr_begin, addr_end + 1)}
+	assert {addr // block_size for addr_begin, addr_end in ranges for addr in range(addr_begin, addr_end + 1, block_size)} == blocks
+
+
+def test_diff_with_old_map(make_hex_file, tmp_path):
+	new_blocks = modified_blocks(4)
+	old_path, new_path = make_pair(make_hex_file, tmp_path, new_blocks)
+	old = load_hex_file(old_path)
+	old_map = block_map.from_image(old, 256, 0xFF, "blake2b")
+	assert diff_images(old, load_hex_file(new_path), old_map=old_map) == reference_diff(new_blocks)
+
+
+def test_sum_rejected_for_diff(make_hex_file, tmp_path):
+	old_path, new_path = make_pair(make_hex_file, tmp_path, old_blocks)
+	old, new = load_hex_file(old_path), load_hex_file(new_path)
+	with pytest.raises(Exception, match="cannot detect all differences"):
+		diff_images(old, new, algorithm="sum")
+	sum_map = block_map.from_image(old, algorithm="sum")
+	with pytest.raises(Exception, match="cannot detect all differences"):
+		diff_map(sum_map, new)
+	with pytest.raises(Exception, match="cannot detect all differences"):
+		diff_images(old, new, old_map=sum_map)
+
+
+def test_incompatible_maps(make_hex_file):
+	hex_file = load_hex_file(make_hex_file(old_blocks))
+	with pytest.raises(Exception, match="cannot be compared"):
+		block_map.from_image(hex_file, 4096).diff_blocks(block_map.from_image(hex_file, 1024))
+
+
+def test_map_round_trip(make_hex_file):
+	digest_map = block_map.from_image(load_hex_file(make_hex_file(old_blocks)), 1024, 0x00, "sha256")
+	# データを含むブロックだけ保持する
+	assert sorted(digest_map.blocks) == [0x0000, 0x0006, 0x0040]
+	restored = block_map.from_dict(json.loads(json.dumps(digest_map.to_dict())))
+	assert restored.compatible(digest_map)
+	assert restored.blocks == digest_map.blocks
+	assert restored.diff_blocks(digest_map) == []
+
+
+def test_main(make_hex_file, tmp_path, capsys):
+	new_blocks = modified_blocks(5)
+	old_path, new_path = make_pair(make_hex_file, tmp_path, new_blocks)
+	assert main([str(old_path), str(new_path), "--format", "json"]) == 1
+	ranges = [diff_range(**item) for item in json.loads(capsys.readouterr().out)]
+	assert ranges == reference_diff(new_blocks)
+	assert main([str(old_path), str(old_path)]) == 0
+	assert capsys.readouterr().out == ""
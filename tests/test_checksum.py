@@ -0,0 +1,99 @@
+"""
+チェックサム計算の参照テスト
+生成したIntel HEX/Sレコードのチェックサムを、アドレス範囲をバイト毎に走査する参照実装と比較する
+"""
+import random
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile import lazy_numpy
+
+
+def reference_checksum(blocks, blank: int, twos_compl: bool, addr_begin: int, addr_end: int) -> int:
+	"""
+	アドレス範囲をバイト毎に走査して総和を求める(データが無いアドレスはblank)
+	"""
+	memory = {}
+	for begin, data in blocks:
+		for pos, value in enumerate(data):
+			memory[begin + pos] = value
+	total = sum(memory.get(addr, blank) for addr in range(addr_begin, addr_end + 1))
+	if twos_compl:
+		return -total & 0xFFFFFFFF
+	return total & 0xFFFFFFFF
+
+
+def make_blocks(seed: int):
+	"""
+	隙間と64KB境界をまたぐデータを含むブロック
+	"""
+	rand = random.Random(seed)
+	layout = [(0x0000, 0x300), (0x0400, 0x50), (0xFFC0, 0x80), (0x12345, 0x1FF), (0x20000, 1)]
+	return [(begin, bytes(rand.randrange(256) for _ in range(size))) for begin, size in layout]
+
+
+use_numpy_params = [False, pytest.param(True, marks=pytest.mark.skipif(not lazy_numpy.available, reason="NumPy is not installed"))]
+
+
+@pytest.mark.parametrize("use_numpy", use_numpy_params)
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+@pytest.mark.parametrize("twos_compl", [True, False])
+def test_checksum_full_range(make_hex_file, use_numpy, blank, twos_compl):
+	blocks = make_blocks(1)
+	hex_file = load_hex_file(make_hex_file(blocks), use_numpy=use_numpy)
+	addr_begin = blocks[0][0]
+	addr_end = blocks[-1][0] + len(blocks[-1][1]) - 1
+	assert (hex_file._address_begin, hex_file._address_end) == (addr_begin, addr_end)
+	expected = reference_checksum(blocks, blank, twos_compl, addr_begin, addr_end)
+	assert hex_file.checksum(blank, twos_compl) == expected
+
+
+@pytest.mark.parametrize("use_numpy", use_numpy_params)
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+@pytest.mark.parametrize("addr_range", [
+	# 両端がデータの途中
+	(0x0100, 0x12400),
+	# 両端が隙間
+	(0x0350, 0x1F000),
+	# 隙間だけ
+	(0x0360, 0x03FF),
+	# 1バイト
+	(0xFFFF, 0xFFFF),
+	# データの範囲外を含む
+	(0x0000, 0x2FFFF),
+])
+def test_checksum_clipped_range(make_hex_file, use_numpy, blank, addr_range):
+	blocks = make_blocks(2)
+	hex_file = load_hex_file(make_hex_file(blocks), use_numpy=use_numpy)
+	addr_begin, addr_end = addr_range
+	expected = reference_checksum(blocks, blank, True, addr_begin, addr_end)
+	assert hex_file.checksum(blank, True, addr_begin, addr_end) == expected
+	# 範囲総和インデックスを使用しても同じ結果
+	hex_file.build_index()
+	assert hex_file.checksum(blank, True, addr_begin, addr_end) == expected
+
+
+def test_checksum_wide_range_without_expansion(make_hex_file):
+	"""
+	32bitのアドレス空間全体でもアドレス範囲を展開せずに計算する
+	"""
+	blocks = make_blocks(3)
+	hex_file = load_hex_file(make_hex_file(blocks))
+	data_sum = sum(sum(data) for _, data in blocks)
+	data_len = sum(len(data) for _, data in blocks)
+	expected = -(data_sum + 0xFF * ((1 << 32) - data_len)) & 0xFFFFFFFF
+	assert hex_file.checksum(0xFF, True, 0x00000000, 0xFFFFFFFF) == expected
+
+
+@pytest.mark.parametrize("use_numpy", use_numpy_params)
+def test_checksum_reversed_range(make_hex_file, use_numpy):
+	"""
+	開始アドレス > 終了アドレスの範囲は空の範囲として、インデックスの有無によらず同じ結果になる
+	"""
+	blocks = make_blocks(4)
+	hex_file = load_hex_file(make_hex_file(blocks), use_numpy=use_numpy)
+	expected = hex_file.checksum(0xFF, False, 0x2000, 0x1000)
+	assert expected == 0
+	hex_file.build_index()
+	assert hex_file.checksum(0xFF, False, 0x2000, 0x1000) == expected
@@ -0,0 +1,132 @@
+"""
+チェックサムアルゴリズムのテスト
+空白領域を展開せずに計算した結果を、blank埋めしたバッファを標準ライブラリ/バイト毎の参照実装で計算した結果と比較する
+"""
+import zlib
+import random
+import binascii
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.checksum_algorithm import checksum_algorithm, checksum_algorithm_tbl, crc_algorithm, register_algorithm
+
+
+def reference_word_sum(buffer: bytes, word_size: int, byteorder: str, width: int) -> int:
+	# 末尾の端数は0で埋める
+	buffer = buffer + bytes(-len(buffer) % word_size)
+	total = sum(int.from_bytes(buffer[pos:pos + word_size], byteorder) for pos in range(0, len(buffer), word_size))
+	return total & ((1 << width) - 1)
+
+
+# アルゴリズム名→blank埋めしたバッファの参照実装
+reference_tbl = {
+	"byte_sum": lambda buffer: sum(buffer) & 0xFFFFFFFF,
+	"word16_le": lambda buffer: reference_word_sum(buffer, 2, "little", 16),
+	"word16_be": lambda buffer: reference_word_sum(buffer, 2, "big", 16),
+	"word32_le": lambda buffer: reference_word_sum(buffer, 4, "little", 32),
+	"word32_be": lambda buffer: reference_word_sum(buffer, 4, "big", 32),
+	"crc16_ccitt": lambda buffer: binascii.crc_hqx(buffer, 0xFFFF),
+	"crc32": lambda buffer: zlib.crc32(buffer),
+}
+
+
+def make_blocks():
+	rand = random.Random(5)
+	# 奇数アドレス/奇数長のデータでワードの境界をずらす
+	layout = [(0x1001, 0x81), (0x1100, 0x10), (0x1203, 0x33), (0x3000, 7)]
+	return [(begin, bytes(rand.randrange(256) for _ in range(size))) for begin, size in layout]
+
+
+def blank_filled(blocks, blank: int, addr_begin: int, addr_end: int) -> bytes:
+	buffer = bytearray([blank]) * (addr_end - addr_begin + 1)
+	for begin, data in blocks:
+		for pos, value in enumerate(data):
+			if addr_begin <= begin + pos <= addr_end:
+				buffer[begin + pos - addr_begin] = value
+	return bytes(buffer)
+
+
+@pytest.mark.parametrize("algorithm", list(reference_tbl.keys()))
+@pytest.mark.parametrize("blank", [0x00, 0xFF, 0x5A])
+@pytest.mark.parametrize("addr_range", [(None, None), (0x1000, 0x3010), (0x1085, 0x1205)])
+def test_algorithm_matches_reference(make_hex_file, algorithm, blank, addr_range):
+	blocks = make_blocks()
+	hex_file = load_hex_file(make_hex_file(blocks))
+	addr_begin, addr_end = addr_range
+	if addr_begin is None:
+		addr_begin, addr_end = hex_file._address_begin, hex_file._address_end
+	expected = reference_tbl[algorithm](blank_filled(blocks, blank, addr_begin, addr_end))
+	assert hex_file.checksum(blank, False, addr_begin, addr_end, algorithm) == expected
+
+
+@pytest.mark.parametrize("algorithm", ["crc16_ccitt", "crc32"])
+@pytest.mark.parametrize("value", [0x00, 0xFF, 0xA5])
+@pytest.mark.parametrize("length", [1, 0x10000, 0x10001, 0x123457])
+def test_crc_fill_matches_kernel(algorithm, value, length):
+	algo = checksum_algorithm_tbl[algorithm]
+	# 写像のべき乗で計算した空白領域を、展開したデータの計算結果と比較する
+	filled = algo(0)
+	filled.update(0, memoryview(b"\x12\x34"))
+	filled.fill(2, value, length)
+	filled.update(2 + length, memoryview(b"\x56"))
+	expected = reference_tbl[algorithm](b"\x12\x34" + bytes([value]) * length + b"\x56")
+	assert filled.result() == expected
+
+
+@pytest.mark.parametrize("algorithm", ["word16_le", "word16_be", "word32_le", "word32_be"])
+def test_word_sum_fill_lanes(algorithm):
+	algo = checksum_algorithm_tbl[algorithm]
+	word_size = algo.word_size
+	for offset in range(word_size):
+		for length in range(1, 3 * word_size):
+			result = algo(0)
+			result.fill(offset, 0x5A, length)
+			buffer = bytes(offset) + bytes([0x5A]) * length
+			assert result.result() == reference_word_sum(buffer, word_size, algo.byteorder, algo.width)
+
+
+def test_abstract_algorithm():
+	class incomplete(checksum_algorithm):
+		def update(self, addr, data):
+			pass
+	with pytest.raises(TypeError):
+		incomplete(0)
+	with pytest.raises(TypeError):
+		crc_algorithm(0)
+	with pytest.raises(Exception, match="not fully implemented"):
+		register_algorithm("incomplete", incomplete)
+	with pytest.raises(Exception, match="not a checksum algorithm"):
+		register_algorithm("sum", sum)
+	assert "incomplete" not in checksum_algorithm_tbl
+
+
+def test_register_algorithm(make_hex_file):
+	class xor8(checksum_algorithm):
+		width = 8
+
+		def __init__(self, addr_begin):
+			super().__init__(addr_begin)
+			self.value = 0
+
+		def update(self, addr, data):
+			for byte in data:
+				self.value ^= byte
+
+		def fill(self, addr, value, length):
+			if length & 1:
+				self.value ^= value
+
+		def result(self):
+			return self.value
+	register_algorithm("xor8", xor8)
+	try:
+		blocks = make_blocks()
+		hex_file = load_hex_file(make_hex_file(blocks))
+		buffer = blank_filled(blocks, 0xFF, hex_file._address_begin, hex_file._address_end)
+		expected = 0
+		for byte in buffer:
+			expected ^= byte
+		assert hex_file.checksum(0xFF, False, algorithm="xor8") == expected
+	finally:
+		del checksum_algorithm_tbl["xor8"]
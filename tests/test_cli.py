@@ -0,0 +1,171 @@
+"""
+コマンドライン実行のテスト
+JSON/CSVの出力がファイルの解析結果と一致すること、エラーのあるファイルで終了コードが1になることを確認する
+"""
+import io
+import csv
+import json
+
+import pytest
+
+from pyHexTextFile import cli
+from pyHexTextFile.hex_loader import load_hex_file
+
+from conftest import write_intel_hex
+
+
+blocks = [(0x0000, bytes(range(256)) * 2), (0x12340, bytes([0x5A]) * 0x40)]
+
+
+def run_cli(capsys, *argv):
+	"""
+	CLIを実行して(終了コード, 標準出力)を返す
+	"""
+	code = cli.main(["--no-cache", "--jobs", "1", *argv])
+	return code, capsys.readouterr().out
+
+
+def expected_checksum(path, blank: int = 0xFF, twos_compl: bool = True, addr_begin: int = None, addr_end: int = None) -> str:
+	return f'{load_hex_file(path).checksum(blank, twos_compl, addr_begin, addr_end):08X}'
+
+
+def test_json_output(make_hex_file, capsys):
+	path = make_hex_file(blocks)
+	code, out = run_cli(capsys, str(path))
+	assert code == 0
+	lines = out.splitlines()
+	assert len(lines) == 1
+	result = json.loads(lines[0])
+	assert result["file"] == str(path)
+	assert result["type"] == type(load_hex_file(path)).__name__
+	assert result["algorithm"] == "byte_sum"
+	assert result["blank"] == "FF"
+	assert (result["addr_begin"], result["addr_end"]) == ("00000000", "0001237F")
+	assert result["checksum"] == expected_checksum(path)
+	assert "error" not in result
+
+
+def test_csv_output(make_hex_file, capsys):
+	path = make_hex_file(blocks)
+	code, out = run_cli(capsys, "--format", "csv", "--preset", "preset1", str(path))
+	assert code == 0
+	rows = list(csv.DictReader(io.StringIO(out)))
+	assert list(rows[0].keys()) == cli.output_fields
+	assert len(rows) == 1
+	row = rows[0]
+	assert row["preset"] == "preset1"
+	assert (row["addr_begin"], row["addr_end"]) == ("00000000", "0000FFFF")
+	# 2の補数「あり＋なし」は1行に両方を出力する
+	assert row["checksum"] == expected_checksum(path, 0xFF, True, 0x0000, 0xFFFF)
+	assert row["checksum_no_twos_compl"] == expected_checksum(path, 0xFF, False, 0x0000, 0xFFFF)
+	assert row["error"] == ""
+
+
+def test_override_settings(make_hex_file, capsys):
+	path = make_hex_file(blocks)
+	code, out = run_cli(capsys, "--blank", "00", "--range", "100-12345", "--twos-compl", "disable", str(path))
+	assert code == 0
+	result = json.loads(out)
+	assert result["blank"] == "00"
+	assert (result["addr_begin"], result["addr_end"]) == ("00000100", "00012345")
+	assert "checksum" not in result
+	assert result["checksum_no_twos_compl"] == expected_checksum(path, 0x00, False, 0x100, 0x12345)
+
+
+def test_all_presets(make_hex_file, capsys):
+	path = make_hex_file(blocks)
+	code, out = run_cli(capsys, "--all-presets", str(path))
+	assert code == 0
+	results = [json.loads(line) for line in out.splitlines()]
+	assert [result["preset"] for result in results] == list(cli.checksum_preset.keys())
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_multiple_files_in_order(tmp_path, capsys, jobs):
+	"""
+	プロセスプールを使用しても入力順に出力する
+	"""
+	paths = []
+	for index in range(4):
+		path = tmp_path / f"image{index}.hex"
+		write_intel_hex(path, [(0x1000 * index, bytes([index + 1]) * 0x100)])
+		paths.append(str(path))
+	code = cli.main(["--no-cache", "--jobs", jobs, *paths])
+	out = capsys.readouterr().out
+	assert code == 0
+	results = [json.loads(line) for line in out.splitlines()]
+	assert [result["file"] for result in results] == paths
+	assert [result["checksum"] for result in results] == [expected_checksum(path) for path in paths]
+
+
+def test_glob_pattern(tmp_path, capsys):
+	for name in ("b.hex", "a.hex"):
+		write_intel_hex(tmp_path / name, blocks)
+	code, out = run_cli(capsys, str(tmp_path / "*.hex"))
+	assert code == 0
+	results = [json.loads(line) for line in out.splitlines()]
+	assert [result["file"] for result in results] == [str(tmp_path / "a.hex"), str(tmp_path / "b.hex")]
+
+
+def test_missing_file_exit_code(make_hex_file, tmp_path, capsys):
+	"""
+	エラーのファイルはerrorを出力して他のファイルの計算を続け、終了コードを1にする
+	"""
+	path = make_hex_file(blocks)
+	missing = tmp_path / "missing.hex"
+	code, out = run_cli(capsys, str(missing), str(path))
+	assert code == 1
+	results = [json.loads(line) for line in out.splitlines()]
+	assert results[0]["file"] == str(missing)
+	assert results[0]["error"]
+	assert results[1]["checksum"] == expected_checksum(path)
+
+
+def test_invalid_record_exit_code(tmp_path, capsys):
+	path = tmp_path / "broken.hex"
+	path.write_text(":0400000001020304F1\n:00000001FF\n")
+	code, out = run_cli(capsys, "--format", "csv", str(path))
+	assert code == 1
+	rows = list(csv.DictReader(io.StringIO(out)))
+	assert rows[0]["file"] == str(path)
+	assert rows[0]["error"]
+	assert rows[0]["checksum"] == ""
+
+
+def test_invalid_argument_exit_code(make_hex_file, capsys):
+	path = make_hex_file(blocks)
+	with pytest.raises(SystemExit) as excinfo:
+		cli.main(["--range", "1000", str(path)])
+	assert excinfo.value.code == 2
+
+
+def test_overlap_count(tmp_path, capsys):
+	path = tmp_path / "overlap.hex"
+	write_intel_hex(path, [(0x0000, bytes(0x20)), (0x0010, bytes([1]) * 0x20)])
+	code, out = run_cli(capsys, "--overlap", "last", str(path))
+	assert code == 0
+	result = json.loads(out)
+	assert result["overlaps"] == 1
+	assert result["checksum"] == expected_checksum(path)
+
+
+def test_merge(tmp_path, capsys):
+	paths = [tmp_path / "low.hex", tmp_path / "high.hex"]
+	write_intel_hex(paths[0], [(0x0000, bytes([0x11]) * 0x100)])
+	write_intel_hex(paths[1], [(0x0100, bytes([0x22]) * 0x100)])
+	code, out = run_cli(capsys, "--merge", *map(str, paths))
+	assert code == 0
+	result = json.loads(out)
+	assert result["file"] == "+".join(map(str, paths))
+	assert result["checksum"] == f'{-(0x11 * 0x100 + 0x22 * 0x100) & 0xFFFFFFFF:08X}'
+
+
+def test_stats_output(make_hex_file, tmp_path, capsys):
+	path = make_hex_file(blocks)
+	stats_path = tmp_path / "stats.json"
+	code, out = run_cli(capsys, "--stats", str(stats_path), str(path))
+	assert code == 0
+	# 計測結果は標準出力に含めない
+	assert "stats" not in json.loads(out)
+	stats = json.loads(stats_path.read_text())
+	assert len(stats) == 1
@@ -0,0 +1,108 @@
+"""
+アドレスが連続するレコードの連結のテスト
+連結したイメージ(coalesce=True)のセグメント/チェックサム/重なりが、レコード毎に保持したイメージと一致することを確認する
+"""
+import random
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_image import hex_image
+
+
+def make_blocks(seed: int):
+	"""
+	連続するレコード, 隙間, 64KB境界, 重なりを含むブロック
+	"""
+	rand = random.Random(seed)
+	layout = [(0x0000, 0x300), (0x0301, 0x4F), (0xFFC0, 0x80), (0x0100, 0x30), (0x12345, 0x1FF)]
+	return [(begin, bytes(rand.randrange(256) for _ in range(size))) for begin, size in layout]
+
+
+def segments_of(hex_file, addr_begin: int, addr_end: int):
+	"""
+	隣接するセグメントを連結したデータ(セグメントの区切りによらず比較する)
+	"""
+	merged = []
+	for addr, data in hex_file._segments(addr_begin, addr_end):
+		if merged and merged[-1][0] + len(merged[-1][1]) == addr:
+			merged[-1][1] += bytes(data)
+		else:
+			merged.append([addr, bytearray(data)])
+	return merged
+
+
+def overlap_addrs(hex_file):
+	return {addr for overlap in hex_file.overlaps for addr in range(overlap.addr_begin, overlap.addr_end + 1)}
+
+
+@pytest.mark.parametrize("policy", ["first", "last"])
+def test_coalesce_same_results(make_hex_file, use_numpy, policy):
+	path = make_hex_file(make_blocks(1))
+	joined = load_hex_file(path, overlap_policy=policy, use_numpy=use_numpy)
+	separate = load_hex_file(path, overlap_policy=policy, use_numpy=use_numpy, coalesce=False)
+	# 連結したイメージのレコード数は少ない
+	assert len(joined.image) < len(separate.image)
+	assert (joined._address_begin, joined._address_end) == (separate._address_begin, separate._address_end)
+	for addr_begin, addr_end in [(0x0000, 0x1FFFF), (0x0120, 0x0310), (0xFFFF, 0x10000)]:
+		assert segments_of(joined, addr_begin, addr_end) == segments_of(separate, addr_begin, addr_end)
+	for algorithm in ("byte_sum", "word32_be", "crc16_ccitt"):
+		for blank in (0x00, 0xFF):
+			assert joined.checksum(blank, True, None, None, algorithm) == separate.checksum(blank, True, None, None, algorithm)
+	# 重なりの範囲(レコードの組は区切りによって変わる)/優先する値は同じ
+	assert overlap_addrs(joined) == overlap_addrs(separate)
+	for addr in (0x0000, 0x0110, 0x0300, 0x0301, 0x10000):
+		record = joined.record_at(addr)
+		expected = separate.record_at(addr)
+		assert (record is None) == (expected is None)
+		if expected is not None:
+			assert record.data[addr - record.addr] == expected.data[addr - expected.addr]
+
+
+def test_coalesce_index(make_hex_file):
+	path = make_hex_file(make_blocks(2))
+	separate = load_hex_file(path, coalesce=False)
+	expected = separate.checksum(0xFF, True, 0x0050, 0x12400)
+	joined = load_hex_file(path)
+	joined.build_index()
+	assert joined.checksum(0xFF, True, 0x0050, 0x12400) == expected
+
+
+def test_image_add():
+	image = hex_image()
+	image.add(0x00, b"\x01\x02")
+	image.add(0x02, b"\x03")
+	# データ長0のレコードは追加しない(連結は続く)
+	image.add(0x03, b"")
+	image.add(0x03, b"\x04")
+	image.add(0x10, b"\x05")
+	assert [(record.addr, bytes(record.data)) for record in image.records()] == [(0x00, b"\x01\x02\x03\x04"), (0x10, b"\x05")]
+	# seal()以降は連結しない
+	image.seal()
+	image.add(0x11, b"\x06")
+	assert [record.addr for record in image.records()] == [0x00, 0x10, 0x11]
+
+
+@pytest.mark.parametrize("coalesce", [True, False])
+def test_image_add_bulk(coalesce):
+	"""
+	add_bulk()とadd()で同じイメージになる
+	"""
+	records = [(0x00, b"\x01\x02"), (0x02, b""), (0x02, b"\x03"), (0x08, b"\x04"), (0x09, b"\x05\x06"), (0x00, b"\x07")]
+	single = hex_image(coalesce)
+	for addr, data in records:
+		single.add(addr, data)
+	bulk = hex_image(coalesce)
+	bulk.add_bulk([addr for addr, _ in records], [len(data) for _, data in records], b"".join(data for _, data in records))
+	assert [(record.addr, bytes(record.data)) for record in bulk.records()] == [(record.addr, bytes(record.data)) for record in single.records()]
+	if coalesce:
+		assert [record.addr for record in bulk.records()] == [0x00, 0x08, 0x00]
+	else:
+		assert [record.addr for record in bulk.records()] == [0x00, 0x02, 0x08, 0x09, 0x00]
+
+
+def test_image_add_bulk_joins_last_record():
+	image = hex_image()
+	image.add(0x00, b"\x01")
+	image.add_bulk([0x01, 0x02], [1, 1], b"\x02\x03")
+	assert [(record.addr, bytes(record.data)) for record in image.records()] == [(0x00, b"\x01\x02\x03")]
@@ -0,0 +1,101 @@
+"""
+展開済みメモリイメージのテスト
+build_dense()後のチェックサムが、展開しないときの計算結果と一致することを確認する
+"""
+import random
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_text_file import checksum_config
+from pyHexTextFile.checksum_algorithm import checksum_algorithm_tbl
+from pyHexTextFile.dense_image import dense_image, dense_word
+from pyHexTextFile import lazy_numpy
+
+pytestmark = pytest.mark.skipif(not lazy_numpy.available, reason="NumPy is not installed")
+
+
+def make_blocks(seed: int):
+	rand = random.Random(seed)
+	layout = [(0x0003, 0x2FD), (0x0400, 0x51), (0x0FFF, 0x82), (0x2345, 0x1FF)]
+	return [(begin, bytes(rand.randrange(256) for _ in range(size))) for begin, size in layout]
+
+
+def sparse_checksums(path, configs):
+	return load_hex_file(path).checksum_multi(configs)
+
+
+@pytest.mark.parametrize("algorithm", list(checksum_algorithm_tbl.keys()))
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+@pytest.mark.parametrize("addr_range", [
+	(None, None),
+	# 奇数長/ワードの途中から
+	(0x0001, 0x2344),
+	# 隙間だけ
+	(0x0300, 0x03FF),
+	(0x0FFF, 0x0FFF),
+])
+def test_dense_matches_sparse(make_hex_file, use_numpy, algorithm, blank, addr_range):
+	path = make_hex_file(make_blocks(1))
+	configs = [checksum_config(blank, twos_compl, *addr_range, algorithm) for twos_compl in (True, False)]
+	hex_file = load_hex_file(path, use_numpy=use_numpy)
+	hex_file.build_dense()
+	assert hex_file.checksum_multi(configs) == sparse_checksums(path, configs)
+
+
+def test_blank_change_reuses_buffer(make_hex_file):
+	"""
+	異なるblankの計算は空白領域だけ埋め直す(データ領域は変えない)
+	"""
+	path = make_hex_file(make_blocks(2))
+	hex_file = load_hex_file(path)
+	dense = hex_file.build_dense()
+	configs = [checksum_config(blank, True, None, None, "word32_be") for blank in (0xFF, 0x00, 0x5A, 0xFF)]
+	assert hex_file.checksum_multi(configs) == sparse_checksums(path, configs)
+	assert hex_file._dense is dense
+	for blank in (0x00, 0xFF):
+		assert hex_file.checksum(blank) == load_hex_file(path).checksum(blank)
+
+
+def test_range_outside_dense(make_hex_file):
+	"""
+	展開した範囲外/総和系以外は展開しないときと同じ計算をする
+	"""
+	path = make_hex_file(make_blocks(3))
+	hex_file = load_hex_file(path)
+	hex_file.build_dense(0x0400, 0x0FFF)
+	configs = [
+		checksum_config(0xFF, True, 0x0400, 0x0FFF, "byte_sum"),
+		checksum_config(0xFF, True, 0x0000, 0x0FFF, "byte_sum"),
+		checksum_config(0xFF, True, 0x0400, 0x0FFF, "crc32"),
+	]
+	assert hex_file.checksum_multi(configs) == sparse_checksums(path, configs)
+
+
+def test_dense_with_index(make_hex_file):
+	path = make_hex_file(make_blocks(4))
+	hex_file = load_hex_file(path)
+	hex_file.build_dense()
+	hex_file.build_index()
+	configs = [checksum_config(0x00, False, 0x0010, 0x2000, algorithm) for algorithm in ("byte_sum", "word16_le")]
+	assert hex_file.checksum_multi(configs) == sparse_checksums(path, configs)
+
+
+def test_dense_word():
+	assert dense_word(checksum_algorithm_tbl["byte_sum"]) == (1, 'little')
+	assert dense_word(checksum_algorithm_tbl["word16_be"]) == (2, 'big')
+	assert dense_word(checksum_algorithm_tbl["word32_le"]) == (4, 'little')
+	assert dense_word(checksum_algorithm_tbl["crc32"]) is None
+
+
+def test_dense_image_word_tail():
+	"""
+	ワード単位の総和は末尾の端数を0で埋める
+	"""
+	dense = dense_image([(0x11, memoryview(bytes([1, 2, 3])))], 0x10, 0x14, 0x00)
+	assert bytes(dense.buffer) == bytes([0, 1, 2, 3, 0])
+	assert dense.data_sum(0x00, 0x10, 0x14, 2, 'big') == 0x0001 + 0x0203 + 0x0000
+	assert dense.data_sum(0xFF, 0x10, 0x14, 2, 'little') == 0x01FF + 0x0302 + 0x00FF
+	assert dense.data_sum(0xFF, 0x11, 0x13) == 6
+	assert dense.contains(0x10, 0x14)
+	assert not dense.contains(0x0F, 0x14)
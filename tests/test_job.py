@@ -0,0 +1,159 @@
+"""
+進捗通知/キャンセル可能なジョブのテスト
+ジョブの結果が直接呼び出した結果と一致すること、進捗通知中のキャンセルで処理を中断することを確認する
+"""
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file, load_job
+from pyHexTextFile.hex_text_file import hex_text_file, checksum_config
+from pyHexTextFile.hex_job import hex_job, job_cancelled, current_job
+from pyHexTextFile.bin_file import export_bin
+
+
+blocks = [(0x0000, bytes(range(256)) * 16), (0x8000, bytes([0x5A]) * 0x1000)]
+
+
+@pytest.fixture
+def small_steps(monkeypatch):
+	"""
+	小さいファイルでも複数回進捗を通知するように読み込み/走査の単位を小さくする
+	"""
+	monkeypatch.setattr(hex_text_file, "read_chunk_size", 1024)
+	monkeypatch.setattr(hex_job, "block_size", 256)
+
+
+def image_of(hex_file):
+	return [(record.addr, bytes(record.data)) for record in hex_file.image.records()]
+
+
+def test_load_job_progress(make_hex_file, small_steps):
+	path = make_hex_file(blocks)
+	progress = []
+	job = load_job(path, progress=lambda done, total: progress.append((done, total)))
+	assert job.run().done()
+	assert image_of(job.result()) == image_of(load_hex_file(path))
+	# 読み込んだバイト数を単調増加で通知し、最後は全体量になる
+	size = path.stat().st_size
+	assert len(progress) > 2
+	assert all(total == size for _, total in progress)
+	assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+	assert progress[-1] == (size, size)
+
+
+def test_load_job_cancel(make_hex_file, small_steps):
+	path = make_hex_file(blocks)
+	progress = []
+
+	def on_progress(done, total):
+		progress.append(done)
+		if len(progress) == 3:
+			job.cancel()
+	job = load_job(path, progress=on_progress)
+	job.run()
+	assert job.cancelled
+	with pytest.raises(job_cancelled):
+		job.result()
+	# キャンセル後は進捗を通知しない
+	assert len(progress) == 3
+
+
+def test_cancel_before_run(make_hex_file):
+	calls = []
+	job = hex_job(lambda: calls.append(1))
+	job.cancel()
+	job.run()
+	assert calls == []
+	with pytest.raises(job_cancelled):
+		job.result()
+
+
+def test_job_exception(tmp_path):
+	job = load_job(tmp_path / "missing.hex")
+	job.run()
+	with pytest.raises(FileNotFoundError):
+		job.result()
+
+
+def test_job_in_thread(make_hex_file):
+	path = make_hex_file(blocks)
+	threads = []
+	job = hex_job(lambda: threads.append(current_job()) or load_hex_file(path).checksum())
+	assert job.start().result(timeout=10) == load_hex_file(path).checksum()
+	assert threads == [job]
+	# 呼び出し元のスレッドは実行中のジョブを持たない
+	assert current_job() is None
+
+
+def test_checksum_job(make_hex_file, small_steps):
+	path = make_hex_file(blocks)
+	hex_file = load_hex_file(path)
+	configs = [checksum_config(0xFF, True, None, None, "crc32"), checksum_config(0x00, False, 0x0100, 0x8FFF, "byte_sum")]
+	progress = []
+	job = hex_file.checksum_job(configs, lambda done, total: progress.append((done, total)))
+	job.run()
+	assert job.result() == hex_file.checksum_multi(configs)
+	total = 0x8FFF + 1
+	assert progress[-1] == (total, total)
+	assert len(progress) > 2
+
+
+def test_checksum_job_cancel(make_hex_file, small_steps):
+	hex_file = load_hex_file(make_hex_file(blocks))
+
+	def on_progress(done, total):
+		if done >= 0x1000:
+			job.cancel()
+	job = hex_file.checksum_job([checksum_config(0xFF, True, None, None, "crc32")], on_progress)
+	job.run()
+	with pytest.raises(job_cancelled):
+		job.result()
+	# 中断後も計算できる
+	configs = [checksum_config(0xFF, True, None, None, "crc32")]
+	assert hex_file.checksum_job(configs).run().result() == hex_file.checksum_multi(configs)
+
+
+def test_lazy_load_cancel(make_hex_file):
+	hex_file = load_hex_file(make_hex_file(blocks), lazy=True)
+	# 実行中にキャンセルを要求してからデコードする
+	job = hex_job(lambda: job.cancel() or hex_file.checksum())
+	job.run()
+	with pytest.raises(job_cancelled):
+		job.result()
+	# デコード途中のレコードは追加しない
+	assert len(hex_file.image) == 0
+	assert hex_file.checksum() == load_hex_file(make_hex_file(blocks)).checksum()
+
+
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+def test_export_bin_job(make_hex_file, tmp_path, small_steps, blank):
+	hex_file = load_hex_file(make_hex_file(blocks))
+	out_path = tmp_path / "image.bin"
+	progress = []
+	job = hex_job(lambda: export_bin(hex_file, out_path, blank, block_size=256), lambda done, total: progress.append((done, total)))
+	job.run()
+	size = 0x8FFF + 1
+	assert job.result() == size
+	assert progress[-1] == (size, size)
+	expected = bytearray([blank]) * size
+	for begin, data in blocks:
+		expected[begin:begin + len(data)] = data
+	assert out_path.read_bytes() == expected
+
+
+@pytest.mark.parametrize("blank", [0x00, 0xFF])
+def test_export_bin_cancel_removes_file(make_hex_file, tmp_path, small_steps, blank):
+	"""
+	キャンセル時は出力途中のファイルを残さない
+	"""
+	hex_file = load_hex_file(make_hex_file(blocks))
+	out_path = tmp_path / "image.bin"
+
+	def on_progress(done, total):
+		if done >= 0x2000:
+			assert out_path.exists()
+			job.cancel()
+	job = hex_job(lambda: export_bin(hex_file, out_path, blank, block_size=256), on_progress)
+	job.run()
+	with pytest.raises(job_cancelled):
+		job.result()
+	assert not out_path.exists()
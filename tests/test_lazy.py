@@ -0,0 +1,109 @@
+"""
+遅延解析のテスト
+計算範囲にかかるレコードだけデコードしても、チェックサム/レコード検索/重なりが一括解析の結果と一致することを確認する
+"""
+import io
+import random
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file, load_hex_stream
+from pyHexTextFile.hex_text_file import hex_record_error
+
+
+def make_blocks(seed: int):
+	"""
+	64KB境界をまたぐデータと重なりを含むブロック
+	"""
+	rand = random.Random(seed)
+	layout = [(0x0000, 0x300), (0x0400, 0x50), (0xFFC0, 0x80), (0x12345, 0x1FF), (0x0200, 0x20)]
+	return [(begin, bytes(rand.randrange(256) for _ in range(size))) for begin, size in layout]
+
+
+def image_of(hex_file):
+	return sorted((record.addr, bytes(record.data)) for record in hex_file.image.records())
+
+
+@pytest.mark.parametrize("addr_range", [
+	(None, None),
+	(0x0100, 0x0120),
+	(0x0350, 0x1F000),
+	(0x10000, 0x10000),
+	(0x20000, 0x2FFFF),
+])
+@pytest.mark.parametrize("algorithm", ["byte_sum", "word16_be", "crc32"])
+def test_lazy_checksum(make_hex_file, use_numpy, addr_range, algorithm):
+	path = make_hex_file(make_blocks(1))
+	eager = load_hex_file(path, use_numpy=use_numpy)
+	lazy = load_hex_file(path, use_numpy=use_numpy, lazy=True)
+	assert (lazy._address_begin, lazy._address_end) == (eager._address_begin, eager._address_end)
+	for blank in (0x00, 0xFF):
+		assert lazy.checksum(blank, True, *addr_range, algorithm) == eager.checksum(blank, True, *addr_range, algorithm)
+
+
+def test_lazy_decodes_only_range(make_hex_file, use_numpy):
+	path = make_hex_file(make_blocks(2))
+	lazy = load_hex_file(path, use_numpy=use_numpy, lazy=True)
+	assert len(lazy.image) == 0
+	lazy.checksum(0xFF, True, 0x0400, 0x040F)
+	# 範囲にかかるレコード(16バイト/レコード)だけデコードする
+	assert [record.addr for record in lazy.image.records()] == [0x0400]
+	lazy.checksum(0xFF, True, 0x0000, 0x000F)
+	# レコードはファイル内の順に並べる
+	assert [record.addr for record in lazy.image.records()] == [0x0000, 0x0400]
+
+
+def test_lazy_load_all(make_hex_file, use_numpy):
+	path = make_hex_file(make_blocks(3))
+	eager = load_hex_file(path, use_numpy=use_numpy, coalesce=False)
+	lazy = load_hex_file(path, use_numpy=use_numpy, lazy=True)
+	lazy.load_all()
+	assert image_of(lazy) == image_of(eager)
+	assert lazy.checksum() == eager.checksum()
+
+
+@pytest.mark.parametrize("policy", ["first", "last"])
+def test_lazy_records_and_overlaps(make_hex_file, use_numpy, policy):
+	"""
+	重なりは未デコードのレコードを含めて検出し、優先レコードは一括解析と同じになる
+	"""
+	path = make_hex_file(make_blocks(4))
+	eager = load_hex_file(path, overlap_policy=policy, use_numpy=use_numpy)
+	lazy = load_hex_file(path, overlap_policy=policy, use_numpy=use_numpy, lazy=True)
+	# 遅延解析のレコードは連結しない
+	records = load_hex_file(path, overlap_policy=policy, use_numpy=use_numpy, coalesce=False)
+	assert len(lazy.image) == 0
+	assert [(overlap.addr_begin, overlap.addr_end) for overlap in lazy.overlaps] == [(overlap.addr_begin, overlap.addr_end) for overlap in eager.overlaps]
+	for addr in (0x0000, 0x0210, 0x0400, 0x10005, 0x12345, 0x20000):
+		assert [(record.addr, bytes(record.data)) for record in lazy.records_at(addr)] == [(record.addr, bytes(record.data)) for record in records.records_at(addr)]
+		lazy_record = lazy.record_at(addr)
+		eager_record = eager.record_at(addr)
+		assert (lazy_record is None) == (eager_record is None)
+		if eager_record is not None:
+			assert bytes(lazy_record.data)[addr - lazy_record.addr] == bytes(eager_record.data)[addr - eager_record.addr]
+	assert lazy.checksum() == eager.checksum()
+
+
+def test_lazy_invalid_record_on_decode(make_hex_file):
+	"""
+	データ部の不正は範囲にかかるレコードをデコードしたときに検出する
+	"""
+	path = make_hex_file(make_blocks(5))
+	expected = load_hex_file(path).checksum(0xFF, True, 0x0000, 0x00FF)
+	lines = path.read_text().splitlines(keepends=True)
+	# 0x0400のレコードのデータ部を書き換える(ヘッダは正しいまま)
+	line_no = next(no for no, line in enumerate(lines, 1) if line.startswith((":10040000", "S31500000400")))
+	line = lines[line_no - 1]
+	lines[line_no - 1] = line[:12] + ("0" if line[12] != "0" else "1") + line[13:]
+	path.write_text("".join(lines))
+	lazy = load_hex_file(path, lazy=True)
+	assert lazy.checksum(0xFF, True, 0x0000, 0x00FF) == expected
+	with pytest.raises(hex_record_error) as excinfo:
+		lazy.checksum(0xFF, True, 0x0400, 0x0400)
+	assert excinfo.value.lines == [line_no]
+
+
+def test_lazy_stream_rejected(make_hex_file):
+	path = make_hex_file(make_blocks(6))
+	with pytest.raises(Exception, match="requires a file path"):
+		load_hex_stream(io.BytesIO(path.read_bytes()), lazy=True)
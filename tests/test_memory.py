@@ -0,0 +1,39 @@
+"""
+解析時のメモリ使用量のテスト
+生成したファイルをtracemallocで計測しながら解析し、最大メモリ確保量がデータサイズの一定倍以内であることを確認する
+(ファイル全体を読み込んだり、レコード毎のオブジェクトを保持したりすると上限を超える)
+"""
+import random
+import tracemalloc
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile import lazy_numpy
+
+
+# 最大メモリ確保量の上限(データサイズに対する倍率)
+# データ(payload)の再確保とチャンク単位の作業領域を含む
+memory_budget = 2.5
+
+
+@pytest.mark.parametrize("use_numpy, data_size", [
+	# 1行ずつの解析は遅いため小さいファイルで計測する
+	(False, 4 * 1024 * 1024),
+	# 一括デコードはチャンク単位の作業領域(一定)があるため大きいファイルで計測する
+	pytest.param(True, 16 * 1024 * 1024, marks=pytest.mark.skipif(not lazy_numpy.available, reason="NumPy is not installed")),
+])
+def test_parse_peak_memory(make_hex_file, use_numpy, data_size):
+	data = random.Random(0).getrandbits(data_size * 8).to_bytes(data_size, "little")
+	path = make_hex_file([(0, data)], record_len=32)
+	if use_numpy:
+		# NumPyの読み込みは計測に含めない
+		lazy_numpy.load()
+	tracemalloc.start()
+	try:
+		hex_file = load_hex_file(path, use_numpy=use_numpy)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	assert hex_file.checksum(0xFF, False) == sum(data)
+	assert peak <= data_size * memory_budget, f"peak {peak / data_size:.2f} x data size"
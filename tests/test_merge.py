@@ -0,0 +1,167 @@
+"""
+複数イメージのマージのテスト
+マージしたイメージのチェックサム/セグメントが、優先度順にバイト毎に書き込む参照実装と一致することを確認する
+"""
+import random
+import itertools
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_merge import hex_merge, merge_hex_files, main
+from pyHexTextFile.hex_text_file import record_overlap_error
+from pyHexTextFile.interval_index import record_overlap
+
+from conftest import write_intel_hex, write_s_record
+
+
+# ブートローダ, アプリケーション, キャリブレーション(アプリケーションの一部を上書き)
+source_blocks = [
+	[(0x0000, bytes([0xB0]) * 0x400)],
+	[(0x0300, bytes(range(256)) * 4), (0x10000, bytes([0xA1]) * 0x80)],
+	[(0x0480, bytes([0xC2]) * 0x40), (0x10040, bytes([0xC3]) * 0x80)],
+]
+
+
+def make_sources(tmp_path, blocks_list=source_blocks):
+	"""
+	Intel HEX/Sレコードを交互に作成してパスのリストを返す
+	"""
+	paths = []
+	for index, blocks in enumerate(blocks_list):
+		if index % 2:
+			path = tmp_path / f"source{index}.mot"
+			write_s_record(path, blocks)
+		else:
+			path = tmp_path / f"source{index}.hex"
+			write_intel_hex(path, blocks)
+		paths.append(path)
+	return paths
+
+
+def reference_memory(blocks_list, policy: str = "last", priority=None) -> dict:
+	"""
+	優先度の低いイメージから順にバイト毎に書き込む
+	"""
+	if priority is None:
+		priority = [0] * len(blocks_list)
+	order = sorted(range(len(blocks_list)), key=lambda index: (priority[index], -index if policy == "first" else index))
+	memory = {}
+	for index in order:
+		for begin, data in blocks_list[index]:
+			for pos, value in enumerate(data):
+				memory[begin + pos] = value
+	return memory
+
+
+def reference_checksum(memory: dict, blank: int, addr_begin: int, addr_end: int) -> int:
+	return -sum(memory.get(addr, blank) for addr in range(addr_begin, addr_end + 1)) & 0xFFFFFFFF
+
+
+def segments_memory(merged, addr_begin: int, addr_end: int) -> dict:
+	memory = {}
+	addr_next = None
+	for addr, data in merged._segments(addr_begin, addr_end):
+		# アドレス昇順で重ならない
+		assert addr_next is None or addr >= addr_next
+		addr_next = addr + len(data)
+		for pos, value in enumerate(bytes(data)):
+			memory[addr + pos] = value
+	return memory
+
+
+@pytest.mark.parametrize("policy", ["first", "last", "report"])
+@pytest.mark.parametrize("priority", [None, [0, 0, 1], [2, 1, 0], [1, 0, 1]])
+def test_merge_matches_reference(tmp_path, policy, priority):
+	merged = merge_hex_files(make_sources(tmp_path), overlap_policy=policy, priority=priority)
+	memory = reference_memory(source_blocks, policy, priority)
+	assert segments_memory(merged, 0x0000, 0x1FFFF) == memory
+	assert (merged._address_begin, merged._address_end) == (0x0000, 0x100BF)
+	for blank in (0x00, 0xFF):
+		assert merged.checksum(blank) == reference_checksum(memory, blank, 0x0000, 0x100BF)
+		assert merged.checksum(blank, True, 0x03F0, 0x10050) == reference_checksum(memory, blank, 0x03F0, 0x10050)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_layout(tmp_path, seed):
+	"""
+	ランダムに重なる多数のブロックでも参照実装と一致する
+	"""
+	rand = random.Random(seed)
+	blocks_list = []
+	for _ in range(4):
+		blocks = []
+		addr = rand.randrange(0x40)
+		for _ in range(rand.randrange(1, 5)):
+			size = rand.randrange(1, 0x80)
+			blocks.append((addr, bytes(rand.randrange(256) for _ in range(size))))
+			addr += size + rand.randrange(0x40)
+		blocks_list.append(blocks)
+	priority = [rand.randrange(3) for _ in blocks_list]
+	for policy in ("first", "last"):
+		merged = merge_hex_files(make_sources(tmp_path, blocks_list), overlap_policy=policy, priority=priority)
+		memory = reference_memory(blocks_list, policy, priority)
+		assert segments_memory(merged, 0x0000, 0xFFFF) == memory
+		assert merged.checksum(0xFF, True, 0x0000, 0x01FF) == reference_checksum(memory, 0xFF, 0x0000, 0x01FF)
+
+
+def test_merge_overlaps(tmp_path):
+	merged = merge_hex_files(make_sources(tmp_path), overlap_policy="report")
+	assert merged.overlaps == [
+		record_overlap(0, 1, 0x0300, 0x03FF),
+		record_overlap(1, 2, 0x0480, 0x04BF),
+		record_overlap(1, 2, 0x10040, 0x1007F),
+	]
+
+
+def test_merge_error_policy(tmp_path):
+	paths = make_sources(tmp_path)
+	with pytest.raises(record_overlap_error):
+		merge_hex_files(paths, overlap_policy="error")
+	# 重ならないイメージはマージできる
+	merged = merge_hex_files(paths[:1] + paths[2:], overlap_policy="error")
+	assert merged.overlaps == []
+
+
+def test_record_at_priority(tmp_path):
+	paths = make_sources(tmp_path)
+	assert merge_hex_files(paths).record_at(0x0490).addr == 0x0480
+	assert merge_hex_files(paths, overlap_policy="first").record_at(0x0490).addr == 0x0300
+	assert merge_hex_files(paths, priority=[0, 1, 0]).record_at(0x0490).addr == 0x0300
+	assert merge_hex_files(paths).record_at(0x0390).addr == 0x0300
+	assert merge_hex_files(paths, overlap_policy="first").record_at(0x0390).addr == 0x0000
+	assert merge_hex_files(paths).record_at(0x8000) is None
+	assert [record.addr for record in merge_hex_files(paths).records_at(0x0390)] == [0x0000, 0x0300]
+
+
+def test_priority_count_mismatch(tmp_path):
+	sources = [load_hex_file(path) for path in make_sources(tmp_path)]
+	with pytest.raises(Exception, match="priority count mismatch"):
+		hex_merge(sources, priority=[1, 0])
+
+
+def test_merge_index(tmp_path):
+	"""
+	範囲総和インデックスを使用しても同じ結果
+	"""
+	merged = merge_hex_files(make_sources(tmp_path), priority=[1, 0, 0])
+	expected = [merged.checksum(0xFF, True, begin, end) for begin, end in itertools.combinations([0x0000, 0x0350, 0x04A0, 0x10060], 2)]
+	merged.build_index()
+	assert [merged.checksum(0xFF, True, begin, end) for begin, end in itertools.combinations([0x0000, 0x0350, 0x04A0, 0x10060], 2)] == expected
+
+
+@pytest.mark.parametrize("suffix", [".hex", ".mot", ".bin"])
+def test_main(tmp_path, capsys, suffix):
+	paths = make_sources(tmp_path)
+	out_path = tmp_path / ("merged" + suffix)
+	assert main([*map(str, paths), "-o", str(out_path), "--overlap", "report", "--priority", "0,0,1"]) == 0
+	assert capsys.readouterr().out.count("overlap:") == 3
+	memory = reference_memory(source_blocks, "last", [0, 0, 1])
+	merged = load_hex_file(out_path)
+	assert merged.checksum(0xFF, True, 0x0000, 0x100BF) == reference_checksum(memory, 0xFF, 0x0000, 0x100BF)
+
+
+def test_main_overlap_error(tmp_path):
+	paths = make_sources(tmp_path)
+	with pytest.raises(record_overlap_error):
+		main([*map(str, paths), "-o", str(tmp_path / "merged.hex")])
@@ -0,0 +1,102 @@
+"""
+アドレスが重なるレコードの扱いのテスト
+4つの扱い(error/first/last/report)それぞれで、チェックサムがバイト毎に優先レコードを選ぶ参照実装と一致することを確認する
+"""
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_text_file import overlap_policy_list, record_overlap_error
+from pyHexTextFile.interval_index import record_overlap
+from pyHexTextFile import lazy_numpy
+
+
+# 0x0010-0x001F, 0x0102-0x0103が重なる
+blocks = [(0x0000, bytes(range(0x20))), (0x0010, bytes([0xA5]) * 0x20), (0x0100, bytes([0x11]) * 4), (0x0102, bytes([0x22]) * 4)]
+expected_overlaps = [record_overlap(0, 1, 0x0010, 0x001F), record_overlap(2, 3, 0x0102, 0x0103)]
+
+
+def reference_checksum(first: bool, blank: int = 0xFF, addr_begin: int = 0x0000, addr_end: int = 0x0105) -> int:
+	"""
+	first: 先に読み込んだレコードを優先する
+	"""
+	memory = {}
+	for begin, data in (reversed(blocks) if first else blocks):
+		for pos, value in enumerate(data):
+			memory[begin + pos] = value
+	return -sum(memory.get(addr, blank) for addr in range(addr_begin, addr_end + 1)) & 0xFFFFFFFF
+
+
+def test_policy_list():
+	assert overlap_policy_list == ["error", "first", "last", "report"]
+
+
+def test_error_policy(make_hex_file, use_numpy):
+	path = make_hex_file(blocks)
+	with pytest.raises(record_overlap_error) as excinfo:
+		load_hex_file(path, overlap_policy="error", use_numpy=use_numpy)
+	assert excinfo.value.overlaps == expected_overlaps
+	assert "00000010-0000001F" in str(excinfo.value)
+
+
+def test_error_policy_without_overlaps(make_hex_file):
+	path = make_hex_file([(0x0000, bytes(0x20)), (0x0020, bytes(0x20))])
+	hex_file = load_hex_file(path, overlap_policy="error")
+	assert hex_file.overlaps == []
+
+
+@pytest.mark.parametrize("policy", ["first", "last", "report"])
+def test_policy_checksum(make_hex_file, use_numpy, policy):
+	path = make_hex_file(blocks)
+	hex_file = load_hex_file(path, overlap_policy=policy, use_numpy=use_numpy)
+	first = policy == "first"
+	assert hex_file.overlap_policy == policy
+	assert hex_file.checksum(0xFF, True) == reference_checksum(first)
+	assert hex_file.checksum(0x00, True, 0x0018, 0x0103) == reference_checksum(first, 0x00, 0x0018, 0x0103)
+	# 優先するレコード
+	assert hex_file.record_at(0x0018).addr == (0x0000 if first else 0x0010)
+	assert hex_file.record_at(0x0102).addr == (0x0100 if first else 0x0102)
+	assert [record.addr for record in hex_file.records_at(0x0018)] == [0x0000, 0x0010]
+	assert hex_file.record_at(0x0080) is None
+
+
+def test_report_policy(make_hex_file):
+	path = make_hex_file(blocks)
+	hex_file = load_hex_file(path)
+	assert hex_file.set_overlap_policy("report") == expected_overlaps
+	assert hex_file.overlaps == expected_overlaps
+	# lastと同じ扱い
+	assert hex_file.checksum(0xFF, True) == reference_checksum(False)
+
+
+def test_default_policy_is_last(make_hex_file):
+	hex_file = load_hex_file(make_hex_file(blocks))
+	assert hex_file.overlap_policy == "last"
+	assert hex_file.checksum(0xFF, True) == reference_checksum(False)
+
+
+def test_change_policy_rebuilds_index(make_hex_file):
+	"""
+	インデックス作成後に扱いを変えても、変更後の優先レコードで計算する
+	"""
+	hex_file = load_hex_file(make_hex_file(blocks))
+	hex_file.build_index()
+	assert hex_file.checksum(0xFF, True) == reference_checksum(False)
+	hex_file.set_overlap_policy("first")
+	assert hex_file.checksum(0xFF, True) == reference_checksum(True)
+	hex_file.set_overlap_policy("last")
+	assert hex_file.checksum(0xFF, True) == reference_checksum(False)
+
+
+@pytest.mark.skipif(not lazy_numpy.available, reason="NumPy is not installed")
+def test_change_policy_rebuilds_dense(make_hex_file):
+	hex_file = load_hex_file(make_hex_file(blocks))
+	hex_file.build_dense()
+	hex_file.set_overlap_policy("first")
+	assert hex_file.checksum(0xFF, True) == reference_checksum(True)
+
+
+def test_unknown_policy(make_hex_file):
+	hex_file = load_hex_file(make_hex_file(blocks))
+	with pytest.raises(Exception, match="unknown overlap policy"):
+		hex_file.set_overlap_policy("middle")
+	assert hex_file.overlap_policy == "last"
@@ -0,0 +1,120 @@
+"""
+Intel HEXの並列解析のテスト
+拡張アドレスレコード(02/04)がチャンク境界の前後にあっても、並列解析の結果が逐次解析と一致することを確認する
+"""
+import random
+import pathlib
+
+import pytest
+
+import hex_gen
+from pyHexTextFile.intel_hex import intel_hex
+from pyHexTextFile.hex_text_file import hex_record_error
+from pyHexTextFile import intel_hex_parallel
+
+
+def write_segments(path: pathlib.Path, seed: int):
+	"""
+	拡張アドレスレコード無しのデータ, 04/02レコードで切り替えたデータ, 開始アドレスレコード(03/05)を含むファイル
+	"""
+	rand = random.Random(seed)
+
+	def data_records(addr: int, size: int):
+		for pos in range(0, size, 16):
+			data = bytes(rand.randrange(256) for _ in range(min(16, size - pos)))
+			f.write(hex_gen.intel_hex_record(0, addr + pos, data))
+
+	with path.open("w") as f:
+		# 最初の拡張アドレスレコードより前のデータ
+		data_records(0x0100, 0x40)
+		f.write(hex_gen.intel_hex_record(4, 0, (0x0001).to_bytes(2, 'big')))
+		data_records(0x0000, 0x80)
+		f.write(hex_gen.intel_hex_record(3, 0, bytes([0x12, 0x34, 0x56, 0x78])))
+		f.write(hex_gen.intel_hex_record(2, 0, (0x3000).to_bytes(2, 'big')))
+		data_records(0x0020, 0x60)
+		f.write(hex_gen.intel_hex_record(4, 0, (0x0008).to_bytes(2, 'big')))
+		data_records(0xFF80, 0x60)
+		f.write(hex_gen.intel_hex_record(5, 0, bytes([0x00, 0x08, 0x00, 0x00])))
+		f.write(hex_gen.intel_hex_record(2, 0, (0x0100).to_bytes(2, 'big')))
+		data_records(0x0000, 0x30)
+		f.write(hex_gen.intel_hex_record(1, 0, b""))
+
+
+def line_bounds(path: pathlib.Path, lines_per_chunk: int):
+	"""
+	lines_per_chunk行ずつに分割した(開始位置, 終了位置)のリスト
+	"""
+	offsets = [0]
+	with path.open("rb") as f:
+		for line in f:
+			offsets.append(offsets[-1] + len(line))
+	bounds = offsets[::lines_per_chunk]
+	if bounds[-1] != offsets[-1]:
+		bounds.append(offsets[-1])
+	return list(zip(bounds[:-1], bounds[1:]))
+
+
+def parse_chunks(path: pathlib.Path, bounds, use_numpy: bool = None) -> intel_hex:
+	"""
+	ワーカープロセスを使用せずにチャンク毎に解析してマージする
+	"""
+	results = [intel_hex_parallel._parse_chunk((path, begin, end, use_numpy)) for begin, end in bounds]
+	return intel_hex_parallel.merge_chunks(path, bounds, results, use_numpy)
+
+
+def result_of(hex_file: intel_hex):
+	regs = {key: value for key, value in vars(hex_file).items() if key.startswith("reg_")}
+	records = [(record.addr, bytes(record.data)) for record in hex_file.image.records()]
+	return records, hex_file._address_begin, hex_file._address_end, regs, hex_file.checksum(0xFF, True)
+
+
+@pytest.mark.parametrize("lines_per_chunk", [1, 2, 3, 5, 8, 1000])
+def test_chunks_match_sequential(tmp_path, use_numpy, lines_per_chunk):
+	path = tmp_path / "image.hex"
+	write_segments(path, 1)
+	expected = result_of(intel_hex(path, use_numpy))
+	assert expected[3] == {"reg_CS": 0x1234, "reg_IP": 0x5678, "reg_EIP": 0x00080000}
+	assert result_of(parse_chunks(path, line_bounds(path, lines_per_chunk), use_numpy)) == expected
+
+
+def test_parse_parallel(tmp_path):
+	path = tmp_path / "image.hex"
+	write_segments(path, 2)
+	bounds = intel_hex_parallel.split_lines(path, 8, 64)
+	assert len(bounds) == 8
+	hex_file = intel_hex_parallel.parse_parallel(path, jobs=2, min_chunk_size=64)
+	assert result_of(hex_file) == result_of(intel_hex(path))
+
+
+def test_split_lines_at_line_boundary(tmp_path):
+	path = tmp_path / "image.hex"
+	write_segments(path, 3)
+	content = path.read_bytes()
+	bounds = intel_hex_parallel.split_lines(path, 7, 1)
+	assert bounds[0][0] == 0 and bounds[-1][1] == len(content)
+	for (_, end), (begin, _) in zip(bounds[:-1], bounds[1:]):
+		assert end == begin
+		assert content[begin - 1:begin] == b"\n"
+
+
+def test_small_file_not_split(tmp_path):
+	path = tmp_path / "image.hex"
+	write_segments(path, 4)
+	assert intel_hex_parallel.split_lines(path, 8, path.stat().st_size) == [(0, path.stat().st_size)]
+
+
+def test_error_lines_across_chunks(tmp_path):
+	"""
+	不正レコードの行番号はファイル全体の行番号で報告する
+	"""
+	path = tmp_path / "image.hex"
+	write_segments(path, 5)
+	lines = path.read_text().splitlines(keepends=True)
+	for index in (2, 11):
+		lines[index] = lines[index][:-3] + "00\n"
+	path.write_text("".join(lines))
+	with pytest.raises(hex_record_error) as sequential:
+		intel_hex(path)
+	with pytest.raises(hex_record_error) as chunked:
+		parse_chunks(path, line_bounds(path, 4))
+	assert chunked.value.lines == sequential.value.lines == [3, 12]
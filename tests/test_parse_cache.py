@@ -0,0 +1,114 @@
+"""
+解析結果のディスクキャッシュのテスト
+キャッシュから読み込んだ結果が解析結果と一致すること、ファイルの変更/壊れたキャッシュで解析し直すことを確認する
+"""
+import os
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.parse_cache import parse_cache
+from pyHexTextFile.intel_hex import intel_hex
+from pyHexTextFile.mot_s_record import mot_s_record
+
+
+blocks = [(0x0000, bytes(range(256)) * 3), (0x10000, bytes(100))]
+
+
+@pytest.fixture
+def parse_count(monkeypatch):
+	"""
+	テキストの解析回数(キャッシュから読み込んだときは解析しない)
+	"""
+	count = []
+	for cls in (intel_hex, mot_s_record):
+		original = cls._analyze
+
+		def counting(self, original=original):
+			count.append(type(self).__name__)
+			return original(self)
+		monkeypatch.setattr(cls, "_analyze", counting)
+	return count
+
+
+def image_of(hex_file):
+	return [(record.addr, bytes(record.data)) for record in hex_file.image.records()]
+
+
+def test_cache_hit(make_hex_file, tmp_path, parse_count):
+	path = make_hex_file(blocks)
+	cache = parse_cache(tmp_path / "cache")
+	first = load_hex_file(path, cache)
+	second = load_hex_file(path, cache)
+	assert len(parse_count) == 1
+	assert type(second) is type(first)
+	assert image_of(second) == image_of(first)
+	assert (second._address_begin, second._address_end) == (first._address_begin, first._address_end)
+	assert second.checksum() == first.checksum()
+	assert len(list((tmp_path / "cache").glob("*" + parse_cache.suffix))) == 1
+
+
+def test_cache_invalidated_by_change(make_hex_file, tmp_path, parse_count):
+	path = make_hex_file(blocks)
+	cache = parse_cache(tmp_path / "cache")
+	stat = os.stat(path)
+	first = load_hex_file(path, cache)
+	# 同じサイズ/更新日時でも内容が変われば解析し直す
+	path = make_hex_file([(0x0000, bytes(range(255, -1, -1)) * 3), (0x10000, bytes(100))])
+	os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+	second = load_hex_file(path, cache)
+	assert len(parse_count) == 2
+	assert image_of(second) != image_of(first)
+	assert image_of(second) == image_of(load_hex_file(path))
+
+
+@pytest.mark.parametrize("corrupt", [
+	# 途中で切れたファイル
+	lambda data: data[:len(data) // 2],
+	lambda data: data[:-1],
+	# ヘッダの破損
+	lambda data: b"XXXX" + data[4:],
+	lambda data: data[:12] + b"}" + data[13:],
+	lambda data: b"",
+])
+def test_corrupt_cache_is_rebuilt(make_hex_file, tmp_path, parse_count, corrupt):
+	path = make_hex_file(blocks)
+	cache = parse_cache(tmp_path / "cache")
+	expected = image_of(load_hex_file(path, cache))
+	cache_path, = (tmp_path / "cache").glob("*" + parse_cache.suffix)
+	cache_path.write_bytes(corrupt(cache_path.read_bytes()))
+	assert image_of(load_hex_file(path, cache)) == expected
+	assert len(parse_count) == 2
+	# 作り直したキャッシュから読み込める
+	assert image_of(load_hex_file(path, cache)) == expected
+	assert len(parse_count) == 2
+
+
+def test_cache_eviction(make_hex_file, tmp_path):
+	paths = []
+	for index in range(3):
+		path = make_hex_file([(0x0000, bytes([index]) * 1024)])
+		paths.append(path.rename(tmp_path / f"image{index}{path.suffix}"))
+	cache = parse_cache(tmp_path / "cache")
+	load_hex_file(paths[0], cache)
+	entry_size = cache._entries()[0].stat().st_size
+	# 2エントリ分に満たない上限
+	cache.max_size = entry_size * 3 // 2
+	for index, path in enumerate(paths[1:], 1):
+		# 残っているキャッシュを確実に古くしておく
+		os.utime(cache._entries()[0], ns=(index * 10 ** 9, index * 10 ** 9))
+		load_hex_file(path, cache)
+	# 上限を超えた古いキャッシュは削除する(最後に保存したものだけ残る)
+	entries = cache._entries()
+	assert len(entries) == 1
+	assert image_of(load_hex_file(paths[-1], cache)) == image_of(load_hex_file(paths[-1]))
+	cache.clear()
+	assert cache._entries() == []
+
+
+def test_cache_bypassed_for_lazy_and_uncoalesced(make_hex_file, tmp_path):
+	path = make_hex_file(blocks)
+	cache = parse_cache(tmp_path / "cache")
+	load_hex_file(path, cache, lazy=True)
+	load_hex_file(path, cache, coalesce=False)
+	assert cache._entries() == []
@@ -0,0 +1,72 @@
+"""
+不正レコードの検出のテスト
+1行ずつの解析とNumPyの一括デコードで、同じ不正レコードの行番号を報告することを確認する
+"""
+import pytest
+
+import hex_gen
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_text_file import hex_record_error
+
+
+def corrupt_checksum(line: str) -> str:
+	return line[:-2] + f"{(int(line[-2:], 16) + 1) & 0xFF:02X}"
+
+
+def corrupt_digit(line: str) -> str:
+	return line[:9] + "G" + line[10:]
+
+
+def corrupt_length(line: str) -> str:
+	return line[:-4] + line[-2:]
+
+
+def write_lines(path, lines):
+	path.write_text("\n".join(lines) + "\n")
+
+
+def make_lines(make_hex_file):
+	path = make_hex_file([(0x0000, bytes(range(256)))])
+	return path, path.read_text().splitlines()
+
+
+@pytest.mark.parametrize("corrupt", [corrupt_checksum, corrupt_digit, corrupt_length])
+def test_record_error_lines(make_hex_file, use_numpy, corrupt):
+	path, lines = make_lines(make_hex_file)
+	# 行番号は1始まり(空行も数える)
+	bad = [4, 8, 12]
+	for line_no in bad:
+		lines[line_no - 1] = corrupt(lines[line_no - 1])
+	lines.insert(5, "")
+	write_lines(path, lines)
+	with pytest.raises(hex_record_error) as e:
+		load_hex_file(path, use_numpy=use_numpy)
+	assert e.value.lines == [4, 9, 13]
+
+
+def test_record_error_lines_match(make_hex_file):
+	pytest.importorskip("numpy")
+	path, lines = make_lines(make_hex_file)
+	lines[2] = corrupt_checksum(lines[2])
+	lines[6] = corrupt_digit(lines[6])
+	lines[-3] = corrupt_length(lines[-3])
+	write_lines(path, lines)
+	errors = []
+	for use_numpy in (False, True):
+		with pytest.raises(hex_record_error) as e:
+			load_hex_file(path, use_numpy=use_numpy)
+		errors.append(e.value.lines)
+	assert errors[0] == errors[1] == [3, 7, len(lines) - 2]
+
+
+def test_record_error_after_end_record(tmp_path, use_numpy):
+	path = tmp_path / "image.hex"
+	lines = [hex_gen.intel_hex_record(0, addr, bytes(range(16))).strip() for addr in range(0, 64, 16)]
+	lines.append(hex_gen.intel_hex_record(1, 0, b"").strip())
+	lines[1] = corrupt_checksum(lines[1])
+	# Intel HEXのエンドレコード以降は検査しない
+	lines.append(corrupt_checksum(lines[2]))
+	write_lines(path, lines)
+	with pytest.raises(hex_record_error) as e:
+		load_hex_file(path, use_numpy=use_numpy)
+	assert e.value.lines == [2]
@@ -0,0 +1,121 @@
+"""
+チェックサム計算サービスのテスト
+キャッシュしたイメージのチェックサムが直接解析した結果と一致すること、
+同時の要求を1回の解析で処理すること、キャッシュの上限を守ることを確認する
+"""
+import os
+import asyncio
+
+import pytest
+
+from pyHexTextFile import parse_cache
+from pyHexTextFile.checksum_service import checksum_service
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_text_file import checksum_config
+
+
+configs = [checksum_config(), checksum_config(0x00, False, 0x0100, 0x0FFF, "crc32")]
+
+
+def run_service(coroutine, **kwargs):
+	"""
+	サービスを作成してcoroutine(service)を実行する
+	"""
+	async def run():
+		service = checksum_service(jobs=1, **kwargs)
+		try:
+			return await coroutine(service)
+		finally:
+			service.close()
+	return asyncio.run(run())
+
+
+def test_checksum_matches_direct(make_hex_file):
+	path = make_hex_file([(0x0000, bytes(range(256)) * 4), (0x2000, bytes(16))])
+
+	async def requests(service):
+		first = await service.request({"op": "checksum", "file": str(path), "configs": [config._asdict() for config in configs]})
+		second = await service.checksum(str(path), configs)
+		return first, second, await service.request({"op": "status"})
+	first, second, status = run_service(requests)
+	expected = load_hex_file(path).checksum_multi(configs)
+	assert first["checksums"] == second == expected
+	assert (status["hits"], status["misses"], status["entries"]) == (1, 1, 1)
+
+
+def test_concurrent_requests_parse_once(make_hex_file, tmp_path, monkeypatch):
+	path = make_hex_file([(0x0000, bytes(range(256)) * 64)])
+	log = tmp_path / "digest.log"
+	original = parse_cache.content_digest
+
+	def counting_digest(file_path):
+		# ワーカープロセスで呼ばれたときも記録する
+		with log.open("a") as f:
+			f.write(f"{os.getpid()}\n")
+		return original(file_path)
+	monkeypatch.setattr("pyHexTextFile.checksum_service.content_digest", counting_digest)
+	monkeypatch.setattr(parse_cache, "content_digest", counting_digest)
+
+	async def requests(service):
+		results = await asyncio.gather(*[service.checksum(str(path), configs) for _ in range(5)])
+		return results, service.hits, service.misses
+	results, hits, misses = run_service(requests)
+	assert all(result == results[0] for result in results)
+	# 解析中の要求に合流した要求はヒット
+	assert (hits, misses) == (4, 1)
+	# ファイル内容のハッシュは要求を受けたプロセスで1回だけ計算する
+	assert log.read_text().split() == [str(os.getpid())]
+
+
+def test_lru_eviction(make_hex_file, tmp_path):
+	paths = []
+	for index in range(3):
+		path = make_hex_file([(0x0000, bytes([index]) * 4096)])
+		paths.append(path.rename(tmp_path / f"image{index}{path.suffix}"))
+
+	async def requests(service):
+		for path in paths:
+			await service.load(str(path))
+		# 先頭のファイルは追い出されているため再度解析する
+		await service.load(str(paths[0]))
+		return service.misses, len(service._cache), service._cache_bytes
+	misses, entries, cache_bytes = run_service(requests, max_bytes=2 * 4096 + 1024)
+	assert misses == 4
+	assert entries == 2
+	assert cache_bytes <= 2 * 4096 + 1024
+
+
+def test_digest_table_is_bounded(make_hex_file, tmp_path):
+	paths = []
+	for index in range(5):
+		path = make_hex_file([(0x0000, bytes([index]) * 64)])
+		paths.append(path.rename(tmp_path / f"image{index}{path.suffix}"))
+
+	async def requests(service):
+		for path in paths:
+			await service.load(str(path))
+		return list(service._digests)
+	digests = run_service(requests, max_digests=3)
+	assert digests == [str(path) for path in paths[-3:]]
+
+
+def test_modified_file_is_reparsed(make_hex_file):
+	path = make_hex_file([(0x0000, bytes(256))])
+
+	async def requests(service):
+		first = await service.checksum(str(path), configs)
+		changed = make_hex_file([(0x0000, bytes([1]) * 256)])
+		os.utime(changed, ns=(10 ** 18, 10 ** 18))
+		second = await service.checksum(str(changed), configs)
+		return first, second, service.misses
+	first, second, misses = run_service(requests)
+	assert first != second
+	assert second == load_hex_file(path).checksum_multi(configs)
+	assert misses == 2
+
+
+def test_unknown_op():
+	async def requests(service):
+		return await service.request({"op": "unknown"})
+	with pytest.raises(Exception, match="unknown op"):
+		run_service(requests)
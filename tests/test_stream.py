@@ -0,0 +1,98 @@
+"""
+ストリーム/圧縮ファイルの解析とフォーマット判定のテスト
+展開しながら解析した結果と、元のファイルを解析した結果が一致することを確認する
+"""
+import io
+import os
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from pyHexTextFile.hex_loader import load_hex_file, load_hex_stream, hex_file_type
+from pyHexTextFile.intel_hex import intel_hex
+from pyHexTextFile.mot_s_record import mot_s_record
+from pyHexTextFile.hex_watch import hex_watch
+from pyHexTextFile.hex_text_file import checksum_config
+
+
+blocks = [(0x0000, bytes(range(256)) * 2), (0x8000, bytes(100))]
+compress_tbl = {
+	".gz": gzip.compress,
+	".bz2": bz2.compress,
+	".xz": lzma.compress,
+}
+
+
+def image_of(hex_file):
+	return [(record.addr, bytes(record.data)) for record in hex_file.image.records()]
+
+
+@pytest.mark.parametrize("suffix", list(compress_tbl.keys()))
+def test_load_compressed(make_hex_file, suffix):
+	path = make_hex_file(blocks)
+	expected = load_hex_file(path)
+	compressed = path.with_name(path.name + suffix)
+	compressed.write_bytes(compress_tbl[suffix](path.read_bytes()))
+	hex_file = load_hex_file(compressed)
+	assert type(hex_file) is type(expected)
+	assert image_of(hex_file) == image_of(expected)
+	assert hex_file.checksum() == expected.checksum()
+
+
+@pytest.mark.parametrize("compress", [None, gzip.compress])
+def test_load_stream(make_hex_file, compress):
+	path = make_hex_file(blocks)
+	expected = load_hex_file(path)
+	data = path.read_bytes()
+	if compress is not None:
+		data = compress(data)
+	# 先頭の空白は読み飛ばして判定する
+	hex_file = load_hex_stream(io.BytesIO(b"\n  " + data if compress is None else data))
+	assert type(hex_file) is type(expected)
+	assert image_of(hex_file) == image_of(expected)
+
+
+def test_hex_file_type_sniff(make_hex_file, tmp_path):
+	path = make_hex_file(blocks)
+	expected = intel_hex if path.suffix == ".hex" else mot_s_record
+	# 拡張子と内容が異なるときは内容で判定する
+	for name in ("image.hex", "image.mot", "image.txt"):
+		misnamed = tmp_path / ("copy_" + name)
+		misnamed.write_bytes(path.read_bytes())
+		assert hex_file_type(misnamed) is expected
+		assert image_of(load_hex_file(misnamed)) == image_of(load_hex_file(path))
+
+
+def test_hex_file_type_fallback(tmp_path):
+	# 判定できないときは拡張子で決定する
+	for name, expected in (("empty.hex", intel_hex), ("empty.mot", mot_s_record), ("empty.txt", intel_hex)):
+		path = tmp_path / name
+		path.write_bytes(b"")
+		assert hex_file_type(path) is expected
+	assert hex_file_type(tmp_path / "missing.mot") is mot_s_record
+
+
+def test_unknown_stream_format():
+	with pytest.raises(Exception, match="unknown hex file format"):
+		load_hex_stream(io.BytesIO(b"#not a hex file\n"))
+
+
+def test_watch_compressed(make_hex_file):
+	path = make_hex_file(blocks)
+	compressed = path.with_name(path.name + ".gz")
+	compressed.write_bytes(gzip.compress(path.read_bytes()))
+	configs = [checksum_config(), checksum_config(0x00, False, None, None, "crc32")]
+	watch = hex_watch(compressed, configs, use_numpy=False)
+	assert watch.checksums == load_hex_file(path).checksum_multi(configs)
+	# 1バイト変更したファイルを圧縮し直す(展開した内容の1行だけが異なる)
+	changed = [(0x0000, bytes(range(256)) * 2), (0x8000, bytes(50) + b"\x5A" + bytes(49))]
+	path = make_hex_file(changed)
+	compressed.write_bytes(gzip.compress(path.read_bytes()))
+	os.utime(compressed, ns=(10 ** 18, 10 ** 18))
+	assert watch.poll()
+	assert watch.error is None
+	assert watch.last_update == "incremental"
+	assert watch.changed_lines == 1
+	assert watch.checksums == load_hex_file(path).checksum_multi(configs)
@@ -0,0 +1,196 @@
+"""
+変更監視(watch)のテスト
+ファイルを編集して差分で更新したチェックサムを、編集後のファイルを全体解析した結果と比較する
+"""
+import os
+import random
+
+import pytest
+
+import hex_gen
+from pyHexTextFile.hex_watch import hex_watch
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_text_file import checksum_config
+
+
+configs = [
+	checksum_config(),
+	checksum_config(0x00, False, 0x0100, 0x1FFFF, "byte_sum"),
+	checksum_config(0xFF, True, None, None, "word16_be"),
+	checksum_config(0xFF, False, None, None, "crc32"),
+]
+
+
+def rewrite(path, lines, step: int):
+	"""
+	編集した行を書き込み、更新日時を変更して変更を検出させる
+	"""
+	path.write_text("\n".join(lines) + "\n")
+	stamp = (10 ** 18) + step * (10 ** 9)
+	os.utime(path, ns=(stamp, stamp))
+
+
+def assert_same_as_reparse(watch: hex_watch):
+	reference = load_hex_file(watch.file_path, use_numpy=False)
+	assert watch.checksums == reference.checksum_multi(configs)
+	assert (watch.hex_file._address_begin, watch.hex_file._address_end) == (reference._address_begin, reference._address_end)
+
+
+def data_line_indexes(lines):
+	return [index for index, line in enumerate(lines) if (line.startswith(":") and line[7:9] == "00") or line[:2] in ("S1", "S2", "S3")]
+
+
+def replace_data(line: str, rand: random.Random) -> str:
+	"""
+	データレコードのアドレス/データ長を変えずにデータを変更する
+	"""
+	if line.startswith(":"):
+		addr = int(line[3:7], 16)
+		length = int(line[1:3], 16)
+		return hex_gen.intel_hex_record(0, addr, bytes(rand.randrange(256) for _ in range(length))).strip()
+	record_type = int(line[1])
+	addr_len = hex_gen.s_record_addr_len[record_type]
+	addr = int(line[4:4 + addr_len * 2], 16)
+	length = int(line[2:4], 16) - addr_len - 1
+	return hex_gen.s_record(record_type, addr, addr_len, bytes(rand.randrange(256) for _ in range(length))).strip()
+
+
+def test_watch_incremental_edit(make_hex_file):
+	rand = random.Random(0)
+	path = make_hex_file([(0x0000, bytes(0x800)), (0x10000, bytes(range(256)) * 8)])
+	watch = hex_watch(path, configs, use_numpy=False)
+	assert watch.last_update == "full"
+	assert_same_as_reparse(watch)
+	lines = path.read_text().splitlines()
+	for step in range(1, 6):
+		# データレコードのデータだけを変更したときは差分で更新する
+		for index in rand.sample(data_line_indexes(lines), 2):
+			lines[index] = replace_data(lines[index], rand)
+		rewrite(path, lines, step)
+		assert watch.poll()
+		assert watch.last_update == "incremental"
+		assert watch.changed_lines >= 1
+		assert_same_as_reparse(watch)
+	# 変更が無ければ更新しない
+	assert not watch.poll()
+
+
+def test_watch_delete_and_insert(make_hex_file):
+	path = make_hex_file([(0x0000, bytes(range(256)) * 2), (0x1000, bytes(64))])
+	watch = hex_watch(path, configs, use_numpy=False)
+	lines = path.read_text().splitlines()
+	indexes = data_line_indexes(lines)
+	# 先頭のデータレコードを削除(アドレス範囲が変わる)
+	removed = lines.pop(indexes[0])
+	rewrite(path, lines, 1)
+	assert watch.poll()
+	assert_same_as_reparse(watch)
+	# 元に戻す
+	lines.insert(indexes[0], removed)
+	rewrite(path, lines, 2)
+	assert watch.poll()
+	assert_same_as_reparse(watch)
+
+
+def test_watch_extended_address_change(tmp_path):
+	path = tmp_path / "image.hex"
+	lines = [hex_gen.intel_hex_record(4, 0, (1).to_bytes(2, "big")).strip()]
+	lines += [hex_gen.intel_hex_record(0, addr, bytes(range(16))).strip() for addr in range(0, 0x100, 16)]
+	lines.append(hex_gen.intel_hex_record(1, 0, b"").strip())
+	rewrite(path, lines, 0)
+	watch = hex_watch(path, configs, use_numpy=False)
+	# 拡張リニアアドレスレコードの変更はファイル全体を再解析する
+	lines[0] = hex_gen.intel_hex_record(4, 0, (2).to_bytes(2, "big")).strip()
+	rewrite(path, lines, 1)
+	assert watch.poll()
+	assert watch.last_update == "full"
+	assert watch.hex_file._address_begin == 0x20000
+	assert_same_as_reparse(watch)
+
+
+@pytest.mark.parametrize("use_numpy", [None, False, True])
+def test_watch_bin_file(tmp_path, use_numpy):
+	path = tmp_path / "image.bin"
+	path.write_bytes(bytes(range(256)) * 4)
+	watch = hex_watch(path, configs, use_numpy=use_numpy)
+	assert_same_as_reparse(watch)
+	path.write_bytes(bytes(range(255, -1, -1)) * 2)
+	os.utime(path, ns=(10 ** 18, 10 ** 18))
+	assert watch.poll()
+	assert watch.error is None
+	assert watch.last_update == "full"
+	assert_same_as_reparse(watch)
+
+
+def test_watch_keeps_result_on_invalid_edit(make_hex_file):
+	"""
+	解析できない変更は前回の結果を保持してerrorに格納し、次の変更で更新する
+	"""
+	rand = random.Random(1)
+	path = make_hex_file([(0x0000, bytes(range(256)) * 2)])
+	watch = hex_watch(path, configs, use_numpy=False)
+	checksums = watch.checksums
+	lines = path.read_text().splitlines()
+	index = data_line_indexes(lines)[3]
+	original = lines[index]
+	# レコードのチェックサム不正
+	lines[index] = original[:-2] + ("00" if original[-2:] != "00" else "01")
+	rewrite(path, lines, 1)
+	assert not watch.poll()
+	assert watch.error is not None
+	assert watch.checksums == checksums
+	# 同じ状態のままでは再解析しない
+	assert not watch.poll()
+	lines[index] = replace_data(original, rand)
+	rewrite(path, lines, 2)
+	assert watch.poll()
+	assert watch.error is None
+	assert_same_as_reparse(watch)
+
+
+def test_watch_overlap_edit(make_hex_file):
+	"""
+	変更でレコードが重なったときは差し替え後のイメージで全計算する
+	"""
+	path = make_hex_file([(0x0000, bytes(range(256))), (0x0200, bytes([0x5A]) * 0x40)])
+	watch = hex_watch(path, configs, use_numpy=False)
+	lines = path.read_text().splitlines()
+	index = data_line_indexes(lines)[-1]
+	# 最後のデータレコードのアドレスを先頭のレコードと重ねる
+	if lines[index].startswith(":"):
+		lines[index] = hex_gen.intel_hex_record(0, 0x0008, bytes([0xA5]) * 16).strip()
+	else:
+		lines[index] = hex_gen.s_record(3, 0x0008, 4, bytes([0xA5]) * 16).strip()
+	rewrite(path, lines, 1)
+	assert watch.poll()
+	assert_same_as_reparse(watch)
+	assert watch.hex_file.overlaps
+
+
+def test_watch_touch_without_change(make_hex_file):
+	path = make_hex_file([(0x0000, bytes(range(256)))])
+	watch = hex_watch(path, configs, use_numpy=False)
+	checksums = watch.checksums
+	rewrite(path, path.read_text().splitlines(), 1)
+	watch.poll()
+	assert watch.error is None
+	assert watch.checksums == checksums
+
+
+def test_watch_many_edits_compact(make_hex_file):
+	"""
+	差し替えを繰り返してpayloadを詰め直しても結果は変わらない
+	"""
+	rand = random.Random(2)
+	path = make_hex_file([(0x0000, bytes(0x100))])
+	watch = hex_watch(path, configs, use_numpy=False)
+	lines = path.read_text().splitlines()
+	indexes = data_line_indexes(lines)
+	for step in range(1, 40):
+		for index in indexes:
+			lines[index] = replace_data(lines[index], rand)
+		rewrite(path, lines, step)
+		assert watch.poll()
+		assert watch.last_update == "incremental"
+	assert len(watch.hex_file.image.payload) <= 2 * sum(watch.hex_file.image.length)
+	assert_same_as_reparse(watch)
@@ -0,0 +1,113 @@
+"""
+Intel HEX / Sレコードの出力とフォーマット変換のテスト
+出力したファイルを解析し直したイメージが元のイメージと一致することを確認する
+"""
+import sys
+import random
+import pathlib
+import subprocess
+import tracemalloc
+
+import pytest
+
+import hex_gen
+from pyHexTextFile.hex_loader import load_hex_file
+from pyHexTextFile.hex_writer import export_intel_hex, export_s_record, convert, export_tbl
+from pyHexTextFile import lazy_numpy
+
+
+def make_blocks():
+	rand = random.Random(2)
+	# 64KB境界をまたぐデータ、レコード長の端数、離れたアドレス
+	layout = [(0x0100, 1000), (0xFFF0, 0x40), (0x12345, 7), (0x1234560, 300)]
+	return [(begin, bytes(rand.randrange(256) for _ in range(size))) for begin, size in layout]
+
+
+def image_bytes(hex_file, addr_begin=None, addr_end=None):
+	if addr_begin is None:
+		addr_begin, addr_end = hex_file._address_begin, hex_file._address_end
+	return [(addr, bytes(data)) for addr, data in hex_file._segments(addr_begin, addr_end)]
+
+
+@pytest.mark.parametrize("export, suffix", [(export_intel_hex, ".hex"), (export_s_record, ".mot")])
+@pytest.mark.parametrize("record_len", [1, 16, 32])
+def test_export_round_trip(make_hex_file, tmp_path, use_numpy, export, suffix, record_len):
+	source = load_hex_file(make_hex_file(make_blocks()))
+	path = tmp_path / ("out" + suffix)
+	size = export(source, path, record_len=record_len, use_numpy=use_numpy, block_size=256)
+	assert size == sum(len(data) for _, data in make_blocks())
+	assert image_bytes(load_hex_file(path)) == image_bytes(source)
+
+
+@pytest.mark.parametrize("export, suffix", [(export_intel_hex, ".hex"), (export_s_record, ".mot")])
+def test_export_numpy_matches_per_record(make_hex_file, tmp_path, export, suffix):
+	pytest.importorskip("numpy")
+	source = load_hex_file(make_hex_file(make_blocks()))
+	outputs = []
+	for use_numpy in (False, True):
+		path = tmp_path / (f"out_{use_numpy}" + suffix)
+		export(source, path, record_len=32, use_numpy=use_numpy)
+		outputs.append(path.read_bytes())
+	assert outputs[0] == outputs[1]
+
+
+def test_s_record_type(make_hex_file, tmp_path):
+	source = load_hex_file(make_hex_file([(0x0000, bytes(16)), (0xFFF0, bytes(16))]))
+	path = tmp_path / "out.mot"
+	export_s_record(source, path)
+	assert path.read_text().splitlines()[1].startswith("S1")
+	# S1で表現できないアドレスは例外とし、ファイルを出力しない
+	with pytest.raises(Exception, match="address out of range"):
+		export_s_record(load_hex_file(make_hex_file(make_blocks())), tmp_path / "range.mot", record_type=1)
+	assert not (tmp_path / "range.mot").exists()
+
+
+@pytest.mark.parametrize("suffix", list(export_tbl.keys()))
+@pytest.mark.parametrize("kwargs", [{}, {"addr_begin": 0x0200, "addr_end": 0x10010}])
+def test_convert_matches_export(make_hex_file, tmp_path, suffix, kwargs):
+	src = make_hex_file(make_blocks()[:3])
+	source = load_hex_file(src)
+	expected = tmp_path / ("expected" + suffix)
+	export_tbl[suffix](source, expected, **kwargs)
+	converted = tmp_path / ("converted" + suffix)
+	assert convert(src, converted, **kwargs) == export_tbl[suffix](source, tmp_path / ("again" + suffix), **kwargs)
+	assert converted.read_bytes() == expected.read_bytes()
+
+
+def test_convert_keeps_record_order(tmp_path):
+	# 重なるレコードは入力ファイル内の順に出力する(後のレコードが優先される)
+	src = tmp_path / "overlap.hex"
+	src.write_text(hex_gen.intel_hex_record(0, 0x10, bytes([1]) * 16) + hex_gen.intel_hex_record(0, 0x18, bytes([2]) * 16) + hex_gen.intel_hex_record(1, 0, b""))
+	expected = bytes([1]) * 8 + bytes([2]) * 16
+	for suffix in (".hex", ".mot", ".bin"):
+		dst = tmp_path / ("out" + suffix)
+		convert(src, dst)
+		converted = load_hex_file(dst)
+		if suffix == ".bin":
+			assert dst.read_bytes() == expected
+		else:
+			assert b"".join(data for _, data in image_bytes(converted)) == expected
+
+
+def test_convert_bounded_memory(make_hex_file, tmp_path):
+	if not lazy_numpy.available:
+		pytest.skip("NumPy is not installed")
+	data_size = 32 * 1024 * 1024
+	src = make_hex_file([(0, random.Random(0).getrandbits(data_size * 8).to_bytes(data_size, "little"))], record_len=32)
+	# NumPyの読み込みは計測に含めない
+	lazy_numpy.load()
+	tracemalloc.start()
+	try:
+		convert(src, tmp_path / "large.mot", record_type=3, use_numpy=True)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	# 入力全体のイメージを保持しない(チャンク単位の作業領域だけを使用する)
+	assert peak < data_size
+
+
+def test_writer_does_not_import_numpy():
+	code = "import sys; import pyHexTextFile.hex_writer; print('numpy' in sys.modules)"
+	root_dir = pathlib.Path(__file__).resolve().parent.parent
+	result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True, cwd=str(root_dir))
+	assert result.stdout.strip() == b"False"